@@ -0,0 +1,50 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+from array import array
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from mqtt.packet import Packet, ack_frame, decode_acks, encode_acks
+
+
+def measure(f, count, seconds=0.5):
+    # acks per second
+    calls = 0
+    started = time.time()
+    deadline = started + seconds
+    while True:
+        f()
+        calls += 1
+        now = time.time()
+        if now >= deadline:
+            return calls * count / (now - started)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    ids = array('H', (i % 0xFFFF + 1 for i in range(count)))
+    data = bytes(encode_acks('puback', ids))
+    print('python %d.%d, %d PUBACKs per batch' % (
+        sys.version_info[:2] + (count,)))
+
+    cases = (
+        ('encode Packet', lambda: b''.join(
+            Packet('puback', message_id=i).encode() for i in ids)),
+        ('encode ack_frame', lambda: b''.join(
+            ack_frame('puback', i) for i in ids)),
+        ('encode_acks', lambda: encode_acks('puback', ids)),
+        ('decode Packet', lambda: [
+            Packet.fromData(data[i:i + 4]).messageId
+            for i in range(0, len(data), 4)]),
+        ('decode_acks', lambda: decode_acks(data, 'puback')),
+    )
+    for name, f in cases:
+        print('%-18s %14.0f acks/s' % (name, measure(f, count)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import struct
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from mqtt.broker import Broker
+from mqtt.client import Client
+
+_STAMP = struct.Struct('!d')
+
+
+def _serve(port, ready):
+    async def main():
+        broker = Broker(port=port)
+        await broker.start()
+        ready.set()
+        await asyncio.Event().wait()
+    asyncio.run(main())
+
+
+async def _subscribe(client, expected, latencies):
+    while len(latencies) < expected:
+        try:
+            packet = await asyncio.wait_for(client.messages.get(), 5)
+        except asyncio.TimeoutError:
+            # QoS 0 messages dropped for a congested subscriber
+            break
+        sent, = _STAMP.unpack_from(packet.payload)
+        latencies.append(time.monotonic() - sent)
+
+
+async def _publish(client, topic, count, qos, size, window):
+    padding = b'x' * max(size - _STAMP.size, 0)
+    for start in range(0, count, window):
+        await asyncio.gather(*[
+            client.publish(topic, qos=qos,
+                           payload=_STAMP.pack(time.monotonic()) + padding)
+            for i in range(min(window, count - start))])
+
+
+async def load(port, publishers, subscribers, count, qos, size, window,
+               prefix='bench', settle=0):
+    subs = []
+    for i in range(subscribers):
+        client = Client(keep_alive_time=0)
+        await client.connect('127.0.0.1', port)
+        await client.subscribe([('%s/%d' % (prefix, j), qos)
+                                for j in range(publishers)])
+        subs.append(client)
+    pubs = []
+    for i in range(publishers):
+        client = Client(keep_alive_time=0)
+        await client.connect('127.0.0.1', port)
+        pubs.append(client)
+    # time for subscriptions to reach the other workers of a cluster
+    await asyncio.sleep(settle)
+
+    expected = publishers * count
+    latencies = [[] for client in subs]
+    started = time.monotonic()
+    await asyncio.gather(*(
+        [_subscribe(c, expected, l) for c, l in zip(subs, latencies)] +
+        [_publish(c, '%s/%d' % (prefix, i), count, qos, size, window)
+         for i, c in enumerate(pubs)]))
+    elapsed = time.monotonic() - started
+
+    for client in subs + pubs:
+        await client.disconnect()
+    return elapsed, sorted(l for ls in latencies for l in ls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='broker load generator')
+    parser.add_argument('--port', type=int, default=18830)
+    parser.add_argument('--publishers', type=int, default=4)
+    parser.add_argument('--subscribers', type=int, default=4)
+    parser.add_argument('--count', type=int, default=5000)
+    parser.add_argument('--qos', type=int, default=0)
+    parser.add_argument('--size', type=int, default=64)
+    parser.add_argument('--window', type=int, default=100)
+    args = parser.parse_args()
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=_serve, args=(args.port, ready))
+    server.daemon = True
+    server.start()
+    ready.wait()
+    try:
+        elapsed, latencies = asyncio.run(load(
+            args.port, args.publishers, args.subscribers, args.count,
+            args.qos, args.size, args.window))
+    finally:
+        server.terminate()
+
+    delivered = len(latencies)
+    print('publishers=%d subscribers=%d qos=%d size=%dB' % (
+        args.publishers, args.subscribers, args.qos, args.size))
+    print('delivered %d messages in %.2fs: %.0f msg/s' % (
+        delivered, elapsed, delivered / elapsed))
+    print('latency p50=%.2fms p99=%.2fms max=%.2fms' % (
+        latencies[delivered // 2] * 1e3,
+        latencies[int(delivered * 0.99)] * 1e3, latencies[-1] * 1e3))
+
+
+if __name__ == '__main__':
+    main()
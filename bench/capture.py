@@ -0,0 +1,51 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from mqtt.capture import replay
+from mqtt.packet import Packet
+
+
+def write_capture(path, size):
+    frames = [
+        Packet('publish', qos=1, topic='site/%d/dev/%d' % (i % 10, i),
+               message='x' * (16 << (i % 6)), message_id=i % 65535 + 1)
+        .encode() for i in range(1000)]
+    frames.extend(Packet('puback', message_id=i + 1).encode()
+                  for i in range(1000))
+    block = b''.join(frames)
+    with open(path, 'wb') as f:
+        for i in range(max(1, size // len(block))):
+            f.write(block)
+    return os.path.getsize(path)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 256 << 20
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        size = write_capture(path, size)
+        print('python %d.%d, %d MB capture, %d cpus' % (
+            sys.version_info[:2] + (size >> 20, os.cpu_count())))
+        print('%-10s %14s %10s' % ('processes', 'records/s', 'MB/s'))
+        processes = 1
+        while processes <= os.cpu_count():
+            started = time.time()
+            count = sum(1 for record in replay(path, processes))
+            elapsed = time.time() - started
+            print('%-10d %14.0f %10.1f' % (
+                processes, count / elapsed, size / elapsed / (1 << 20)))
+            processes *= 2
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
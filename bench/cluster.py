@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Messages per second through a Cluster of 1, 2, ... workers, on one box.
+# Load comes from as many client processes; each has its own publishers
+# and subscribers, whose connections the kernel spreads over the workers,
+# so most messages cross from one worker to another.
+#
+#   python bench/cluster.py --workers 1 2 4 8
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from broker import load
+from mqtt.cluster import Cluster
+
+
+def _load(index, port, args, results):
+    elapsed, latencies = asyncio.run(load(
+        port, args.publishers, args.subscribers, args.count, args.qos,
+        args.size, args.window, prefix='bench/%d' % index, settle=0.5))
+    results.put((elapsed, len(latencies)))
+
+
+def measure(workers, args):
+    cluster = Cluster(workers=workers, port=0)
+    port = cluster.start()
+    try:
+        processes = args.processes or workers
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(
+            target=_load, args=(i, port, args, results))
+            for i in range(processes)]
+        for client in clients:
+            client.start()
+        runs = [results.get() for client in clients]
+        for client in clients:
+            client.join()
+    finally:
+        cluster.stop()
+    delivered = sum(count for elapsed, count in runs)
+    expected = processes * args.publishers * args.subscribers * args.count
+    return delivered / max(elapsed for elapsed, count in runs), \
+        delivered, expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description='cluster scaling')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, os.cpu_count() or 1])
+    parser.add_argument('--processes', type=int,
+                        help='load processes, default one per worker')
+    parser.add_argument('--publishers', type=int, default=4)
+    parser.add_argument('--subscribers', type=int, default=4)
+    parser.add_argument('--count', type=int, default=5000)
+    parser.add_argument('--qos', type=int, default=0)
+    parser.add_argument('--size', type=int, default=64)
+    parser.add_argument('--window', type=int, default=100)
+    args = parser.parse_args()
+
+    print('python %d.%d, %d cores' % (
+        sys.version_info[:2] + (os.cpu_count(),)))
+    print('%8s %12s %10s %12s' % ('workers', 'msg/s', 'speedup',
+                                  'delivered'))
+    base = None
+    for workers in args.workers:
+        rate, delivered, expected = measure(workers, args)
+        base = base or rate
+        print('%8d %12.0f %9.2fx %5d/%d' % (
+            workers, rate, rate / base, delivered, expected))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Encode/decode throughput and allocations of every packet type.
+#
+#   python bench/codec.py --json current.json
+#   python bench/codec.py --baseline current.json
+#
+# With --baseline, cases more than --threshold slower, allocating more
+# blocks per packet, or peaking more than --threshold higher in traced
+# memory than the baseline are reported and the exit status is 1.
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from mqtt import constant
+from mqtt.packet import Packet
+
+PAYLOAD_SIZES = (0, 16, 1 << 10, 1 << 16, 1 << 20)
+# remaining lengths where the varint gains a byte
+REMAIN_LENGTH_BOUNDARIES = (127, 128, 16383, 16384, 2097151, 2097152)
+TOPIC = 'site/1/dev/2/temp'
+
+
+def type_samples():
+    samples = {
+        'connect': Packet(
+            'connect', client_id='bench_client', keep_alive_time=60,
+            will_topic='status/bench', will_message='offline',
+            username='admin', password='secret'),
+        'connack': Packet('connack', return_code=0),
+        'publish': Packet('publish', qos=1, topic=TOPIC, message='x' * 16,
+                          message_id=10),
+        'subscribe': Packet('subscribe', qos=1, message_id=10, topics=[
+            ('site/%d/#' % i, 1) for i in range(10)]),
+        'suback': Packet('suback', message_id=10, granted_qos=[1] * 10),
+        'unsubscribe': Packet('unsubscribe', qos=1, message_id=10, topics=[
+            'site/%d/#' % i for i in range(10)]),
+    }
+    for mtype in ('puback', 'pubrec', 'pubcomp', 'unsuback'):
+        samples[mtype] = Packet(mtype, message_id=10)
+    samples['pubrel'] = Packet('pubrel', qos=1, message_id=10)
+    for mtype in ('pingreq', 'pingresp', 'disconnect'):
+        samples[mtype] = Packet(mtype)
+    return [(mtype, samples[mtype])
+            for code, mtype in sorted(constant.MSG_T.items())]
+
+
+def publish(payload_size):
+    return Packet('publish', qos=1, topic=TOPIC,
+                  payload=b'x' * payload_size, message_id=10)
+
+
+def samples():
+    for mtype, packet in type_samples():
+        yield mtype, packet
+    for size in PAYLOAD_SIZES:
+        yield 'publish %dB' % size, publish(size)
+    # topic string, message id
+    overhead = 2 + len(TOPIC) + 2
+    for remain_length in REMAIN_LENGTH_BOUNDARIES:
+        yield ('publish rl=%d' % remain_length,
+               publish(remain_length - overhead))
+
+
+def cases():
+    for name, packet in samples():
+        data = packet.encode()
+        yield 'encode/' + name, packet.encode
+        yield 'decode/' + name, lambda data=data: Packet.fromData(data)
+
+
+def timing(f, seconds):
+    # runs f in batches until seconds have passed; returns ops per second
+    batch = 1
+    count = 0
+    started = time.perf_counter()
+    while True:
+        for i in range(batch):
+            f()
+        count += batch
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return count / elapsed
+        if elapsed < seconds / 10:
+            batch *= 2
+
+
+def allocations(f, count=100):
+    # blocks and bytes still allocated per call while the results are kept
+    results = [None] * count
+    f()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for i in range(count):
+            results[i] = f()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = size = 0
+    for stat in after.compare_to(before, 'filename'):
+        if stat.traceback[0].filename != tracemalloc.__file__:
+            blocks += stat.count_diff
+            size += stat.size_diff
+    return blocks / count, size / count
+
+
+def peak(f, count=100):
+    # highest traced memory during a call, so that temporaries freed before
+    # it returns are counted too; restarting tracemalloc resets the peak
+    total = 0
+    f()
+    for i in range(count):
+        tracemalloc.start()
+        try:
+            result = f()
+            total += tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        del result
+    return total / count
+
+
+def run(seconds, pattern=None):
+    results = {}
+    for name, f in cases():
+        if pattern and pattern not in name:
+            continue
+        ops = timing(f, seconds)
+        count = 10 if 'rl=2097' in name or '1048576B' in name else 100
+        blocks, size = allocations(f, count)
+        peak_size = peak(f, count)
+        results[name] = {
+            'ops_per_sec': ops,
+            'ns_per_op': 1e9 / ops,
+            'blocks_per_op': blocks,
+            'bytes_per_op': size,
+            'peak_bytes_per_op': peak_size,
+        }
+        print('%-28s %12.0f %12.0f %8.1f %12.0f %12.0f' % (
+            name, ops, 1e9 / ops, blocks, size, peak_size))
+        sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        slower = base['ops_per_sec'] / result['ops_per_sec'] - 1
+        if slower > threshold:
+            regressions.append('%-28s %+.1f%% ops/s' % (name, -100 * slower))
+        # allow for allocator noise below half a block
+        if result['blocks_per_op'] > base['blocks_per_op'] + 0.5:
+            regressions.append('%-28s %.1f -> %.1f blocks/op' % (
+                name, base['blocks_per_op'], result['blocks_per_op']))
+        # baselines from before peaks were recorded have none
+        base_peak = base.get('peak_bytes_per_op')
+        if base_peak is not None and result['peak_bytes_per_op'] > \
+                base_peak * (1 + threshold) + 64:
+            regressions.append('%-28s %.0f -> %.0f peak bytes/op' % (
+                name, base_peak, result['peak_bytes_per_op']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=0.2,
+                        help='timing per case')
+    parser.add_argument('--filter', help='only cases containing this')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare with a --json file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown reported as a regression')
+    args = parser.parse_args()
+
+    print('python %d.%d' % sys.version_info[:2])
+    print('%-28s %12s %12s %8s %12s %12s' % (
+        'case', 'ops/s', 'ns/op', 'blocks', 'bytes', 'peak'))
+    results = run(args.seconds, args.filter)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': '%d.%d' % sys.version_info[:2],
+                       'results': results}, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        print('')
+        if regressions:
+            print('%d regressions against %s:' % (
+                len(regressions), args.baseline))
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print('no regressions against %s' % args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from mqtt.packet import Packet
+
+
+def samples():
+    return [
+        ('connect', Packet(
+            'connect', client_id='bench_client', keep_alive_time=60,
+            will_topic='status/bench', will_message='offline',
+            username='admin', password='secret')),
+        ('publish 16B', Packet(
+            'publish', qos=1, topic='site/1/dev/2/temp', message='x' * 16,
+            message_id=10)),
+        ('publish 4KB', Packet(
+            'publish', qos=1, topic='site/1/dev/2/temp', message='x' * 4096,
+            message_id=10)),
+        ('subscribe', Packet(
+            'subscribe', qos=1, message_id=10,
+            topics=[('site/%d/#' % i, 1) for i in range(10)])),
+        ('puback', Packet('puback', message_id=10)),
+        ('pingreq', Packet('pingreq')),
+    ]
+
+
+def measure(data, lazy, seconds=0.5):
+    count = 0
+    started = time.time()
+    deadline = started + seconds
+    while True:
+        for i in range(1000):
+            Packet.fromData(data, lazy)
+        count += 1000
+        now = time.time()
+        if now >= deadline:
+            return count / (now - started)
+
+
+def main():
+    print('python %d.%d' % sys.version_info[:2])
+    print('%-12s %14s %14s' % ('packet', 'decode pkt/s', 'lazy pkt/s'))
+    for name, packet in samples():
+        data = packet.encode()
+        print('%-12s %14.0f %14.0f' % (
+            name, measure(data, False), measure(data, True)))
+
+
+if __name__ == '__main__':
+    main()
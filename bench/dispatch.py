@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from mqtt import constant
+from mqtt.packet import Packet
+
+
+class GetattrPacket(Packet):
+    # The string-building getattr dispatch that the tables replaced.
+
+    def __init__(self, mtype=None, dup=False, qos=0, retain=False,
+                 **kwargs):
+        self.mtype = mtype
+        self.mcode = None
+        self.dup = dup
+        self.qos = qos
+        self.retain = retain
+        if len(kwargs):
+            f = getattr(self, '_init%sPacket' % self.mtype.capitalize())
+            f(**kwargs)
+
+    def _parse(self, data):
+        f = getattr(self, '_parse%sData' % self.mtype.capitalize(), None)
+        if f:
+            f(data)
+
+    def _encodeFirstByte(self):
+        self.mcode = constant.MSG_CODES[self.mtype]
+        return Packet._encodeFirstByte(self)
+
+    def _encodeData(self):
+        f = getattr(self, '_encode%sData' % self.mtype.capitalize(), None)
+        if f:
+            return f()
+        else:
+            return bytearray()
+
+
+def run(stmt, number):
+    best = min(timeit.repeat(stmt, number=number, repeat=7))
+    return best / number * 1e9
+
+
+def main(number=200000):
+    cases = [
+        ('puback', {'message_id': 10}),
+        ('pingreq', {}),
+    ]
+    print('%-10s %-8s %12s %12s' % ('packet', 'op', 'getattr ns', 'table ns'))
+    for mtype, kwargs in cases:
+        data = Packet(mtype, **kwargs).encode()
+        for op in ('init', 'encode', 'decode'):
+            results = []
+            for cls in (GetattrPacket, Packet):
+                if op == 'init':
+                    stmt = lambda: cls(mtype, **kwargs)
+                elif op == 'encode':
+                    p = cls(mtype, **kwargs)
+                    stmt = p.encode
+                else:
+                    p = cls(mtype)
+                    stmt = lambda: p._parse(memoryview(data)[2:])
+                results.append(run(stmt, number))
+            print('%-10s %-8s %12.0f %12.0f' % ((mtype, op) + tuple(results)))
+
+
+if __name__ == '__main__':
+    main()
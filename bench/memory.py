@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import resource
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from mqtt.packet import Packet
+
+
+class DictPacket(object):
+    # Same attributes as the packet classes, stored in a per-instance dict.
+
+    def __init__(self, mtype, **kwargs):
+        self.mtype = mtype
+        self.dup = False
+        self.qos = 1
+        self.retain = False
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+
+def _rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _retain(factory, count, result):
+    topic = 'devices/0001/telemetry'
+    payload = b'x' * 64
+    before = _rss()
+    packets = [factory(i % 0xFFFF + 1, topic, payload) for i in range(count)]
+    result.put((_rss() - before) / count)
+    del packets
+
+
+def measure(factory, count):
+    result = multiprocessing.Queue()
+    proc = multiprocessing.Process(
+        target=_retain, args=(factory, count, result))
+    proc.start()
+    per_packet = result.get()
+    proc.join()
+    return per_packet
+
+
+def slots_publish(mid, topic, payload):
+    return Packet('publish', qos=1, topic=topic, payload=payload,
+                  message_id=mid)
+
+
+def slots_pubrel(mid, topic, payload):
+    return Packet('pubrel', qos=1, message_id=mid)
+
+
+def dict_publish(mid, topic, payload):
+    return DictPacket('publish', topic=topic, payload=payload, messageId=mid)
+
+
+def dict_pubrel(mid, topic, payload):
+    return DictPacket('pubrel', messageId=mid)
+
+
+def main(count=1000000):
+    print('retaining %d packets per case' % count)
+    print('%-8s %14s %14s' % ('packet', 'dict B/pkt', 'slots B/pkt'))
+    for name, dict_factory, slots_factory in (
+            ('publish', dict_publish, slots_publish),
+            ('pubrel', dict_pubrel, slots_pubrel)):
+        print('%-8s %14.1f %14.1f' % (
+            name, measure(dict_factory, count), measure(slots_factory, count)))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from mqtt.retain import RetainedStore
+
+
+def measure(f, seconds=0.5):
+    count = 0
+    started = time.time()
+    deadline = started + seconds
+    while True:
+        for i in range(100):
+            f()
+        count += 100
+        now = time.time()
+        if now >= deadline:
+            return count / (now - started)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    sites = 100
+    devices = count // sites
+    print('python %d.%d, %d retained topics' % (
+        sys.version_info[:2] + (count,)))
+
+    store = RetainedStore()
+    started = time.time()
+    for site in range(sites):
+        for device in range(devices):
+            store.retain('site/%d/dev/%d/status' % (site, device),
+                         b'online', 1)
+    elapsed = time.time() - started
+
+    # memory per topic, traced on a smaller store of the same shape
+    tracemalloc.start()
+    sample = RetainedStore()
+    for site in range(sites):
+        for device in range(100):
+            sample.retain('site/%d/dev/%d/status' % (site, device),
+                          b'online', 1)
+    size = tracemalloc.get_traced_memory()[0] / len(sample)
+    tracemalloc.stop()
+    del sample
+    print('%-22s %10.0f topics/s %8.0f bytes/topic' % (
+        'retain', count / elapsed, size))
+
+    # the filters a device fleet resubscribes with after a network blip
+    for topic_filter in ('site/7/dev/42/status', 'site/7/dev/42/#',
+                         'site/+/dev/42/status', 'site/7/dev/+/status'):
+        matched = len(store.match(topic_filter))
+        print('%-22s %10.0f lookups/s %8d matched' % (
+            topic_filter, measure(lambda: store.match(topic_filter)),
+            matched))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from mqtt.store import MessageStore, SYNC_ALWAYS, SYNC_INTERVAL, SYNC_NEVER
+from mqtt.template import PublishTemplate
+
+
+def measure(policy, count):
+    directory = tempfile.mkdtemp()
+    try:
+        store = MessageStore(directory, sync=policy)
+        template = PublishTemplate('site/1/dev/2/temp', 'x' * 64)
+        started = time.time()
+        for i in range(count):
+            message_id = i % 0xFFFF + 1
+            store.addFrame('client%d' % (i // 0xFFFF), message_id,
+                           template.header(1, message_id), template.payload)
+        added = time.time()
+        for i in range(count):
+            store.acknowledge('client%d' % (i // 0xFFFF), i % 0xFFFF + 1)
+        acked = time.time()
+        store.close()
+
+        store = MessageStore(directory, sync=policy)
+        recovered = time.time() - acked
+        store.close()
+        return (count / (added - started), count / (acked - added),
+                recovered)
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print('python %d.%d, %d in-flight messages' % (
+        sys.version_info[:2] + (count,)))
+    print('%-10s %12s %12s %12s' % ('sync', 'add/s', 'ack/s', 'recover s'))
+    for policy in (SYNC_NEVER, SYNC_INTERVAL, SYNC_ALWAYS):
+        n = count if policy != SYNC_ALWAYS else min(count, 10000)
+        print('%-10s %12.0f %12.0f %12.2f' % ((policy,) + measure(policy, n)))
+
+
+if __name__ == '__main__':
+    main()
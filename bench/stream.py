@@ -0,0 +1,56 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import sys
+import time
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from mqtt.packet import Packet
+from mqtt.stream import StreamDecoder, iter_publish
+
+READ_SIZE = 65536
+
+
+def whole(image):
+    data = Packet('publish', qos=1, topic='fw/image', payload=image,
+                  message_id=1).encode()
+    decoder = StreamDecoder(lazy=True)
+    for i in range(0, len(data), READ_SIZE):
+        for packet in decoder.feed(data[i:i + READ_SIZE]):
+            assert len(packet.payload) == len(image)
+
+
+def streamed(image):
+    decoder = StreamDecoder(lazy=True, stream_threshold=READ_SIZE)
+    received = 0
+    for chunk in iter_publish('fw/image', io.BytesIO(image), qos=1,
+                              message_id=1, chunk_size=READ_SIZE):
+        for stream in decoder.feed(chunk):
+            pass
+        for body in stream:
+            received += len(body)
+    assert received == len(image)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 64 << 20
+    image = os.urandom(size)
+    print('python %d.%d, %d MB payload' % (sys.version_info[:2] +
+                                          (size >> 20,)))
+    print('%-10s %10s %14s' % ('mode', 'seconds', 'peak extra MB'))
+    for name, f in (('whole', whole), ('streamed', streamed)):
+        tracemalloc.start()
+        started = time.time()
+        f(image)
+        elapsed = time.time() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('%-10s %10.2f %14.1f' % (name, elapsed, peak / (1 << 20)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import itertools
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from mqtt.topic import CachedTopicTrie, TopicTrie
+
+SITES = 1000
+METRICS = ('temp', 'humidity', 'power', 'status')
+
+
+def gen_filters():
+    # one third exact, one third "+", one third "#" filters
+    device = 0
+    while True:
+        for site in range(SITES):
+            metric = METRICS[(site + device) % len(METRICS)]
+            yield 'site/%d/dev/%d/%s' % (site, device, metric)
+            yield 'site/%d/+/%d/%s' % (site, device, metric)
+            yield 'site/%d/dev/%d/#' % (site, device)
+        device += 1
+
+
+def gen_topics(count, devices):
+    rnd = random.Random(42)
+    return ['site/%d/dev/%d/%s' % (
+        rnd.randrange(SITES), rnd.randrange(devices), rnd.choice(METRICS))
+        for i in range(count)]
+
+
+def main(max_subscriptions=1000000, lookups=20000):
+    print('%12s %10s %14s %12s %15s' % (
+        'subscriptions', 'insert s', 'match us/op', 'matches/op',
+        'cached us/op'))
+    count = 1000
+    while count <= max_subscriptions:
+        trie = CachedTopicTrie()
+        started = time.time()
+        for i, f in enumerate(itertools.islice(gen_filters(), count)):
+            trie.insert(f, i, i % 3)
+        inserted = time.time() - started
+
+        topics = gen_topics(lookups, count // (SITES * 3) + 1)
+        matched = 0
+        started = time.time()
+        for topic in topics:
+            matched += len(TopicTrie.match(trie, topic))
+        elapsed = time.time() - started
+
+        # skewed traffic: every lookup is one of 1000 hot topics
+        hot = topics[:1000] * (lookups // 1000)
+        for topic in hot[:1000]:
+            trie.match(topic)
+        started = time.time()
+        for topic in hot:
+            trie.match(topic)
+        cached = time.time() - started
+
+        print('%12d %10.2f %14.2f %12.2f %15.2f' % (
+            len(trie), inserted, elapsed / lookups * 1e6,
+            matched / lookups, cached / len(hot) * 1e6))
+        count *= 10
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
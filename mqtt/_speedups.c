@@ -0,0 +1,204 @@
+/*
+ * Optional accelerator for mqtt.framing: fixed header parsing, remaining
+ * length encode/decode and frame splitting. Every function must behave
+ * exactly like its py_* counterpart in framing.py.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#define REMAIN_LEN_MASK 0x7F
+#define REMAIN_LEN_NEXT_BYTE_MASK 0x80
+#define MAX_REMAIN_LENGTH 268435455L
+#define MAX_REMAIN_LENGTH_BYTES 4
+
+/* Returns 1 and fills the out parameters when a complete header is found,
+ * 0 when more data is needed and -1 (with ValueError set) when malformed. */
+static int
+parse_header_at(const unsigned char *buf, Py_ssize_t len, Py_ssize_t offset,
+                unsigned char *first_byte, long *length, Py_ssize_t *size)
+{
+    long multiplier = 1;
+    long value = 0;
+    Py_ssize_t pos = offset + 1;
+    unsigned char digit;
+
+    for (;;) {
+        if (pos >= len)
+            return 0;
+        digit = buf[pos];
+        value += (digit & REMAIN_LEN_MASK) * multiplier;
+        pos++;
+        if (!(digit & REMAIN_LEN_NEXT_BYTE_MASK))
+            break;
+        if (pos - offset > MAX_REMAIN_LENGTH_BYTES) {
+            PyErr_SetString(PyExc_ValueError, "malformed remaining length");
+            return -1;
+        }
+        multiplier *= 128;
+    }
+    *first_byte = buf[offset];
+    *length = value;
+    *size = pos - offset;
+    return 1;
+}
+
+static PyObject *
+decode_remain_length(PyObject *self, PyObject *arg)
+{
+    Py_buffer view;
+    const unsigned char *buf;
+    long multiplier = 1;
+    long length = 0;
+    Py_ssize_t i, end;
+
+    if (PyObject_GetBuffer(arg, &view, PyBUF_SIMPLE) < 0)
+        return NULL;
+    buf = (const unsigned char *)view.buf;
+    end = view.len < 1 + MAX_REMAIN_LENGTH_BYTES ?
+        view.len : 1 + MAX_REMAIN_LENGTH_BYTES;
+    for (i = 1; i < end; i++) {
+        length += (buf[i] & REMAIN_LEN_MASK) * multiplier;
+        multiplier *= 128;
+        if (!(buf[i] & REMAIN_LEN_NEXT_BYTE_MASK))
+            break;
+    }
+    PyBuffer_Release(&view);
+    return PyLong_FromLong(length);
+}
+
+static PyObject *
+encode_remain_length(PyObject *self, PyObject *arg)
+{
+    unsigned char out[MAX_REMAIN_LENGTH_BYTES];
+    Py_ssize_t n = 0;
+    long x = PyLong_AsLong(arg);
+
+    if (x == -1 && PyErr_Occurred()) {
+        if (!PyErr_ExceptionMatches(PyExc_OverflowError))
+            return NULL;
+        PyErr_Clear();
+        return PyErr_Format(PyExc_ValueError,
+                            "remaining length out of range: %S", arg);
+    }
+    if (x < 0 || x > MAX_REMAIN_LENGTH)
+        return PyErr_Format(PyExc_ValueError,
+                            "remaining length out of range: %ld", x);
+    do {
+        unsigned char digit = x % 128;
+        x /= 128;
+        if (x > 0)
+            digit |= REMAIN_LEN_NEXT_BYTE_MASK;
+        out[n++] = digit;
+    } while (x > 0);
+    return PyBytes_FromStringAndSize((const char *)out, n);
+}
+
+static PyObject *
+parse_header(PyObject *self, PyObject *args)
+{
+    PyObject *data;
+    Py_ssize_t offset = 0;
+    Py_buffer view;
+    unsigned char first_byte;
+    long length;
+    Py_ssize_t size;
+    int found;
+
+    if (!PyArg_ParseTuple(args, "O|n:parse_header", &data, &offset))
+        return NULL;
+    if (offset < 0) {
+        PyErr_SetString(PyExc_ValueError, "negative offset");
+        return NULL;
+    }
+    if (PyObject_GetBuffer(data, &view, PyBUF_SIMPLE) < 0)
+        return NULL;
+    found = parse_header_at((const unsigned char *)view.buf, view.len,
+                            offset, &first_byte, &length, &size);
+    PyBuffer_Release(&view);
+    if (found < 0)
+        return NULL;
+    if (found == 0)
+        Py_RETURN_NONE;
+    return Py_BuildValue("(iln)", first_byte, length, size);
+}
+
+static PyObject *
+split_frames(PyObject *self, PyObject *args)
+{
+    PyObject *data;
+    Py_ssize_t offset = 0;
+    Py_buffer view;
+    const unsigned char *buf;
+    PyObject *frames, *frame, *result;
+    unsigned char first_byte;
+    long length;
+    Py_ssize_t size, frame_end;
+    int found;
+
+    if (!PyArg_ParseTuple(args, "O|n:split_frames", &data, &offset))
+        return NULL;
+    if (PyObject_GetBuffer(data, &view, PyBUF_SIMPLE) < 0)
+        return NULL;
+    frames = PyList_New(0);
+    if (frames == NULL)
+        goto error;
+    buf = (const unsigned char *)view.buf;
+
+    while (offset < view.len) {
+        if (offset < 0) {
+            PyErr_SetString(PyExc_ValueError, "negative offset");
+            found = -1;
+        }
+        else {
+            found = parse_header_at(buf, view.len, offset,
+                                    &first_byte, &length, &size);
+        }
+        if (found < 0) {
+            if (PyList_GET_SIZE(frames) > 0) {
+                PyErr_Clear();
+                break;
+            }
+            goto error;
+        }
+        if (found == 0)
+            break;
+        frame_end = offset + size + length;
+        if (frame_end > view.len)
+            break;
+        frame = Py_BuildValue("(nn)", offset, frame_end);
+        if (frame == NULL || PyList_Append(frames, frame) < 0) {
+            Py_XDECREF(frame);
+            goto error;
+        }
+        Py_DECREF(frame);
+        offset = frame_end;
+    }
+
+    PyBuffer_Release(&view);
+    result = Py_BuildValue("(Nn)", frames, offset);
+    return result;
+
+error:
+    Py_XDECREF(frames);
+    PyBuffer_Release(&view);
+    return NULL;
+}
+
+static PyMethodDef speedups_methods[] = {
+    {"decode_remain_length", decode_remain_length, METH_O, NULL},
+    {"encode_remain_length", encode_remain_length, METH_O, NULL},
+    {"parse_header", parse_header, METH_VARARGS, NULL},
+    {"split_frames", split_frames, METH_VARARGS, NULL},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT, "mqtt._speedups", NULL, -1, speedups_methods
+};
+
+PyMODINIT_FUNC
+PyInit__speedups(void)
+{
+    return PyModule_Create(&speedups_module);
+}
@@ -0,0 +1,358 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from . import constant as _
+from .inflight import InflightWindow
+from .metrics import current_observer, observe_frame
+from .packet import PINGRESP_FRAME, Packet, ack_frame, connack_frame
+from .pool import PacketPool
+from .retain import RetainedStore
+from .stream import StreamDecoder
+from .template import PublishTemplate
+from .topic import CachedTopicTrie, TopicTrie
+
+
+class Session(object):
+    # One client connection. Outgoing frames are collected in a list and
+    # written with a single writelines() call per event loop iteration.
+    # write() takes the chunks of one pre-encoded frame and reports it to
+    # the metrics observer, as Packet.encode() would; send() encodes.
+
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.clientId = None
+        self.keepAliveTime = 0
+        self.will = None
+        self.subscriptions = {}
+        self.lastActivity = 0
+        self.dropped = 0
+        self.inflight = InflightWindow(broker.retryInterval)
+
+        self._outgoing = []
+        self._outgoingSize = 0
+        self._incoming = set()
+
+    def write(self, *chunks):
+        observer = current_observer()
+        if observer is not None:
+            observe_frame(observer, chunks)
+        self._queue(chunks)
+
+    def send(self, packet):
+        self._queue((packet.encode(),))
+
+    def _queue(self, chunks):
+        if not self._outgoing:
+            asyncio.get_event_loop().call_soon(self._flush)
+        self._outgoing.extend(chunks)
+        for chunk in chunks:
+            self._outgoingSize += len(chunk)
+
+    def _flush(self):
+        chunks, self._outgoing = self._outgoing, []
+        self._outgoingSize = 0
+        if chunks and not self.writer.is_closing():
+            self.writer.writelines(chunks)
+
+    def congested(self):
+        return (self.writer.transport.get_write_buffer_size() +
+                self._outgoingSize > self.broker.maxWriteBuffer)
+
+    def deliver(self, template, qos):
+        if qos == Packet.QOS_AT_MOST_ONCE:
+            if self.congested():
+                self.dropped += 1
+                return
+            self.write(template.header(), template.payload)
+            return
+
+        try:
+            message_id = self.inflight.allocate()
+        except RuntimeError:
+            # every message id is in flight to a subscriber that does not
+            # acknowledge; the publisher is not made to fail for it
+            self.dropped += 1
+            return
+        header = template.header(qos, message_id)
+        self.inflight.publish(message_id, qos, (header, template.payload),
+                              asyncio.get_event_loop().time())
+        self.write(header, template.payload)
+
+    def retransmit(self, now):
+        for message_id, chunks in self.inflight.expired(now):
+            self.write(*chunks)
+
+    def receive(self, message_id):
+        # QoS 2 publishes are routed once, redeliveries before PUBREL are not
+        if message_id in self._incoming:
+            return False
+        self._incoming.add(message_id)
+        return True
+
+    def release(self, message_id):
+        self._incoming.discard(message_id)
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+class Broker(object):
+
+    _READ_SIZE = 65536
+    _KEEP_ALIVE_FACTOR = 1.5
+    _SWEEP_INTERVAL = 1
+
+    PROTOCOLS = (('MQIsdp', 3), ('MQTT', 4))
+    MAX_CLIENT_ID_LENGTH = 23
+    SUBSCRIBE_FAILURE = 0x80
+
+    def __init__(self, host='127.0.0.1', port=1883, authenticate=None,
+                 max_connections=None, max_write_buffer=1 << 22,
+                 match_cache_size=10000, retry_interval=20, strict=True,
+                 reuse_port=False, connect_timeout=10):
+        self.host = host
+        self.port = port
+        self.authenticate = authenticate
+        self.maxConnections = max_connections
+        self.maxWriteBuffer = max_write_buffer
+        self.retryInterval = retry_interval
+        # validate every frame from the clients
+        self.strict = strict
+        # let other processes listen on the same port
+        self.reusePort = reuse_port
+        # seconds a new connection has to complete its CONNECT; keep-alive
+        # only applies once it has
+        self.connectTimeout = connect_timeout
+
+        self.sessions = {}
+        if match_cache_size:
+            self._subscriptions = CachedTopicTrie(match_cache_size)
+        else:
+            self._subscriptions = TopicTrie()
+        self.retained = RetainedStore()
+        self._pool = PacketPool()
+        self._server = None
+        self._sweeper = None
+        self._tasks = set()
+
+        self._handlers = {
+            _.MSG_CODES['publish']: self._handlePublish,
+            _.MSG_CODES['puback']: self._handlePuback,
+            _.MSG_CODES['pubrec']: self._handlePubrec,
+            _.MSG_CODES['pubrel']: self._handlePubrel,
+            _.MSG_CODES['pubcomp']: self._handlePubcomp,
+            _.MSG_CODES['subscribe']: self._handleSubscribe,
+            _.MSG_CODES['unsubscribe']: self._handleUnsubscribe,
+            _.MSG_CODES['pingreq']: self._handlePingreq,
+        }
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._serve, self.host, self.port,
+            reuse_port=self.reusePort or None)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._sweeper = asyncio.get_event_loop().create_task(self._sweep())
+        return self.port
+
+    async def stop(self):
+        self._server.close()
+        self._sweeper.cancel()
+        for session in list(self.sessions.values()):
+            session.close()
+        await self._server.wait_closed()
+        if self._tasks:
+            await asyncio.wait(self._tasks)
+
+    async def serveForever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    def publish(self, topic, message=None, qos=Packet.QOS_AT_MOST_ONCE,
+                retain=False, payload=None):
+        if payload is None:
+            payload = message.encode(Packet._ENCODING)
+        if retain:
+            self.retained.retain(topic, payload, qos)
+        # live deliveries never carry the retain flag
+        template = PublishTemplate(topic, payload=payload)
+        for session, granted_qos in self._subscriptions.match(topic).items():
+            session.deliver(template, min(qos, granted_qos))
+
+    async def _serve(self, reader, writer):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        session = Session(self, reader, writer)
+        try:
+            await self._session(session)
+        except (ConnectionError, OSError, ValueError, IndexError, KeyError):
+            # connection lost or malformed packet
+            pass
+        finally:
+            self._disconnect(session)
+            self._tasks.discard(task)
+
+    async def _session(self, session):
+        loop = asyncio.get_event_loop()
+        pool = self._pool
+        decoder = StreamDecoder(lazy=True, pool=pool, strict=self.strict)
+        deadline = None
+        if self.connectTimeout:
+            deadline = loop.time() + self.connectTimeout
+        while True:
+            if deadline is not None and session.clientId is None:
+                try:
+                    data = await asyncio.wait_for(
+                        session.reader.read(self._READ_SIZE),
+                        deadline - loop.time())
+                except asyncio.TimeoutError:
+                    return
+            else:
+                data = await session.reader.read(self._READ_SIZE)
+            if not data:
+                return
+            session.lastActivity = loop.time()
+            for packet in decoder.feed(data):
+                if session.clientId is None:
+                    if packet.mtype != 'connect' or not self._handleConnect(
+                            session, packet):
+                        return
+                    continue
+                if packet.mtype == 'disconnect':
+                    session.will = None
+                    return
+                handler = self._handlers.get(packet.mcode)
+                if handler:
+                    handler(session, packet)
+                # no handler keeps an ack or a ping
+                pool.release(packet)
+            # stop reading from a client that does not read its own acks
+            if session.congested():
+                await session.writer.drain()
+
+    def _disconnect(self, session):
+        if session.clientId is not None and self.sessions.get(
+                session.clientId) is session:
+            del self.sessions[session.clientId]
+        for topic in list(session.subscriptions):
+            self._unsubscribe(session, topic)
+        if session.will is not None:
+            self.publish(*session.will)
+            session.will = None
+        session.close()
+
+    def _returnCode(self, packet):
+        pname = packet.pname
+        if (pname, packet.pversion) not in self.PROTOCOLS:
+            return _.CONNECT_UNACCEPTABLE_PROTOCOL_VERSION
+        client_id = packet.clientId
+        if not client_id or (pname == 'MQIsdp' and
+                             len(client_id) > self.MAX_CLIENT_ID_LENGTH):
+            return _.CONNECT_IDENTIFIER_REJECTED
+        if self.maxConnections is not None and client_id not in \
+                self.sessions and len(self.sessions) >= self.maxConnections:
+            return _.CONNECT_SERVER_UNAVAILABLE
+        if self.authenticate is not None:
+            return self.authenticate(packet)
+        return _.CONNECT_ACCEPTED
+
+    def _handleConnect(self, session, packet):
+        return_code = self._returnCode(packet)
+        session.write(connack_frame(return_code))
+        if return_code != _.CONNECT_ACCEPTED:
+            return False
+
+        previous = self.sessions.get(packet.clientId)
+        if previous is not None:
+            self._disconnect(previous)
+        session.clientId = packet.clientId
+        session.keepAliveTime = packet.keepAliveTime
+        if getattr(packet, 'willTopic', None) is not None:
+            session.will = (
+                packet.willTopic, packet.willMessage,
+                getattr(packet, 'willQOS', 0),
+                getattr(packet, 'willRetain', False))
+        self.sessions[session.clientId] = session
+        return True
+
+    def _handlePublish(self, session, packet):
+        qos = packet.qos
+        if qos == Packet.QOS_AT_LEAST_ONCE:
+            session.write(ack_frame('puback', packet.messageId))
+        elif qos == Packet.QOS_EXACTLY_ONCE:
+            session.write(ack_frame('pubrec', packet.messageId))
+            if not session.receive(packet.messageId):
+                return
+        self.publish(packet.topic, qos=qos, retain=packet.retain,
+                     payload=packet.payload)
+
+    def _handlePuback(self, session, packet):
+        session.inflight.acknowledge(packet.messageId)
+
+    def _handlePubrec(self, session, packet):
+        pubrel = session.inflight.receive(
+            packet.messageId, asyncio.get_event_loop().time())
+        if pubrel is not None:
+            session.write(pubrel)
+
+    def _handlePubcomp(self, session, packet):
+        session.inflight.complete(packet.messageId)
+
+    def _handlePubrel(self, session, packet):
+        session.release(packet.messageId)
+        session.write(ack_frame('pubcomp', packet.messageId))
+
+    def _handleSubscribe(self, session, packet):
+        granted = []
+        for topic, qos in packet.topics:
+            qos = min(qos, Packet.QOS_EXACTLY_ONCE)
+            try:
+                self._subscribe(session, topic, qos)
+            except ValueError:
+                granted.append(self.SUBSCRIBE_FAILURE)
+                continue
+            granted.append(qos)
+        session.send(Packet(
+            'suback', message_id=packet.messageId, granted_qos=granted))
+
+        for (topic, requested), qos in zip(packet.topics, granted):
+            if qos == self.SUBSCRIBE_FAILURE:
+                continue
+            for template, retained_qos in self.retained.match(topic):
+                session.deliver(template, min(qos, retained_qos))
+
+    def _handleUnsubscribe(self, session, packet):
+        for topic in packet.topics:
+            if topic in session.subscriptions:
+                self._unsubscribe(session, topic)
+        session.write(ack_frame('unsuback', packet.messageId))
+
+    def _subscribe(self, session, topic, qos):
+        self._subscriptions.insert(topic, session, qos)
+        session.subscriptions[topic] = qos
+
+    def _unsubscribe(self, session, topic):
+        del session.subscriptions[topic]
+        self._subscriptions.remove(topic, session)
+
+    def _handlePingreq(self, session, packet):
+        session.write(PINGRESP_FRAME)
+
+    async def _sweep(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self._SWEEP_INTERVAL)
+            now = loop.time()
+            for session in list(self.sessions.values()):
+                timeout = session.keepAliveTime * self._KEEP_ALIVE_FACTOR
+                if timeout and now - session.lastActivity > timeout:
+                    self._disconnect(session)
+                else:
+                    session.retransmit(now)
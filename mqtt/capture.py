@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import mmap
+import multiprocessing
+import os
+from collections import namedtuple
+
+from .framing import parse_header, split_frames
+from .packet import Packet
+
+# offset and length locate the PUBLISH payload in the capture file
+Record = namedtuple(
+    'Record', ('mtype', 'qos', 'topic', 'messageId', 'offset', 'length'))
+
+DEFAULT_CHUNK_SIZE = 1 << 22
+
+# the capture mapped once per worker process
+_capture = None
+
+
+def split_chunks(data, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Yields (start, end) ranges of whole frames, each about chunk_size
+    # bytes. A frame cut off at the end of the capture is left out. The
+    # frames are found through a memoryview, so no chunk is copied; close
+    # the generator before closing a map it is given.
+    size = len(data)
+    offset = 0
+    with memoryview(data) as view:
+        while offset < size:
+            with view[offset:offset + chunk_size] as window:
+                consumed = split_frames(window)[1]
+            if consumed:
+                end = offset + consumed
+            else:
+                # the next frame alone is larger than a chunk
+                header = parse_header(view, offset)
+                if header is None:
+                    return
+                end = offset + header[2] + header[1]
+                if end > size:
+                    return
+            yield offset, end
+            offset = end
+
+
+def decode_chunk(data, start, end):
+    # one copy of the chunk out of the map, then zero-copy frame slices
+    chunk = memoryview(bytes(data[start:end]))
+    records = []
+    for frame_start, frame_end in split_frames(chunk)[0]:
+        packet = Packet.fromData(chunk[frame_start:frame_end], True)
+        payload = packet.payload
+        if payload is None:
+            records.append(Record(
+                packet.mtype, packet.qos, None,
+                getattr(packet, 'messageId', None), None, None))
+        else:
+            length = len(payload)
+            records.append(Record(
+                packet.mtype, packet.qos, packet.topic,
+                getattr(packet, 'messageId', None),
+                start + frame_end - length, length))
+    return records
+
+
+def _init_worker(path):
+    global _capture
+    with open(path, 'rb') as f:
+        _capture = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _decode_in_worker(bounds):
+    return decode_chunk(_capture, bounds[0], bounds[1])
+
+
+def replay(path, processes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Decodes a raw capture of MQTT frames and yields one Record per packet
+    # in capture order. Chunks are framed here and decoded by a process
+    # pool; only the compact records travel back.
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    chunks = split_chunks(mm, chunk_size)
+    try:
+        if processes == 1:
+            for start, end in chunks:
+                for record in decode_chunk(mm, start, end):
+                    yield record
+            return
+
+        pool = multiprocessing.Pool(
+            processes, initializer=_init_worker, initargs=(path,))
+        try:
+            for records in pool.imap(_decode_in_worker, chunks):
+                for record in records:
+                    yield record
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        chunks.close()
+        mm.close()
@@ -0,0 +1,330 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from . import constant as _
+from .inflight import IdAllocator
+from .metrics import current_observer, observe_frame
+from .packet import DISCONNECT_FRAME, PINGREQ_FRAME, Packet, ack_frame
+from .stream import (DEFAULT_CHUNK_SIZE, PublishStream, StreamDecoder,
+                     iter_publish)
+
+
+class ConnectError(Exception):
+
+    def __init__(self, return_code):
+        super(ConnectError, self).__init__(
+            'connection refused, return code %d' % return_code)
+        self.returnCode = return_code
+
+
+class Client(object):
+    # Every request is written as soon as it is issued and waits on its own
+    # future, so any number of publishes can be in flight on one connection.
+
+    _READ_SIZE = 65536
+    _WRITE_HIGH_WATER = 1 << 20
+    _STREAM_HIGH_WATER = 1 << 20
+
+    def __init__(self, client_id=None, keep_alive_time=60,
+                 clean_session=True, stream_threshold=None, **kwargs):
+        self._connect = Packet(
+            'connect', client_id=client_id, keep_alive_time=keep_alive_time,
+            clean_session=clean_session, **kwargs)
+        self.clientId = self._connect.clientId
+        self.keepAliveTime = keep_alive_time
+
+        # created by connect(), on the loop the client runs in
+        self.messages = None
+        self.connected = False
+
+        self._reader = None
+        self._writer = None
+        self._decoder = StreamDecoder(
+            lazy=True, stream_threshold=stream_threshold)
+        self._streams = []
+        self._streaming = False
+        self._deferred = []
+        self._writeLock = None
+        self._pending = {}
+        self._incoming = set()
+        self._ids = IdAllocator()
+        self._lastSent = 0
+        self._pingSent = None
+        self._drainLock = None
+        self._tasks = []
+        self._closed = None
+
+        self._handlers = {
+            _.MSG_CODES['connack']: self._handleConnack,
+            _.MSG_CODES['publish']: self._handlePublish,
+            _.MSG_CODES['puback']: self._handleAck,
+            _.MSG_CODES['pubrec']: self._handleAck,
+            _.MSG_CODES['pubrel']: self._handlePubrel,
+            _.MSG_CODES['pubcomp']: self._handleAck,
+            _.MSG_CODES['suback']: self._handleAck,
+            _.MSG_CODES['unsuback']: self._handleAck,
+            _.MSG_CODES['pingresp']: self._handlePingresp,
+        }
+
+    async def connect(self, host='localhost', port=1883, **kwargs):
+        loop = asyncio.get_event_loop()
+        # before Python 3.10 these bind to the current event loop when
+        # created, which need not be the one running when __init__ ran
+        self.messages = asyncio.Queue()
+        self._writeLock = asyncio.Lock()
+        self._drainLock = asyncio.Lock()
+        self._reader, self._writer = await asyncio.open_connection(
+            host, port, **kwargs)
+        self._closed = loop.create_future()
+        connack = self._pending[None] = loop.create_future()
+        self._tasks.append(loop.create_task(self._readLoop()))
+        await self._send(self._connect)
+
+        packet = await connack
+        if packet.returnCode != _.CONNECT_ACCEPTED:
+            await self._close()
+            raise ConnectError(packet.returnCode)
+
+        self.connected = True
+        if self.keepAliveTime:
+            self._tasks.append(loop.create_task(self._keepAlive()))
+
+    async def publish(self, topic, message=None, qos=Packet.QOS_AT_MOST_ONCE,
+                      retain=False, payload=None):
+        async def send(message_id=None):
+            await self._send(Packet(
+                'publish', qos=qos, retain=retain, topic=topic,
+                message=message, payload=payload, message_id=message_id))
+        return await self._publish(qos, send)
+
+    async def publishStream(self, topic, source, length=None,
+                            qos=Packet.QOS_AT_MOST_ONCE, retain=False,
+                            chunk_size=DEFAULT_CHUNK_SIZE):
+        # source is a binary file, bytes or an iterable of chunks (with
+        # length); the payload is written chunk by chunk
+        async def send(message_id=None):
+            await self._sendChunks(iter_publish(
+                topic, source, length, qos, message_id, retain=retain,
+                chunk_size=chunk_size))
+        return await self._publish(qos, send)
+
+    async def _publish(self, qos, send):
+        if qos == Packet.QOS_AT_MOST_ONCE:
+            await send()
+            return None
+
+        message_id = self._ids.allocate()
+        try:
+            ack = self._expect(message_id)
+            await send(message_id)
+            await ack
+            if qos == Packet.QOS_EXACTLY_ONCE:
+                ack = self._expect(message_id)
+                await self._sendFrame(ack_frame('pubrel', message_id))
+                await ack
+        finally:
+            self._ids.release(message_id)
+        return message_id
+
+    async def subscribe(self, topics):
+        packet = await self._request('subscribe', topics=list(topics))
+        return packet.grantedQos
+
+    async def unsubscribe(self, topics):
+        await self._request('unsubscribe', topics=list(topics))
+
+    async def disconnect(self):
+        if self.connected:
+            await self._sendFrame(DISCONNECT_FRAME)
+        await self._close()
+
+    async def waitClosed(self):
+        await asyncio.shield(self._closed)
+
+    async def _request(self, mtype, **kwargs):
+        message_id = self._ids.allocate()
+        try:
+            ack = self._expect(message_id)
+            await self._send(Packet(
+                mtype, qos=Packet.QOS_AT_LEAST_ONCE, message_id=message_id,
+                **kwargs))
+            return await ack
+        finally:
+            self._ids.release(message_id)
+
+    def _expect(self, message_id):
+        future = asyncio.get_event_loop().create_future()
+        self._pending[message_id] = future
+        return future
+
+    async def _send(self, packet):
+        await self._writeFrame(packet.encode())
+
+    async def _sendFrame(self, data):
+        # a pre-encoded frame, which Packet.encode() never saw
+        observer = current_observer()
+        if observer is not None:
+            observe_frame(observer, (data,))
+        await self._writeFrame(data)
+
+    async def _writeFrame(self, data):
+        if self._streaming:
+            # wait for the streamed PUBLISH being written to end
+            async with self._writeLock:
+                pass
+        if self._writer is None or self._writer.is_closing():
+            raise ConnectionError('not connected')
+        self._writer.write(data)
+        self._lastSent = asyncio.get_event_loop().time()
+        transport = self._writer.transport
+        if transport.get_write_buffer_size() > self._WRITE_HIGH_WATER:
+            async with self._drainLock:
+                await self._writer.drain()
+
+    async def _sendChunks(self, chunks):
+        async with self._writeLock:
+            self._streaming = True
+            written = False
+            try:
+                for chunk in chunks:
+                    if self._writer is None or self._writer.is_closing():
+                        raise ConnectionError('not connected')
+                    self._writer.write(chunk)
+                    written = True
+                    self._lastSent = asyncio.get_event_loop().time()
+                    async with self._drainLock:
+                        await self._writer.drain()
+            except BaseException:
+                # a frame cut short leaves the broker reading the next
+                # frames as its payload
+                if written:
+                    await self._close()
+                raise
+            finally:
+                self._streaming = False
+                deferred, self._deferred = self._deferred, []
+                if deferred and not self._writer.is_closing():
+                    self._writer.writelines(deferred)
+
+    def _write(self, data):
+        observer = current_observer()
+        if observer is not None:
+            observe_frame(observer, (data,))
+        # acks must not land in the middle of a streamed PUBLISH
+        if self._streaming:
+            self._deferred.append(data)
+        else:
+            self._writer.write(data)
+
+    async def _readLoop(self):
+        try:
+            while True:
+                data = await self._reader.read(self._READ_SIZE)
+                if not data:
+                    break
+                for packet in self._decoder.feed(data):
+                    if isinstance(packet, PublishStream):
+                        self._handleStream(packet)
+                        continue
+                    handler = self._handlers.get(packet.mcode)
+                    if handler:
+                        handler(packet)
+                if self._streams:
+                    await self._settleStreams()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            await self._close()
+
+    async def _keepAlive(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            now = loop.time()
+            if self._pingSent is not None:
+                # no PINGRESP within a whole keep-alive period
+                if now - self._pingSent >= self.keepAliveTime:
+                    await self._close()
+                    return
+                await asyncio.sleep(self._pingSent + self.keepAliveTime - now)
+                continue
+            idle = now - self._lastSent
+            if idle >= self.keepAliveTime:
+                self._pingSent = now
+                await self._sendFrame(PINGREQ_FRAME)
+            else:
+                await asyncio.sleep(self.keepAliveTime - idle)
+
+    async def _close(self):
+        self.connected = False
+        current = asyncio.current_task()
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+        self._tasks = []
+        if self._writer is not None:
+            self._writer.close()
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError('connection closed'))
+        self._pending.clear()
+        for stream in self._streams:
+            stream.abort(ConnectionError('connection closed'))
+        self._streams = []
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+    def _resolve(self, key, packet):
+        future = self._pending.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(packet)
+
+    def _handleConnack(self, packet):
+        self._resolve(None, packet)
+
+    def _handleAck(self, packet):
+        self._resolve(packet.messageId, packet)
+
+    def _handlePublish(self, packet):
+        self._acknowledge(packet)
+        if self._receive(packet):
+            self.messages.put_nowait(packet)
+
+    def _handleStream(self, stream):
+        # queued at once, acknowledged when the whole body has arrived
+        if self._receive(stream.packet):
+            self.messages.put_nowait(stream)
+        else:
+            stream.discard()
+        self._streams.append(stream)
+
+    async def _settleStreams(self):
+        for stream in list(self._streams):
+            if stream.done():
+                self._streams.remove(stream)
+                self._acknowledge(stream.packet)
+            elif stream.buffered > self._STREAM_HIGH_WATER:
+                # stop reading until the consumer catches up
+                await stream.drained()
+
+    def _acknowledge(self, packet):
+        if packet.qos == Packet.QOS_AT_LEAST_ONCE:
+            self._write(ack_frame('puback', packet.messageId))
+        elif packet.qos == Packet.QOS_EXACTLY_ONCE:
+            self._write(ack_frame('pubrec', packet.messageId))
+
+    def _receive(self, packet):
+        # QoS 2 redeliveries before PUBREL are acknowledged, not delivered
+        if packet.qos == Packet.QOS_EXACTLY_ONCE:
+            if packet.messageId in self._incoming:
+                return False
+            self._incoming.add(packet.messageId)
+        return True
+
+    def _handlePubrel(self, packet):
+        self._incoming.discard(packet.messageId)
+        self._write(ack_frame('pubcomp', packet.messageId))
+
+    def _handlePingresp(self, packet):
+        self._pingSent = None
@@ -0,0 +1,296 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+
+from . import constant as _
+from .broker import Broker, Session
+from .packet import Packet
+from .stream import StreamDecoder, publish_header
+from .topic import CachedTopicTrie
+
+
+class ClusterBroker(Broker):
+    # One worker of a Cluster. Its own clients are served as by Broker; a
+    # PUBLISH is also forwarded to every peer worker with a subscriber to
+    # its topic, as the encoded frame over a Unix socket. Workers announce
+    # the filters they have subscribers for to each other with SUBSCRIBE and
+    # UNSUBSCRIBE frames on the same sockets. Announcements travel
+    # asynchronously, so a publish racing a subscription on another worker
+    # may miss it. A client id connecting is sent to the peers as a CONNECT
+    # frame, and a peer with a session of that id closes it, so an id is
+    # taken over across workers as within one; two clients connecting with
+    # the same id on two workers at once may both be closed. Forwarding to a
+    # worker that falls behind drops QoS 0 messages once its link holds
+    # max_write_buffer bytes, and every message at _PEER_BUFFER_FACTOR times
+    # that, so a stalled worker cannot make its peers' memory grow without
+    # bound.
+
+    _PEER_READ_SIZE = 1 << 18
+    _PEER_BUFFER_FACTOR = 4
+
+    def __init__(self, peers=(), reuse_port=True, **kwargs):
+        # peers: one connected Unix stream socket per other worker
+        super(ClusterBroker, self).__init__(reuse_port=reuse_port, **kwargs)
+        self.peers = []
+        self._peerSockets = list(peers)
+        self._peerFilters = CachedTopicTrie()
+        self._peerTasks = []
+        # local sessions subscribed per filter
+        self._filters = {}
+
+        self._peerHandlers = {
+            _.MSG_CODES['connect']: self._handlePeerConnect,
+            _.MSG_CODES['publish']: self._handlePeerPublish,
+            _.MSG_CODES['subscribe']: self._handlePeerSubscribe,
+            _.MSG_CODES['unsubscribe']: self._handlePeerUnsubscribe,
+        }
+
+    async def start(self):
+        loop = asyncio.get_event_loop()
+        for sock in self._peerSockets:
+            reader, writer = await asyncio.open_unix_connection(sock=sock)
+            peer = Session(self, reader, writer)
+            self.peers.append(peer)
+            self._peerTasks.append(loop.create_task(self._peer(peer)))
+        self._peerSockets = []
+        return await super(ClusterBroker, self).start()
+
+    async def stop(self):
+        await super(ClusterBroker, self).stop()
+        for task in self._peerTasks:
+            task.cancel()
+        if self._peerTasks:
+            await asyncio.wait(self._peerTasks)
+        self._peerTasks = []
+
+    def publish(self, topic, message=None, qos=Packet.QOS_AT_MOST_ONCE,
+                retain=False, payload=None):
+        if payload is None:
+            payload = message.encode(Packet._ENCODING)
+        super(ClusterBroker, self).publish(
+            topic, qos=qos, retain=retain, payload=payload)
+        # every worker keeps the retained messages
+        peers = self.peers if retain else self._peerFilters.match(topic)
+        if peers:
+            # message ids are not used between workers
+            header = publish_header(topic, len(payload), qos, 0,
+                                    retain=retain)
+            for peer in peers:
+                if self._peerCongested(peer, qos):
+                    peer.dropped += 1
+                    continue
+                peer.write(header, payload)
+
+    def _peerCongested(self, peer, qos):
+        if not peer.congested():
+            return False
+        if qos == Packet.QOS_AT_MOST_ONCE:
+            return True
+        buffered = (peer.writer.transport.get_write_buffer_size() +
+                    peer._outgoingSize)
+        return buffered > self.maxWriteBuffer * self._PEER_BUFFER_FACTOR
+
+    def _handleConnect(self, session, packet):
+        if not super(ClusterBroker, self)._handleConnect(session, packet):
+            return False
+        self._announce(Packet('connect', client_id=packet.clientId))
+        return True
+
+    def _subscribe(self, session, topic, qos):
+        new = topic not in session.subscriptions
+        super(ClusterBroker, self)._subscribe(session, topic, qos)
+        if new:
+            count = self._filters.get(topic, 0)
+            self._filters[topic] = count + 1
+            if not count:
+                # QoS is applied by the worker delivering the message
+                self._announce(Packet(
+                    'subscribe', qos=Packet.QOS_AT_LEAST_ONCE, message_id=1,
+                    topics=[(topic, Packet.QOS_AT_MOST_ONCE)]))
+
+    def _unsubscribe(self, session, topic):
+        super(ClusterBroker, self)._unsubscribe(session, topic)
+        count = self._filters.pop(topic) - 1
+        if count:
+            self._filters[topic] = count
+        else:
+            self._announce(Packet(
+                'unsubscribe', qos=Packet.QOS_AT_LEAST_ONCE, message_id=1,
+                topics=[topic]))
+
+    def _announce(self, packet):
+        # encoded, and counted by the metrics observer, once for all peers
+        data = packet.encode()
+        for peer in self.peers:
+            peer._queue((data,))
+
+    async def _peer(self, peer):
+        # frames from another worker of this cluster need no validation
+        decoder = StreamDecoder(trusted=True)
+        try:
+            while True:
+                data = await peer.reader.read(self._PEER_READ_SIZE)
+                if not data:
+                    return
+                for packet in decoder.feed(data):
+                    handler = self._peerHandlers.get(packet.mcode)
+                    if handler:
+                        handler(peer, packet)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            # the worker has exited
+            self.peers.remove(peer)
+            for topic in peer.subscriptions:
+                self._peerFilters.remove(topic, peer)
+            peer.subscriptions = {}
+            peer.close()
+
+    def _handlePeerConnect(self, peer, packet):
+        # the client id has connected to another worker
+        previous = self.sessions.get(packet.clientId)
+        if previous is not None:
+            self._disconnect(previous)
+
+    def _handlePeerPublish(self, peer, packet):
+        # routed to this worker's sessions only
+        Broker.publish(self, packet.topic, qos=packet.qos,
+                       retain=packet.retain, payload=packet.payload)
+
+    def _handlePeerSubscribe(self, peer, packet):
+        for topic, qos in packet.topics:
+            self._peerFilters.insert(topic, peer, qos)
+            peer.subscriptions[topic] = qos
+
+    def _handlePeerUnsubscribe(self, peer, packet):
+        for topic in packet.topics:
+            self._peerFilters.remove(topic, peer)
+            peer.subscriptions.pop(topic, None)
+
+
+class Cluster(object):
+    # Serves one port from several processes, to use more than one core.
+    # Every worker is a ClusterBroker listening with SO_REUSEPORT, so the
+    # kernel spreads new connections over them, and each worker owns its
+    # connections entirely. Every pair of workers shares a Unix socket pair
+    # for routing. Workers are forked, so start() must be called from
+    # outside a running event loop. Linux only.
+
+    _START_TIMEOUT = 10
+
+    def __init__(self, workers=None, host='127.0.0.1', port=1883, **kwargs):
+        self.workers = workers or os.cpu_count() or 1
+        self.host = host
+        self.port = port
+        self.processes = []
+        self._kwargs = kwargs
+        self._reserved = None
+
+    def start(self):
+        # binding first fixes the port when port 0 asks for any free one;
+        # the socket never listens, so it is given no connections
+        family, type_, proto, canonname, address = socket.getaddrinfo(
+            self.host, self.port, type=socket.SOCK_STREAM)[0]
+        self._reserved = socket.socket(family, type_, proto)
+        self._reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self._reserved.bind(address)
+        self.port = self._reserved.getsockname()[1]
+
+        count = self.workers
+        pairs = [[None] * count for i in range(count)]
+        for i in range(count):
+            for j in range(i + 1, count):
+                pairs[i][j], pairs[j][i] = socket.socketpair()
+
+        context = multiprocessing.get_context('fork')
+        ready = context.Queue()
+        try:
+            for index in range(count):
+                process = context.Process(
+                    target=_run_worker, name='mqtt-worker-%d' % index,
+                    args=(index, pairs, self._reserved, ready, dict(
+                        self._kwargs, host=self.host, port=self.port)))
+                process.daemon = True
+                process.start()
+                self.processes.append(process)
+        finally:
+            for row in pairs:
+                for sock in row:
+                    if sock is not None:
+                        sock.close()
+
+        started = 0
+        waited = 0
+        while started < count:
+            try:
+                ready.get(timeout=0.1)
+                started += 1
+                continue
+            except queue.Empty:
+                waited += 0.1
+            failed = [p for p in self.processes if p.exitcode is not None]
+            if failed or waited >= self._START_TIMEOUT:
+                self.stop()
+                raise RuntimeError('%d of %d workers failed to start' % (
+                    count - started, count))
+        return self.port
+
+    def stop(self, timeout=5):
+        for process in self.processes:
+            if process.exitcode is None:
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout)
+            if process.exitcode is None:
+                process.kill()
+                process.join()
+        self.processes = []
+        if self._reserved is not None:
+            self._reserved.close()
+            self._reserved = None
+
+    def serveForever(self):
+        self.start()
+        try:
+            for process in self.processes:
+                process.join()
+        finally:
+            self.stop()
+
+
+def _run_worker(index, pairs, reserved, ready, kwargs):
+    # keep only this worker's ends of the socket pairs, so that a peer
+    # exiting closes its sockets for good
+    reserved.close()
+    peers = []
+    for i, row in enumerate(pairs):
+        for sock in row:
+            if sock is None:
+                continue
+            if i == index:
+                peers.append(sock)
+            else:
+                sock.close()
+
+    async def main():
+        loop = asyncio.get_event_loop()
+        stopped = loop.create_future()
+        loop.add_signal_handler(signal.SIGTERM, stopped.cancel)
+        broker = ClusterBroker(peers=peers, **kwargs)
+        await broker.start()
+        ready.put(index)
+        try:
+            await stopped
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await broker.stop()
+
+    asyncio.run(main())
@@ -1,8 +1,6 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from __future__ import unicode_literals
-
 MSG_T = {
     # 0x00: 'reserved',
     0x01: 'connect',
@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from . import constant as _
+
+MAX_REMAIN_LENGTH = 268435455
+MAX_REMAIN_LENGTH_BYTES = 4
+
+
+def py_decode_remain_length(data):
+    multiplier = 1
+    length = 0
+    for digit in data[1:1 + MAX_REMAIN_LENGTH_BYTES]:
+        length += (digit & _.REMAIN_LEN_MASK) * multiplier
+        multiplier *= _.REMAIN_LEN_MULTIPLIER
+        if ((digit & _.REMAIN_LEN_NEXT_BYTE_MASK) == 0):
+            break
+    return length
+
+
+def py_encode_remain_length(x):
+    if x < 0 or x > MAX_REMAIN_LENGTH:
+        raise ValueError('remaining length out of range: %d' % x)
+    remaining_length = bytearray()
+    while True:
+        digit = x % _.REMAIN_LEN_MULTIPLIER
+        x = x // _.REMAIN_LEN_MULTIPLIER
+        if x > 0:
+            digit |= _.REMAIN_LEN_NEXT_BYTE_MASK
+        remaining_length.append(digit)
+        if x <= 0:
+            break
+    return bytes(remaining_length)
+
+
+def py_parse_header(data, offset=0):
+    # (first byte, remaining length, header size), or None if incomplete
+    if offset < 0:
+        raise ValueError('negative offset')
+    end = len(data)
+    multiplier = 1
+    length = 0
+    pos = offset + 1
+    while True:
+        if pos >= end:
+            return None
+        digit = data[pos]
+        length += (digit & _.REMAIN_LEN_MASK) * multiplier
+        pos += 1
+        if not digit & _.REMAIN_LEN_NEXT_BYTE_MASK:
+            break
+        if pos - offset > MAX_REMAIN_LENGTH_BYTES:
+            raise ValueError('malformed remaining length')
+        multiplier *= _.REMAIN_LEN_MULTIPLIER
+    return data[offset], length, pos - offset
+
+
+def py_split_frames(data, offset=0):
+    # Returns the (start, end) offsets of every complete frame from offset
+    # on, and the offset of the first byte that is not part of one. A
+    # malformed header only raises when it is the first one looked at.
+    frames = []
+    end = len(data)
+    while offset < end:
+        try:
+            header = py_parse_header(data, offset)
+        except ValueError:
+            if frames:
+                break
+            raise
+        if header is None:
+            break
+        frame_end = offset + header[2] + header[1]
+        if frame_end > end:
+            break
+        frames.append((offset, frame_end))
+        offset = frame_end
+    return frames, offset
+
+
+try:
+    from . import _speedups
+except ImportError:
+    _speedups = None
+
+if _speedups is not None:
+    decode_remain_length = _speedups.decode_remain_length
+    encode_remain_length = _speedups.encode_remain_length
+    parse_header = _speedups.parse_header
+    split_frames = _speedups.split_frames
+else:
+    decode_remain_length = py_decode_remain_length
+    encode_remain_length = py_encode_remain_length
+    parse_header = py_parse_header
+    split_frames = py_split_frames
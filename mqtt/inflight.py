@@ -0,0 +1,162 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict, deque
+
+from . import constant as _
+from .packet import Packet, ack_frame
+
+MAX_MESSAGE_ID = 0xFFFF
+
+# what an outgoing message id is waiting for
+AWAIT_PUBACK = 'puback'
+AWAIT_PUBREC = 'pubrec'
+AWAIT_PUBCOMP = 'pubcomp'
+
+
+class IdAllocator(object):
+    # Hands out message ids 1..65535 in O(1): ids that were never used come
+    # from a counter, released ones from a FIFO free list, so a freed id is
+    # reused as late as possible. A bitmap tells which ids are taken.
+
+    def __init__(self):
+        self._used = bytearray(MAX_MESSAGE_ID + 1)
+        self._free = deque()
+        self._next = 1
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, message_id):
+        return bool(self._used[message_id])
+
+    def allocate(self):
+        if self._free:
+            message_id = self._free.popleft()
+        elif self._next <= MAX_MESSAGE_ID:
+            message_id = self._next
+            self._next += 1
+        else:
+            raise RuntimeError('no free message id')
+        self._used[message_id] = 1
+        self._count += 1
+        return message_id
+
+    def release(self, message_id):
+        if not self._used[message_id]:
+            return False
+        self._used[message_id] = 0
+        self._free.append(message_id)
+        self._count -= 1
+        return True
+
+
+class _Inflight(object):
+
+    __slots__ = ('state', 'chunks', 'deadline')
+
+    def __init__(self, state, chunks, deadline):
+        self.state = state
+        self.chunks = chunks
+        self.deadline = deadline
+
+
+class InflightWindow(object):
+    # Outgoing QoS 1/2 handshakes of one session. Every state change pushes
+    # a message to the end of an OrderedDict with deadline now +
+    # retry_interval, so the dict stays sorted by deadline and expired()
+    # only looks at its head.
+
+    def __init__(self, retry_interval=20, max_inflight=None):
+        self.retryInterval = retry_interval
+        self.maxInflight = max_inflight
+        self.ids = IdAllocator()
+        self._messages = OrderedDict()
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __contains__(self, message_id):
+        return message_id in self._messages
+
+    def full(self):
+        return (self.maxInflight is not None and
+                len(self.ids) >= self.maxInflight)
+
+    def state(self, message_id):
+        message = self._messages.get(message_id)
+        return message.state if message is not None else None
+
+    def allocate(self):
+        if self.full():
+            raise RuntimeError('in-flight window full')
+        return self.ids.allocate()
+
+    def publish(self, message_id, qos, chunks, now):
+        # chunks of the PUBLISH frame sent with this message id
+        if qos == Packet.QOS_AT_LEAST_ONCE:
+            state = AWAIT_PUBACK
+        else:
+            state = AWAIT_PUBREC
+        self._messages[message_id] = _Inflight(
+            state, tuple(chunks), now + self.retryInterval)
+
+    def acknowledge(self, message_id):
+        # PUBACK for QoS 1
+        return self._finish(message_id, AWAIT_PUBACK)
+
+    def receive(self, message_id, now):
+        # PUBREC for QoS 2: returns the PUBREL frame to send, or None
+        message = self._messages.get(message_id)
+        if message is None:
+            return None
+        if message.state == AWAIT_PUBREC:
+            message.state = AWAIT_PUBCOMP
+            message.chunks = (ack_frame('pubrel', message_id),)
+        elif message.state != AWAIT_PUBCOMP:
+            return None
+        message.deadline = now + self.retryInterval
+        self._messages.move_to_end(message_id)
+        return message.chunks[0]
+
+    def complete(self, message_id):
+        # PUBCOMP for QoS 2
+        return self._finish(message_id, AWAIT_PUBCOMP)
+
+    def expired(self, now):
+        # (message id, chunks) to send again, oldest deadline first; a
+        # PUBLISH is resent with the dup flag set
+        resend = []
+        messages = self._messages
+        for i in range(len(messages)):
+            message_id, message = next(iter(messages.items()))
+            if message.deadline > now:
+                break
+            if (message.state != AWAIT_PUBCOMP and
+                    not message.chunks[0][0] & _.DUP_MASK):
+                header = bytearray(message.chunks[0])
+                header[0] |= _.DUP_MASK
+                message.chunks = (bytes(header),) + message.chunks[1:]
+            message.deadline = now + self.retryInterval
+            messages.move_to_end(message_id)
+            resend.append((message_id, message.chunks))
+        return resend
+
+    def nextDeadline(self):
+        for message in self._messages.values():
+            return message.deadline
+        return None
+
+    def clear(self):
+        for message_id in self._messages:
+            self.ids.release(message_id)
+        self._messages.clear()
+
+    def _finish(self, message_id, state):
+        message = self._messages.get(message_id)
+        if message is None or message.state != state:
+            return False
+        del self._messages[message_id]
+        self.ids.release(message_id)
+        return True
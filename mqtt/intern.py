@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+from collections import OrderedDict
+
+_UINT16 = struct.Struct('!H')
+
+
+class TopicCache(object):
+    # Interns topic names on both paths: decode() maps equal UTF-8 bytes to
+    # one shared str, encode() keeps the length-prefixed UTF-8 form of a
+    # str. Both maps are bounded and evict the oldest entry first; hits do
+    # not reorder, which keeps them to a single dict lookup.
+
+    def __init__(self, maxsize=100000, encoding='utf-8'):
+        self.maxsize = maxsize
+        self.encoding = encoding
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._decoded = OrderedDict()
+        self._encoded = OrderedDict()
+
+    def __len__(self):
+        return len(self._decoded) + len(self._encoded)
+
+    def stats(self):
+        return {
+            'decoded': len(self._decoded),
+            'encoded': len(self._encoded),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def decode(self, data):
+        # data may be a read-only memoryview, which hashes like bytes
+        topic = self._decoded.get(data)
+        if topic is not None:
+            self.hits += 1
+            return topic
+        self.misses += 1
+        data = bytes(data)
+        topic = str(data, self.encoding)
+        self._store(self._decoded, data, topic)
+        return topic
+
+    def encode(self, topic):
+        data = self._encoded.get(topic)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        data = topic.encode(self.encoding)
+        data = _UINT16.pack(len(data)) + data
+        self._store(self._encoded, topic, data)
+        return data
+
+    def clear(self):
+        self._decoded.clear()
+        self._encoded.clear()
+
+    def _store(self, cache, key, value):
+        if self.maxsize <= 0:
+            return
+        cache[key] = value
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+            self.evictions += 1
+
+
+# shared by Packet and PublishTemplate
+topic_cache = TopicCache()
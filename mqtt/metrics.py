@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+from bisect import bisect_left
+
+from .packet import Packet
+
+DECODE = 'in'
+ENCODE = 'out'
+
+# 1us .. ~1s, doubling
+LATENCY_BUCKETS = tuple(1e-6 * 2 ** i for i in range(21))
+# 16 B .. 256 MB, quadrupling
+SIZE_BUCKETS = tuple(4 ** i for i in range(2, 15))
+
+
+class Histogram(object):
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # the last count is for values above every bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        # (upper bound, count of values <= bound), ending with +Inf
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self):
+        return {'buckets': self.cumulative(), 'sum': self.sum,
+                'count': self.count}
+
+
+class _TypeStats(object):
+
+    __slots__ = ('packets', 'bytes', 'latency', 'size')
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+
+
+class Metrics(object):
+    # Observer counting packets and bytes per direction and packet type,
+    # with codec latency and frame size histograms. Subclasses can
+    # override decoded()/encoded() to label by anything in the packet.
+
+    def __init__(self):
+        self._stats = {DECODE: {}, ENCODE: {}}
+
+    def decoded(self, packet, size, seconds):
+        self._observe(DECODE, packet.mtype, size, seconds)
+
+    def encoded(self, packet, size, seconds):
+        self._observe(ENCODE, packet.mtype, size, seconds)
+
+    def reset(self):
+        self._stats = {DECODE: {}, ENCODE: {}}
+
+    def snapshot(self):
+        return dict(
+            (direction, dict(
+                (mtype, {
+                    'packets': stats.packets,
+                    'bytes': stats.bytes,
+                    'latency': stats.latency.snapshot(),
+                    'size': stats.size.snapshot(),
+                }) for mtype, stats in sorted(types.items())))
+            for direction, types in self._stats.items())
+
+    def prometheus(self, prefix='mqtt'):
+        lines = []
+        counters = (('packets_total', 'packets'), ('bytes_total', 'bytes'))
+        for name, attr in counters:
+            lines.append('# TYPE %s_%s counter' % (prefix, name))
+            for labels, stats in self._labelled():
+                lines.append('%s_%s{%s} %d' % (
+                    prefix, name, labels, getattr(stats, attr)))
+        histograms = (('codec_seconds', 'latency'),
+                      ('packet_size_bytes', 'size'))
+        for name, attr in histograms:
+            lines.append('# TYPE %s_%s histogram' % (prefix, name))
+            for labels, stats in self._labelled():
+                histogram = getattr(stats, attr)
+                for bound, count in histogram.cumulative():
+                    lines.append('%s_%s_bucket{%s,le="%s"} %d' % (
+                        prefix, name, labels, _format_bound(bound), count))
+                lines.append('%s_%s_sum{%s} %r' % (
+                    prefix, name, labels, histogram.sum))
+                lines.append('%s_%s_count{%s} %d' % (
+                    prefix, name, labels, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def _observe(self, direction, mtype, size, seconds):
+        types = self._stats[direction]
+        stats = types.get(mtype)
+        if stats is None:
+            stats = types[mtype] = _TypeStats()
+        stats.packets += 1
+        stats.bytes += size
+        stats.latency.observe(seconds)
+        stats.size.observe(size)
+
+    def _labelled(self):
+        for direction in (DECODE, ENCODE):
+            for mtype, stats in sorted(self._stats[direction].items()):
+                yield 'direction="%s",type="%s"' % (direction, mtype), stats
+
+
+def _format_bound(bound):
+    if bound == float('inf'):
+        return '+Inf'
+    return repr(bound)
+
+
+# Packet.fromData and Packet.encode as they are without an observer
+_from_data = Packet.__dict__['fromData']
+_encode = Packet.__dict__['encode']
+_observer = None
+
+
+def instrument(observer):
+    # Routes every Packet.fromData() and Packet.encode() through observer.
+    # The codec methods are swapped rather than checked on each call, so
+    # an uninstrumented process pays nothing.
+    global _observer
+    _observer = observer
+    decode = _from_data.__func__
+    encode = _encode
+    clock = time.perf_counter
+
+    def timed_from_data(cls, data, lazy=False):
+        started = clock()
+        packet = decode(cls, data, lazy)
+        observer.decoded(packet, len(data), clock() - started)
+        return packet
+
+    def timed_encode(self):
+        started = clock()
+        data = encode(self)
+        observer.encoded(self, len(data), clock() - started)
+        return data
+
+    Packet.fromData = classmethod(timed_from_data)
+    Packet.encode = timed_encode
+
+
+def uninstrument():
+    global _observer
+    _observer = None
+    Packet.fromData = _from_data
+    Packet.encode = _encode
+
+
+def current_observer():
+    return _observer
+
+
+def observe_frame(observer, chunks):
+    # Reports one frame sent from pre-encoded chunks, such as an ack or a
+    # PublishTemplate header and payload. Nothing was encoded to send it,
+    # so it counts with no codec time.
+    frame = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+    packet = _from_data.__func__(Packet, frame, True)
+    observer.encoded(packet, len(frame), 0.0)
@@ -1,30 +1,64 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from __future__ import unicode_literals
-import constant as _
-from util import decode_msb_lsb, encode_msb_lsb, gen_client_id
+import struct
+import sys
+from array import array
+
+from . import constant as _
+from .framing import (MAX_REMAIN_LENGTH_BYTES, decode_remain_length,
+                      encode_remain_length)
+from .intern import topic_cache
+from .util import decode_msb_lsb, encode_msb_lsb, gen_client_id
+from .validate import MalformedPacketError, PacketTypeError, validate_frame
+
+_UINT16 = struct.Struct('!H')
+# protocol version, connect flags, keep alive time
+_CONNECT_HEADER = struct.Struct('!BBH')
+# first byte, remaining length, message id
+_ACK_FRAME = struct.Struct('!BBH')
+_PUBLISH = _.MSG_CODES['publish']
+_ACK_CODES = frozenset(_.MSG_CODES[mtype] for mtype in (
+    'puback', 'pubrec', 'pubrel', 'pubcomp', 'unsuback'))
 
 
 class Packet(object):
 
+    __slots__ = ('dup', 'qos', 'retain')
+
+    mtype = None
+    mcode = None
+    payload = None
+
     _ENCODING = 'utf-8'
 
     QOS_AT_MOST_ONCE, QOS_AT_LEAST_ONCE, QOS_EXACTLY_ONCE = (0, 1, 2)
 
     _MSB_LSB_VALUE, _ONE_BYTE_VALUE, _ONE_WORD_VALUE = (0, 1, 2)
 
+    def __new__(cls, mtype=None, *args, **kwargs):
+        if cls is Packet and mtype is not None:
+            cls = _CLASSES[_.MSG_CODES[mtype]]
+        return object.__new__(cls)
+
     def __init__(
             self, mtype=None, dup=False, qos=QOS_AT_MOST_ONCE, retain=False,
             **kwargs):
-        self.mtype = mtype
         self.dup = dup
         self.qos = qos
         self.retain = retain
 
         if len(kwargs):
-            f = getattr(self, '_init%sPacket' % self.mtype.capitalize())
-            f(**kwargs)
+            self._INITIALIZERS[self.mcode](self, **kwargs)
+
+    def reset(self, **kwargs):
+        # reinitializes the packet in place, for reuse of pooled packets;
+        # initializers leave optional fields unset, so clear them all first
+        for name in self.__slots__:
+            if hasattr(self, name):
+                delattr(self, name)
+        self.__init__(**kwargs)
+        return self
 
     def _initConnectPacket(
             self, pname='MQIsdp', pversion=3, clean_session=True,
@@ -71,9 +105,12 @@ class Packet(object):
     def _initUnsubackPacket(self, message_id):
         self.messageId = message_id
 
-    def _initPublishPacket(self, topic, message, message_id=None):
+    def _initPublishPacket(
+            self, topic, message=None, message_id=None, payload=None):
         self.topic = topic
         self.message = message
+        if payload is not None:
+            self.payload = payload
         if message_id:
             self.messageId = message_id
 
@@ -93,18 +130,64 @@ class Packet(object):
         return "Packet(%s)" % self.mtype
 
     @classmethod
-    def fromData(cls, data):
-        if not isinstance(data, basestring):
+    def fromData(cls, data, lazy=False):
+        # slices of the frame may outlive this call, so it must be immutable
+        if not isinstance(data, bytes) and not (
+                isinstance(data, memoryview) and data.readonly):
             data = bytes(data)
-        packet = Packet(**cls.parseFirstByte(ord(data[0])))
+        data = memoryview(data)
+        packet = Packet(**cls.parseFirstByte(data[0]))
+        if packet.mcode in _ACK_CODES and len(data) == _ACK_FRAME.size:
+            packet.messageId = _ACK_FRAME.unpack_from(data)[2]
+            return packet
         remain_length = cls.calculateRemainLength(data)
-        data = buffer(data, len(data) - remain_length)
-        packet._parse(data)
+        try:
+            packet._parse(data[len(data) - remain_length:])
+        except (struct.error, IndexError) as e:
+            # a field runs past the end of the frame
+            raise MalformedPacketError('truncated %s: %s' % (packet.mtype, e))
+        if not lazy and packet.payload is not None:
+            packet.message = str(packet.payload, cls._ENCODING)
+        return packet
+
+    @classmethod
+    def fromDataStrict(cls, data, lazy=False):
+        # for untrusted peers: a frame fromData() would misread raises a
+        # MalformedPacketError subclass instead
+        validate_frame(data)
+        return cls.fromData(data, lazy)
+
+    @classmethod
+    def fromDataTrusted(cls, data):
+        # for peers known to send well-formed frames, such as another
+        # process of the same broker: data must be one complete frame as
+        # bytes or a read-only memoryview. Nothing is checked and the
+        # payload is left undecoded.
+        packet_class, dup, qos, retain = _FIRST_BYTES[data[0]]
+        packet = object.__new__(packet_class)
+        packet.dup = dup
+        packet.qos = qos
+        packet.retain = retain
+        mcode = packet_class.mcode
+        if mcode in _ACK_CODES:
+            packet.messageId = _ACK_FRAME.unpack_from(data)[2]
+            return packet
+        if mcode == _PUBLISH:
+            packet._message = None
+        remain_length = decode_remain_length(data)
+        f = cls._PARSERS.get(mcode)
+        if f:
+            with memoryview(data) as view:
+                f(packet, view[len(data) - remain_length:])
         return packet
 
     @classmethod
     def parseFirstByte(cls, byte):
-        mtype = _.MSG_T[byte >> _.MSG_T_SHIFT]
+        try:
+            mtype = _.MSG_T[byte >> _.MSG_T_SHIFT]
+        except KeyError:
+            raise PacketTypeError(
+                'reserved packet type %d' % (byte >> _.MSG_T_SHIFT))
         dup = bool((byte & _.DUP_MASK) >> _.DUP_SHIFT)
         qos = (byte & _.QOS_MASK) >> _.QOS_SHIFT
         retain = bool(byte & _.RETAIN_MASK)
@@ -112,10 +195,11 @@ class Packet(object):
 
     @classmethod
     def calculateRemainLength(self, data, max_byte_length=4):
+        if max_byte_length == MAX_REMAIN_LENGTH_BYTES:
+            return decode_remain_length(data)
         multiplier = 1
         length = 0
-        data = bytearray(buffer(data, 1, max_byte_length))
-        for digit in data:
+        for digit in data[1:1 + max_byte_length]:
             length += (digit & _.REMAIN_LEN_MASK) * multiplier
             multiplier *= _.REMAIN_LEN_MULTIPLIER
             if ((digit & _.REMAIN_LEN_NEXT_BYTE_MASK) == 0):
@@ -124,43 +208,48 @@ class Packet(object):
 
     def _parseNextValue(self, data, dtype=_MSB_LSB_VALUE):
         if dtype == self._MSB_LSB_VALUE:
-            length = decode_msb_lsb(ord(data[0]), ord(data[1]))
-            value = unicode(buffer(data, 2, length), self._ENCODING)
-            remain_data = buffer(data, length + 2)
+            length = decode_msb_lsb(data[0], data[1]) + 2
+            value = str(data[2:length], self._ENCODING)
+            remain_data = data[length:]
         elif dtype == self._ONE_BYTE_VALUE:
-            value = ord(data[0])
-            remain_data = buffer(data, 1)
+            value = data[0]
+            remain_data = data[1:]
         elif dtype == self._ONE_WORD_VALUE:
-            value = decode_msb_lsb(ord(data[0]), ord(data[1]))
-            remain_data = buffer(data, 2)
+            value = decode_msb_lsb(data[0], data[1])
+            remain_data = data[2:]
         return (value, remain_data)
 
+    def _parseString(self, data, offset):
+        length, = _UINT16.unpack_from(data, offset)
+        offset += _UINT16.size
+        end = offset + length
+        return str(data[offset:end], self._ENCODING), end
+
     def _parse(self, data):
-        f = getattr(self, '_parse%sData' % self.mtype.capitalize(), None)
+        f = self._PARSERS.get(self.mcode)
         if f:
-            f(data)
+            f(self, data)
 
     def _parseConnectData(self, data):
-        self.pname, data = self._parseNextValue(data)
-        self.pversion, data = self._parseNextValue(data, self._ONE_BYTE_VALUE)
+        self.pname, offset = self._parseString(data, 0)
+        self.pversion, connect_flag_b, self.keepAliveTime = \
+            _CONNECT_HEADER.unpack_from(data, offset)
+        offset += _CONNECT_HEADER.size
 
-        connect_flag_b, data = self._parseNextValue(data, self._ONE_BYTE_VALUE)
         cfd = self._parseConnectFlag(connect_flag_b)
         self.cleanSession = cfd['clean_session']
-
-        self.keepAliveTime, data = self._parseNextValue(
-            data, self._ONE_WORD_VALUE)
-        self.clientId, data = self._parseNextValue(data)
+        self.clientId, offset = self._parseString(data, offset)
 
         if cfd['will_flag']:
-            self.willTopic, data = self._parseNextValue(data)
-            self.willMessage, data = self._parseNextValue(data)
+            self.willTopic, offset = self._parseString(data, offset)
+            self.willMessage, offset = self._parseString(data, offset)
             self.willQOS = cfd['will_qos']
             self.willRetain = cfd['will_retain']
 
         if cfd['username_flag']:
-            self.username, data = self._parseNextValue(data)
-            self.password, data = self._parseNextValue(data)
+            self.username, offset = self._parseString(data, offset)
+        if cfd['password_flag']:
+            self.password, offset = self._parseString(data, offset)
 
     def _parseConnectFlag(self, byte):
         return {
@@ -177,7 +266,7 @@ class Packet(object):
         }
 
     def _parseConnackData(self, data):
-        self.returnCode = ord(data[1])
+        self.returnCode = data[1]
 
     def _parseSubscribeData(self, data):
         self.messageId, data = self._parseNextValue(
@@ -208,39 +297,35 @@ class Packet(object):
             self.topics.append(topic_name)
 
     def _parseUnsubackData(self, data):
-        self.messageId, data = self._parseNextValue(
-            data, self._ONE_WORD_VALUE)
+        self.messageId, = _UINT16.unpack_from(data)
 
     def _parsePublishData(self, data):
-        self.topic, data = self._parseNextValue(data)
+        offset = _UINT16.size + _UINT16.unpack_from(data)[0]
+        self.topic = topic_cache.decode(data[_UINT16.size:offset])
         if self.qos != self.QOS_AT_MOST_ONCE:
-            self.messageId, data = self._parseNextValue(
-                data, self._ONE_WORD_VALUE)
-        self.message = unicode(data, self._ENCODING)
+            self.messageId, = _UINT16.unpack_from(data, offset)
+            offset += _UINT16.size
+        self.payload = data[offset:]
 
     def _parsePubackData(self, data):
-        self.messageId, data = self._parseNextValue(
-            data, self._ONE_WORD_VALUE)
+        self.messageId, = _UINT16.unpack_from(data)
 
     def _parsePubrecData(self, data):
-        self.messageId, data = self._parseNextValue(
-            data, self._ONE_WORD_VALUE)
+        self.messageId, = _UINT16.unpack_from(data)
 
     def _parsePubrelData(self, data):
-        self.messageId, data = self._parseNextValue(
-            data, self._ONE_WORD_VALUE)
+        self.messageId, = _UINT16.unpack_from(data)
 
     def _parsePubcompData(self, data):
-        self.messageId, data = self._parseNextValue(
-            data, self._ONE_WORD_VALUE)
+        self.messageId, = _UINT16.unpack_from(data)
 
-    def __str__(self):
+    def __bytes__(self):
         return self.encode()
 
     def encode(self):
         first_byte = self._encodeFirstByte()
         remain_data = self._encodeData()
-        remain_length = self._encodeRemainLength(len(remain_data))
+        remain_length = encode_remain_length(len(remain_data))
 
         barray = bytearray()
         barray.append(first_byte)
@@ -248,65 +333,82 @@ class Packet(object):
         barray.extend(remain_data)
         return bytes(barray)
 
+    def encodeInto(self, buf, offset=0):
+        remain_data = self._encodeData()
+        remain_length = encode_remain_length(len(remain_data))
+        if offset + 1 + len(remain_length) + len(remain_data) > len(buf):
+            raise ValueError('buffer too small')
+        return self._writeFrame(
+            buf, offset, self._encodeFirstByte(), remain_length, remain_data)
+
+    @classmethod
+    def encodeMany(cls, packets):
+        frames = []
+        size = 0
+        for packet in packets:
+            remain_data = packet._encodeData()
+            remain_length = encode_remain_length(len(remain_data))
+            frames.append(
+                (packet._encodeFirstByte(), remain_length, remain_data))
+            size += 1 + len(remain_length) + len(remain_data)
+
+        buf = bytearray(size)
+        offset = 0
+        for first_byte, remain_length, remain_data in frames:
+            offset = cls._writeFrame(
+                buf, offset, first_byte, remain_length, remain_data)
+        return buf
+
+    @staticmethod
+    def _writeFrame(buf, offset, first_byte, remain_length, remain_data):
+        buf[offset] = first_byte
+        offset += 1
+        end = offset + len(remain_length)
+        buf[offset:end] = remain_length
+        offset = end
+        end = offset + len(remain_data)
+        buf[offset:end] = remain_data
+        return end
+
     def _encodeFirstByte(self):
-        b = _.MSG_CODES[self.mtype] << _.MSG_T_SHIFT
+        b = self.mcode << _.MSG_T_SHIFT
         b |= int(self.dup) << _.DUP_SHIFT
         b |= self.qos << _.QOS_SHIFT
         b |= int(self.retain)
         return b
 
     def _encodeRemainLength(self, x):
-        remaining_length = []
-        while True:
-            digit = x % _.REMAIN_LEN_MULTIPLIER
-            x = x / _.REMAIN_LEN_MULTIPLIER
-            if x > 0:
-                digit |= _.REMAIN_LEN_NEXT_BYTE_MASK
-            remaining_length.append(digit)
-            if x <= 0:
-                break
-        return remaining_length
+        return list(encode_remain_length(x))
 
     def _encodeData(self):
-        f = getattr(self, '_encode%sData' % self.mtype.capitalize(), None)
+        f = self._ENCODERS.get(self.mcode)
         if f:
-            return f()
+            return f(self)
         else:
             return bytearray()
 
     def _encodeConnectData(self):
         barray = bytearray()
-
-        v = self.pname.encode(self._ENCODING)
-        barray.extend(encode_msb_lsb(len(v)))
-        barray.extend(v)
-
-        barray.append(self.pversion)
-        barray.append(self._encodeConnectFlag())
-        barray.extend(encode_msb_lsb(self.keepAliveTime))
-
-        v = self.clientId.encode(self._ENCODING)
-        barray.extend(encode_msb_lsb(len(v)))
-        barray.extend(v)
+        self._encodeString(barray, self.pname)
+        barray.extend(_CONNECT_HEADER.pack(
+            self.pversion, self._encodeConnectFlag(), self.keepAliveTime))
+        self._encodeString(barray, self.clientId)
 
         if getattr(self, 'willTopic', None):
-            v = self.willTopic.encode(self._ENCODING)
-            barray.extend(encode_msb_lsb(len(v)))
-            barray.extend(v)
+            self._encodeString(barray, self.willTopic)
         if getattr(self, 'willMessage', None):
-            v = self.willMessage.encode(self._ENCODING)
-            barray.extend(encode_msb_lsb(len(v)))
-            barray.extend(v)
+            self._encodeString(barray, self.willMessage)
         if getattr(self, 'username', None):
-            v = self.username.encode(self._ENCODING)
-            barray.extend(encode_msb_lsb(len(v)))
-            barray.extend(v)
+            self._encodeString(barray, self.username)
         if getattr(self, 'password', None):
-            v = self.password.encode(self._ENCODING)
-            barray.extend(encode_msb_lsb(len(v)))
-            barray.extend(v)
+            self._encodeString(barray, self.password)
         return barray
 
+    def _encodeString(self, barray, value):
+        v = value.encode(self._ENCODING)
+        barray.extend(_UINT16.pack(len(v)))
+        barray.extend(v)
+
     def _encodeConnectFlag(self):
         byte = 0
         if getattr(self, 'username', None):
@@ -333,23 +435,22 @@ class Packet(object):
         barray = bytearray()
         barray.extend(encode_msb_lsb(self.messageId))
         for topic_name, qos in self.topics:
-            topic_name = topic_name.encode(self._ENCODING)
+            if isinstance(topic_name, str):
+                topic_name = topic_name.encode(self._ENCODING)
             barray.extend(encode_msb_lsb(len(topic_name)))
             barray.extend(topic_name)
             barray.append(qos)
         return barray
 
     def _encodePublishData(self):
-        barray = bytearray()
-        topic_name = self.topic.encode(self._ENCODING)
-        barray.extend(encode_msb_lsb(len(topic_name)))
-        barray.extend(topic_name)
-
+        barray = bytearray(topic_cache.encode(self.topic))
         if getattr(self, 'messageId', None):
             barray.extend(encode_msb_lsb(self.messageId))
 
-        message = self.message.encode(self._ENCODING)
-        barray.extend(message)
+        if self.payload is not None:
+            barray.extend(self.payload)
+        else:
+            barray.extend(self.message.encode(self._ENCODING))
         return barray
 
     def _encodeSubackData(self):
@@ -363,32 +464,276 @@ class Packet(object):
         barray = bytearray()
         barray.extend(encode_msb_lsb(self.messageId))
         for topic_name in self.topics:
-            topic_name = topic_name.encode(self._ENCODING)
+            if isinstance(topic_name, str):
+                topic_name = topic_name.encode(self._ENCODING)
             barray.extend(encode_msb_lsb(len(topic_name)))
             barray.extend(topic_name)
         return barray
 
     def _encodeUnsubackData(self):
-        barray = bytearray()
-        barray.extend(encode_msb_lsb(self.messageId))
-        return barray
+        return _UINT16.pack(self.messageId)
 
     def _encodePubackData(self):
-        barray = bytearray()
-        barray.extend(encode_msb_lsb(self.messageId))
-        return barray
+        return _UINT16.pack(self.messageId)
 
     def _encodePubrecData(self):
-        barray = bytearray()
-        barray.extend(encode_msb_lsb(self.messageId))
-        return barray
+        return _UINT16.pack(self.messageId)
 
     def _encodePubrelData(self):
-        barray = bytearray()
-        barray.extend(encode_msb_lsb(self.messageId))
-        return barray
+        return _UINT16.pack(self.messageId)
 
     def _encodePubcompData(self):
-        barray = bytearray()
-        barray.extend(encode_msb_lsb(self.messageId))
-        return barray
+        return _UINT16.pack(self.messageId)
+
+
+def _dispatch_table(name_format):
+    table = {}
+    for code, mtype in _.MSG_T.items():
+        f = Packet.__dict__.get(name_format % mtype.capitalize())
+        if f:
+            table[code] = f
+    return table
+
+
+Packet._INITIALIZERS = _dispatch_table('_init%sPacket')
+Packet._PARSERS = _dispatch_table('_parse%sData')
+Packet._ENCODERS = _dispatch_table('_encode%sData')
+
+
+class Connect(Packet):
+
+    __slots__ = ('pname', 'pversion', 'cleanSession', 'keepAliveTime',
+                 'clientId', 'willTopic', 'willMessage', 'willQOS',
+                 'willRetain', 'username', 'password')
+
+    mtype = 'connect'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Connack(Packet):
+
+    __slots__ = ('returnCode',)
+
+    mtype = 'connack'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Publish(Packet):
+
+    __slots__ = ('topic', 'messageId', 'payload', '_message')
+
+    mtype = 'publish'
+    mcode = _.MSG_CODES[mtype]
+
+    def __init__(self, *args, **kwargs):
+        self.payload = None
+        self._message = None
+        super(Publish, self).__init__(*args, **kwargs)
+
+    @property
+    def message(self):
+        if self._message is None and self.payload is not None:
+            self._message = str(self.payload, self._ENCODING)
+        return self._message
+
+    @message.setter
+    def message(self, value):
+        self._message = value
+        self.payload = None
+
+
+class Puback(Packet):
+
+    __slots__ = ('messageId',)
+
+    mtype = 'puback'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Pubrec(Packet):
+
+    __slots__ = ('messageId',)
+
+    mtype = 'pubrec'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Pubrel(Packet):
+
+    __slots__ = ('messageId',)
+
+    mtype = 'pubrel'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Pubcomp(Packet):
+
+    __slots__ = ('messageId',)
+
+    mtype = 'pubcomp'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Subscribe(Packet):
+
+    __slots__ = ('messageId', 'topics')
+
+    mtype = 'subscribe'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Suback(Packet):
+
+    __slots__ = ('messageId', 'grantedQos')
+
+    mtype = 'suback'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Unsubscribe(Packet):
+
+    __slots__ = ('messageId', 'topics')
+
+    mtype = 'unsubscribe'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Unsuback(Packet):
+
+    __slots__ = ('messageId',)
+
+    mtype = 'unsuback'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Pingreq(Packet):
+
+    __slots__ = ()
+
+    mtype = 'pingreq'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Pingresp(Packet):
+
+    __slots__ = ()
+
+    mtype = 'pingresp'
+    mcode = _.MSG_CODES[mtype]
+
+
+class Disconnect(Packet):
+
+    __slots__ = ()
+
+    mtype = 'disconnect'
+    mcode = _.MSG_CODES[mtype]
+
+
+_CLASSES = dict((cls.mcode, cls) for cls in (
+    Connect, Connack, Publish, Puback, Pubrec, Pubrel, Pubcomp, Subscribe,
+    Suback, Unsubscribe, Unsuback, Pingreq, Pingresp, Disconnect))
+
+# (class, dup, qos, retain) of every first byte with a known packet type
+_FIRST_BYTES = [None] * 256
+for _first_byte in range(256):
+    if _first_byte >> _.MSG_T_SHIFT in _CLASSES:
+        _FIRST_BYTES[_first_byte] = (
+            _CLASSES[_first_byte >> _.MSG_T_SHIFT],
+            bool(_first_byte & _.DUP_MASK),
+            (_first_byte & _.QOS_MASK) >> _.QOS_SHIFT,
+            bool(_first_byte & _.RETAIN_MASK))
+del _first_byte
+
+
+# frames that never change, and helpers for those that differ only in the
+# message id or return code, built without a Packet
+PINGREQ_FRAME = Pingreq().encode()
+PINGRESP_FRAME = Pingresp().encode()
+DISCONNECT_FRAME = Disconnect().encode()
+_CONNACK_FRAMES = dict(
+    (return_code, Connack(return_code=return_code).encode())
+    for return_code in range(_.CONNECT_NOT_AUTHORIZED + 1))
+# PUBREL is sent with QoS 1
+_ACK_FIRST_BYTES = dict(
+    (mtype, Packet(mtype, qos=int(mtype == 'pubrel'),
+                   message_id=0)._encodeFirstByte())
+    for mtype in ('puback', 'pubrec', 'pubrel', 'pubcomp', 'unsuback'))
+
+
+def connack_frame(return_code):
+    frame = _CONNACK_FRAMES.get(return_code)
+    if frame is None:
+        frame = Connack(return_code=return_code).encode()
+    return frame
+
+
+def ack_frame(mtype, message_id):
+    return _ACK_FRAME.pack(_ACK_FIRST_BYTES[mtype], 2, message_id)
+
+
+def _message_id_array(message_ids):
+    # copies ids from an array('H') or any other uint16 buffer, such as a
+    # NumPy array, as bytes; anything else goes through int conversion
+    try:
+        view = memoryview(message_ids)
+    except TypeError:
+        return array('H', message_ids)
+    with view:
+        if view.format != 'H':
+            return array('H', view.tolist())
+        ids = array('H')
+        ids.frombytes(view.cast('B'))
+        return ids
+
+
+def encode_acks(mtype, message_ids):
+    # the frames of one ack type for many message ids, in one buffer
+    ids = _message_id_array(message_ids)
+    buf = bytearray(_ACK_FRAME.size * len(ids))
+    _write_acks(buf, 0, mtype, ids)
+    return buf
+
+
+def encode_acks_into(buf, mtype, message_ids, offset=0):
+    ids = _message_id_array(message_ids)
+    end = offset + _ACK_FRAME.size * len(ids)
+    if end > len(buf):
+        raise ValueError('buffer too small')
+    _write_acks(buf, offset, mtype, ids)
+    return end
+
+
+def _write_acks(buf, offset, mtype, ids):
+    # slice assignments fill one column of the frames at a time
+    count = len(ids)
+    end = offset + _ACK_FRAME.size * count
+    if sys.byteorder == 'little':
+        ids.byteswap()
+    data = ids.tobytes()
+    with memoryview(buf) as view:
+        view[offset:end:4] = bytes((_ACK_FIRST_BYTES[mtype],)) * count
+        view[offset + 1:end:4] = b'\x02' * count
+        view[offset + 2:end:4] = data[0::2]
+        view[offset + 3:end:4] = data[1::2]
+
+
+def decode_acks(data, mtype):
+    # message ids of consecutive ack frames of one type, as array('H')
+    size = _ACK_FRAME.size
+    if len(data) % size:
+        raise ValueError('not a whole number of ack frames')
+    count = len(data) // size
+    with memoryview(data) as view:
+        view = view.cast('B')
+        if view[0::4] != bytes((_ACK_FIRST_BYTES[mtype],)) * count or \
+                view[1::4] != b'\x02' * count:
+            raise ValueError('not a sequence of %s frames' % mtype)
+        data = bytearray(2 * count)
+        data[0::2] = view[2::4]
+        data[1::2] = view[3::4]
+    ids = array('H')
+    ids.frombytes(data)
+    if sys.byteorder == 'little':
+        ids.byteswap()
+    return ids
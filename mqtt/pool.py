@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from . import constant as _
+from .metrics import current_observer
+from .packet import _ACK_FRAME, _CLASSES, Packet
+
+# frame size of each pooled type: acks carry a message id and nothing
+# else, pings carry nothing at all
+_FRAME_SIZES = dict(
+    [(_.MSG_CODES[mtype], _ACK_FRAME.size) for mtype in (
+        'puback', 'pubrec', 'pubrel', 'pubcomp', 'unsuback')] +
+    [(_.MSG_CODES[mtype], 2) for mtype in ('pingreq', 'pingresp')])
+
+
+class PacketPool(object):
+    # Free lists of the small packets a connection receives at the highest
+    # rate. decodeFrame() fills a released packet in place, reading the
+    # frame straight from the buffer; other frames go to Packet.fromData.
+    # A packet must not be used after it is released.
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._free = dict((mcode, []) for mcode in _FRAME_SIZES)
+
+    def __len__(self):
+        return sum(len(free) for free in self._free.values())
+
+    def acquire(self, mtype, **kwargs):
+        mcode = _.MSG_CODES[mtype]
+        free = self._free.get(mcode)
+        if free:
+            self.hits += 1
+            return free.pop().reset(**kwargs)
+        self.misses += 1
+        return Packet(mtype, **kwargs)
+
+    def release(self, packet):
+        free = self._free.get(packet.mcode)
+        if free is not None and len(free) < self.maxsize:
+            free.append(packet)
+
+    def decode(self, data, lazy=False):
+        return self.decodeFrame(data, 0, len(data), lazy)
+
+    def decodeFrame(self, buf, start, end, lazy=False):
+        first_byte = buf[start]
+        mcode = first_byte >> _.MSG_T_SHIFT
+        size = end - start
+        if _FRAME_SIZES.get(mcode) != size or buf[start + 1] != size - 2:
+            with memoryview(buf) as view:
+                frame = bytes(view[start:end])
+            return Packet.fromData(frame, lazy)
+
+        # pooled frames skip Packet.fromData, which metrics.instrument()
+        # wraps, so they are reported here
+        observer = current_observer()
+        if observer is not None:
+            started = time.perf_counter()
+        free = self._free[mcode]
+        if free:
+            self.hits += 1
+            packet = free.pop()
+        else:
+            self.misses += 1
+            packet = object.__new__(_CLASSES[mcode])
+        packet.dup = bool(first_byte & _.DUP_MASK)
+        packet.qos = (first_byte & _.QOS_MASK) >> _.QOS_SHIFT
+        packet.retain = bool(first_byte & _.RETAIN_MASK)
+        if size == _ACK_FRAME.size:
+            packet.messageId = _ACK_FRAME.unpack_from(buf, start)[2]
+        if observer is not None:
+            observer.decoded(packet, size, time.perf_counter() - started)
+        return packet
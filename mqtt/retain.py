@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from .packet import Packet
+from .template import PublishTemplate
+from .topic import (MULTI_LEVEL, SEPARATOR, SINGLE_LEVEL, SYSTEM_PREFIX,
+                    validate_filter)
+
+
+class _RetainNode(object):
+
+    __slots__ = ('children', 'message')
+
+    def __init__(self):
+        self.children = {}
+        self.message = None
+
+
+class RetainedStore(object):
+    # Last retained PUBLISH per topic, kept as a PublishTemplate with the
+    # retain flag set so replays only patch the message id. Topics are
+    # indexed level by level: a subscription filter visits the children
+    # its own levels select instead of every retained topic.
+
+    def __init__(self):
+        self._root = _RetainNode()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def retain(self, topic, payload, qos=Packet.QOS_AT_MOST_ONCE):
+        # an empty payload clears the retained message of the topic
+        if not len(payload):
+            self.remove(topic)
+            return
+        node = self._root
+        for level in topic.split(SEPARATOR):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _RetainNode()
+            node = child
+        if node.message is None:
+            self._count += 1
+        node.message = (PublishTemplate(topic, payload=payload, retain=True),
+                        qos)
+
+    def remove(self, topic):
+        path = []
+        node = self._root
+        for level in topic.split(SEPARATOR):
+            child = node.children.get(level)
+            if child is None:
+                return False
+            path.append((node, level))
+            node = child
+        if node.message is None:
+            return False
+        node.message = None
+        self._count -= 1
+
+        for parent, level in reversed(path):
+            if node.message is not None or node.children:
+                break
+            del parent.children[level]
+            node = parent
+        return True
+
+    def get(self, topic):
+        node = self._root
+        for level in topic.split(SEPARATOR):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node.message
+
+    def match(self, topic_filter):
+        # (template, qos) of every retained topic the filter matches
+        levels = validate_filter(topic_filter)
+        result = []
+        stack = [(self._root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth == len(levels):
+                if node.message is not None:
+                    result.append(node.message)
+                continue
+            level = levels[depth]
+            if level == MULTI_LEVEL:
+                # "a/#" matches "a" itself as well
+                if depth and node.message is not None:
+                    result.append(node.message)
+                self._collect(node, depth == 0, result)
+            elif level == SINGLE_LEVEL:
+                for name, child in node.children.items():
+                    if depth == 0 and name.startswith(SYSTEM_PREFIX):
+                        continue
+                    stack.append((child, depth + 1))
+            else:
+                child = node.children.get(level)
+                if child is not None:
+                    stack.append((child, depth + 1))
+        return result
+
+    def _collect(self, node, root, result):
+        stack = []
+        for name, child in node.children.items():
+            # wildcards at the first level do not match "$SYS"-like topics
+            if not (root and name.startswith(SYSTEM_PREFIX)):
+                stack.append(child)
+        while stack:
+            node = stack.pop()
+            if node.message is not None:
+                result.append(node.message)
+            stack.extend(node.children.values())
@@ -0,0 +1,329 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from . import constant as _
+from .framing import parse_header
+
+SYNC_ALWAYS = 'always'
+SYNC_INTERVAL = 'interval'
+SYNC_NEVER = 'never'
+
+_UINT16 = struct.Struct('!H')
+_UINT32 = struct.Struct('!I')
+_SEGMENT_SUFFIX = '.seg'
+_PUBLISH = _.MSG_CODES['publish']
+_PUBREL = _.MSG_CODES['pubrel']
+_PUBCOMP = _.MSG_CODES['pubcomp']
+
+
+class _Segment(object):
+
+    __slots__ = ('number', 'path', 'file', 'mm', 'end', 'synced', 'live',
+                 'liveBytes')
+
+    def __init__(self, number, path, size=None):
+        self.number = number
+        self.path = path
+        self.file = open(path, 'r+b' if size is None else 'w+b')
+        if size is not None:
+            self.file.truncate(size)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.end = 0
+        self.synced = 0
+        self.live = 0
+        self.liveBytes = 0
+
+    def sync(self):
+        if self.synced < self.end:
+            start = self.synced - self.synced % mmap.PAGESIZE
+            self.mm.flush(start, self.end - start)
+            self.synced = self.end
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+class MessageStore(object):
+    # Unacknowledged QoS 1/2 state as an append-only log of encoded frames,
+    # each followed by the owning client id as an MQTT string and a CRC-32
+    # of both, written last, so that recovery stops at a torn record
+    # instead of indexing whatever the crash left of it. PUBLISH and
+    # PUBREL frames are live entries; a PUBCOMP frame marks the message id
+    # acknowledged. Writes are copies into preallocated memory-mapped
+    # segments, so only the sync policy decides when a syscall happens.
+    #
+    # With SYNC_INTERVAL a write made within sync_interval of the last sync
+    # is synced by a timer on the running event loop, so a burst followed
+    # by silence is not left unsynced. Outside an event loop it waits for
+    # the next write, sync() or close().
+    #
+    # Segments are only ever deleted oldest first. A tombstone then never
+    # outlives the segment holding the entry it cancels.
+
+    def __init__(self, directory, segment_size=1 << 26, sync=SYNC_INTERVAL,
+                 sync_interval=0.05):
+        if sync not in (SYNC_ALWAYS, SYNC_INTERVAL, SYNC_NEVER):
+            raise ValueError('unknown sync policy: %s' % sync)
+        self.directory = directory
+        self.segmentSize = segment_size
+        self.syncPolicy = sync
+        self.syncInterval = sync_interval
+
+        self._segments = []
+        self._index = {}
+        self._count = 0
+        self._lastSync = time.monotonic()
+        self._syncTimer = None
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def __len__(self):
+        return self._count
+
+    def add(self, client_id, packet):
+        self.addFrame(client_id, packet.messageId, packet.encode())
+
+    def addFrame(self, client_id, message_id, *chunks):
+        # chunks of one PUBLISH or PUBREL frame, e.g. a template header and
+        # the shared payload
+        length = 0
+        for chunk in chunks:
+            length += len(chunk)
+        key = client_id.encode('utf-8')
+        segment, offset = self._append(chunks, length, key)
+        self._setEntry(client_id, message_id, segment, offset, length)
+        self._written()
+
+    def acknowledge(self, client_id, message_id):
+        entries = self._index.get(client_id)
+        if entries is None or message_id not in entries:
+            return False
+        tombstone = (bytes((_PUBCOMP << _.MSG_T_SHIFT, 2)) +
+                     _UINT16.pack(message_id))
+        self._append((tombstone,), len(tombstone),
+                     client_id.encode('utf-8'))
+        self._removeEntry(client_id, message_id)
+        self._written()
+        return True
+
+    def frame(self, client_id, message_id):
+        segment, offset, length = self._index[client_id][message_id]
+        return segment.mm[offset:offset + length]
+
+    def pending(self, client_id):
+        # (message id, frame) pairs in the order they were stored
+        for message_id, (segment, offset, length) in list(
+                self._index.get(client_id, {}).items()):
+            yield message_id, segment.mm[offset:offset + length]
+
+    def clients(self):
+        return list(self._index)
+
+    def sync(self):
+        if self._syncTimer is not None:
+            self._syncTimer.cancel()
+            self._syncTimer = None
+        for segment in self._segments:
+            segment.sync()
+        self._lastSync = time.monotonic()
+
+    def compact(self, threshold=0.5):
+        # Moves the live entries of the oldest sealed segments to the head
+        # of the log while less than threshold of their bytes are live.
+        moved = {}
+        for client_id, entries in self._index.items():
+            for message_id, (segment, offset, length) in entries.items():
+                moved.setdefault(segment, []).append(
+                    (client_id, message_id, offset, length))
+
+        compacted = []
+        for segment in self._segments[:-1]:
+            if segment.end and segment.liveBytes >= segment.end * threshold:
+                break
+            for client_id, message_id, offset, length in moved.get(
+                    segment, ()):
+                self.addFrame(client_id, message_id,
+                              segment.mm[offset:offset + length])
+            compacted.append(segment)
+        if not compacted:
+            return 0
+        # the copies must be durable before the originals go away
+        if self.syncPolicy != SYNC_NEVER:
+            self.sync()
+        for segment in compacted:
+            self._dropSegment(segment)
+        return len(compacted)
+
+    def close(self):
+        if self.syncPolicy != SYNC_NEVER:
+            self.sync()
+        for segment in self._segments:
+            segment.close()
+        self._segments = []
+
+    def _append(self, chunks, length, key):
+        size = length + _UINT16.size + len(key) + _UINT32.size
+        segment = self._segments[-1] if self._segments else None
+        if segment is None or segment.end + size > len(segment.mm):
+            segment = self._newSegment(size)
+        mm = segment.mm
+        offset = pos = segment.end
+        crc = 0
+        for chunk in chunks:
+            end = pos + len(chunk)
+            mm[pos:end] = chunk
+            crc = zlib.crc32(chunk, crc)
+            pos = end
+        key_length = _UINT16.pack(len(key))
+        crc = zlib.crc32(key, zlib.crc32(key_length, crc))
+        mm[pos:pos + _UINT16.size] = key_length
+        pos += _UINT16.size
+        mm[pos:pos + len(key)] = key
+        pos += len(key)
+        _UINT32.pack_into(mm, pos, crc)
+        segment.end = pos + _UINT32.size
+        return segment, offset
+
+    def _written(self):
+        if self.syncPolicy == SYNC_ALWAYS:
+            self.sync()
+        elif self.syncPolicy == SYNC_INTERVAL:
+            elapsed = time.monotonic() - self._lastSync
+            if elapsed >= self.syncInterval:
+                self.sync()
+            elif self._syncTimer is None:
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    return
+                self._syncTimer = loop.call_later(
+                    self.syncInterval - elapsed, self.sync)
+
+    def _setEntry(self, client_id, message_id, segment, offset, length):
+        entries = self._index.get(client_id)
+        if entries is None:
+            entries = self._index[client_id] = {}
+        previous = entries.get(message_id)
+        if previous is None:
+            self._count += 1
+        else:
+            # a PUBREL replaces the PUBLISH it releases
+            previous[0].live -= 1
+            previous[0].liveBytes -= previous[2]
+        entries[message_id] = (segment, offset, length)
+        segment.live += 1
+        segment.liveBytes += length
+
+    def _removeEntry(self, client_id, message_id):
+        entries = self._index.get(client_id)
+        if entries is None:
+            return
+        entry = entries.pop(message_id, None)
+        if entry is None:
+            return
+        if not entries:
+            del self._index[client_id]
+        self._count -= 1
+        segment = entry[0]
+        segment.live -= 1
+        segment.liveBytes -= entry[2]
+        # empty segments at the tail of the log can go right away
+        while len(self._segments) > 1 and not self._segments[0].live:
+            self._dropSegment(self._segments[0])
+
+    def _newSegment(self, size):
+        if self._segments and self.syncPolicy != SYNC_NEVER:
+            self._segments[-1].sync()
+        number = self._segments[-1].number + 1 if self._segments else 0
+        segment = _Segment(number, self._segmentPath(number),
+                           max(self.segmentSize, size))
+        self._segments.append(segment)
+        return segment
+
+    def _dropSegment(self, segment):
+        self._segments.remove(segment)
+        segment.close()
+        os.remove(segment.path)
+
+    def _segmentPath(self, number):
+        return os.path.join(self.directory,
+                            '%016d%s' % (number, _SEGMENT_SUFFIX))
+
+    def _recover(self):
+        numbers = sorted(
+            int(name[:-len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(_SEGMENT_SUFFIX))
+        for number in numbers:
+            path = self._segmentPath(number)
+            if not os.path.getsize(path):
+                # created but never sized before a crash
+                os.remove(path)
+                continue
+            segment = _Segment(number, path)
+            self._segments.append(segment)
+            self._replay(segment)
+        if self._segments:
+            # whatever a crash left past the last record must not be
+            # mistaken for records later on
+            segment = self._segments[-1]
+            segment.mm[segment.end:] = bytes(len(segment.mm) - segment.end)
+            segment.synced = 0
+            segment.sync()
+        while len(self._segments) > 1 and not self._segments[0].live:
+            self._dropSegment(self._segments[0])
+
+    def _replay(self, segment):
+        # Re-frames records by their remaining length. The log ends at a
+        # zero first byte (reserved packet type), or at a record that runs
+        # past the segment or fails its checksum.
+        mm = segment.mm
+        size = len(mm)
+        pos = 0
+        while pos < size and mm[pos]:
+            try:
+                header = parse_header(mm, pos)
+            except ValueError:
+                break
+            if header is None:
+                break
+            first_byte, remain_length, header_size = header
+            frame_end = pos + header_size + remain_length
+            if frame_end + _UINT16.size > size:
+                break
+            key_length, = _UINT16.unpack_from(mm, frame_end)
+            key_end = frame_end + _UINT16.size + key_length
+            if key_end + _UINT32.size > size:
+                break
+            if zlib.crc32(mm[pos:key_end]) != _UINT32.unpack_from(
+                    mm, key_end)[0]:
+                break
+            try:
+                client_id = str(mm[frame_end + _UINT16.size:key_end],
+                                'utf-8')
+            except UnicodeDecodeError:
+                break
+
+            mcode = first_byte >> _.MSG_T_SHIFT
+            id_offset = pos + header_size
+            if mcode == _PUBLISH:
+                id_offset += _UINT16.size + _UINT16.unpack_from(
+                    mm, id_offset)[0]
+            elif mcode != _PUBREL and mcode != _PUBCOMP:
+                break
+            message_id, = _UINT16.unpack_from(mm, id_offset)
+            if mcode == _PUBCOMP:
+                self._removeEntry(client_id, message_id)
+            else:
+                self._setEntry(client_id, message_id, segment, pos,
+                               frame_end - pos)
+            pos = key_end + _UINT32.size
+        segment.end = segment.synced = pos
@@ -0,0 +1,290 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+from collections import deque
+
+from . import constant as _
+from .framing import encode_remain_length, parse_header, split_frames
+from .intern import topic_cache
+from .packet import Packet, Publish
+from .util import encode_msb_lsb
+from .validate import (validate_first_byte, validate_frame,
+                       validate_publish_header)
+
+_PUBLISH = _.MSG_CODES['publish']
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+class PublishStream(object):
+    # Body of a large PUBLISH, handed out as soon as its variable header is
+    # known. The decoder pushes payload chunks as they arrive; iterating
+    # takes the chunks received so far, "async for" waits for the rest.
+
+    def __init__(self, packet, length):
+        self.packet = packet
+        self.length = length
+        self.received = 0
+        self.buffered = 0
+        self._chunks = deque()
+        self._waiter = None
+        self._discarded = False
+        self._error = None
+
+    def done(self):
+        return self.received == self.length
+
+    def __iter__(self):
+        while self._chunks:
+            yield self._pop()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        while True:
+            while self._chunks:
+                yield self._pop()
+            if self.done():
+                return
+            if self._error is not None:
+                raise self._error
+            await self._wait()
+
+    async def drained(self):
+        # for a reader that wants to stop reading until chunks are consumed
+        while self._chunks:
+            await self._wait()
+
+    def discard(self):
+        # the body of a redelivered QoS 2 message is read and dropped
+        self._discarded = True
+        self._chunks.clear()
+        self.buffered = 0
+        self._wake()
+
+    def abort(self, error):
+        # the body will never be complete
+        self._error = error
+        self._wake()
+
+    def _pop(self):
+        chunk = self._chunks.popleft()
+        self.buffered -= len(chunk)
+        self._wake()
+        return chunk
+
+    def _push(self, chunk):
+        if self._discarded:
+            self.received += len(chunk)
+        elif chunk:
+            self._chunks.append(chunk)
+            self.received += len(chunk)
+            self.buffered += len(chunk)
+        self._wake()
+
+    def _wait(self):
+        self._waiter = asyncio.get_event_loop().create_future()
+        return self._waiter
+
+    def _wake(self):
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+class StreamDecoder(object):
+    # Chunks are appended to one buffer and _offset marks the next fixed
+    # header; the consumed prefix is only dropped on the next feed() call.
+    # With a stream_threshold, a PUBLISH at least that long is yielded as a
+    # PublishStream and its body bypasses the buffer. With a PacketPool,
+    # acks and pings are decoded into pooled packets. With strict, every
+    # frame is checked as by Packet.fromDataStrict(); with trusted, frames
+    # go to Packet.fromDataTrusted() instead.
+
+    def __init__(self, lazy=False, stream_threshold=None, pool=None,
+                 strict=False, trusted=False):
+        self._buffer = bytearray()
+        self._offset = 0
+        self._generation = 0
+        self._lazy = lazy
+        self._streamThreshold = stream_threshold
+        self._stream = None
+        self._pool = pool
+        self._strict = strict
+        self._trusted = trusted
+
+    def __len__(self):
+        return len(self._buffer) - self._offset
+
+    def feed(self, data):
+        if self._offset:
+            del self._buffer[:self._offset]
+            self._offset = 0
+            self._generation += 1
+        if self._stream is not None:
+            data = self._streamBody(data)
+        self._buffer.extend(data)
+        return self._packets()
+
+    def _packets(self):
+        # a malformed header after complete frames raises on the next pass
+        threshold = self._streamThreshold
+        pool = self._pool
+        strict = self._strict
+        trusted = self._trusted
+        while self._stream is None:
+            frames = split_frames(self._buffer, self._offset)[0]
+            if not frames:
+                stream = self._startStream() if threshold else None
+                if stream is None:
+                    return
+                yield stream
+                continue
+            generation = self._generation
+            for start, end in frames:
+                if threshold and end - start >= threshold:
+                    stream = self._startStream()
+                    if stream is not None:
+                        yield stream
+                        break
+                self._offset = end
+                if strict:
+                    with memoryview(self._buffer) as view:
+                        validate_frame(view[start:end])
+                if pool is not None:
+                    packet = pool.decodeFrame(self._buffer, start, end,
+                                              self._lazy)
+                else:
+                    with memoryview(self._buffer) as view:
+                        frame = bytes(view[start:end])
+                    if trusted:
+                        packet = Packet.fromDataTrusted(frame)
+                    else:
+                        packet = Packet.fromData(frame, self._lazy)
+                yield packet
+                if self._generation != generation:
+                    # feed() was called meanwhile and dropped the consumed
+                    # prefix, so the remaining offsets are stale
+                    break
+
+    def _startStream(self):
+        buf = self._buffer
+        offset = self._offset
+        header = parse_header(buf, offset)
+        if header is None:
+            return None
+        first_byte, remain_length, header_size = header
+        if (first_byte >> _.MSG_T_SHIFT != _PUBLISH or
+                header_size + remain_length < self._streamThreshold):
+            return None
+
+        start = offset + header_size
+        frame_end = start + remain_length
+        if start + 2 > len(buf):
+            return None
+        variable_end = start + 2 + (buf[start] << 8 | buf[start + 1])
+        if first_byte & _.QOS_MASK:
+            variable_end += 2
+        if variable_end > len(buf):
+            return None
+        if self._strict:
+            validate_first_byte(first_byte)
+            with memoryview(buf) as view:
+                validate_publish_header(
+                    first_byte, view[start:min(variable_end, frame_end)])
+
+        packet = Packet(**Packet.parseFirstByte(first_byte))
+        packet._parse(bytes(buf[start:variable_end]))
+        packet.payload = None
+        stream = PublishStream(packet, frame_end - variable_end)
+        end = min(frame_end, len(buf))
+        stream._push(bytes(buf[variable_end:end]))
+        self._offset = end
+        if not stream.done():
+            self._stream = stream
+        return stream
+
+    def _streamBody(self, data):
+        stream = self._stream
+        size = stream.length - stream.received
+        if len(data) <= size:
+            stream._push(bytes(data))
+            data = b''
+        else:
+            with memoryview(data) as view:
+                stream._push(bytes(view[:size]))
+                data = bytes(view[size:])
+        if stream.done():
+            self._stream = None
+        return data
+
+
+def publish_header(topic, length, qos=Packet.QOS_AT_MOST_ONCE,
+                   message_id=None, dup=False, retain=False):
+    # everything of a PUBLISH frame before a payload of the given length
+    topic_data = topic_cache.encode(topic)
+    remain_length = len(topic_data) + length
+    if qos != Packet.QOS_AT_MOST_ONCE:
+        remain_length += 2
+    packet = Publish(qos=qos, dup=dup, retain=retain)
+    header = bytearray()
+    header.append(packet._encodeFirstByte())
+    header.extend(encode_remain_length(remain_length))
+    header.extend(topic_data)
+    if qos != Packet.QOS_AT_MOST_ONCE:
+        header.extend(encode_msb_lsb(message_id))
+    return bytes(header)
+
+
+def payload_chunks(source, length=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # (length, chunk iterator) of a bytes-like object, a binary file or an
+    # iterable of chunks; the length of the latter must be given. A length
+    # that can be checked against the source is checked here, before any
+    # of the frame is written.
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        if length is not None and length != len(source):
+            raise ValueError('payload of %d bytes does not match its '
+                             'length %d' % (len(source), length))
+        return len(source), iter((source,))
+    if hasattr(source, 'read'):
+        seekable = getattr(source, 'seekable', None)
+        if length is None or (seekable is not None and seekable()):
+            position = source.tell()
+            available = source.seek(0, os.SEEK_END) - position
+            source.seek(position)
+            if length is None:
+                length = available
+            elif length > available:
+                raise ValueError('file has %d bytes left, not %d' % (
+                    available, length))
+        return length, _read_chunks(source, length, chunk_size)
+    if length is None:
+        raise ValueError('length is required for an iterable payload')
+    return length, iter(source)
+
+
+def _read_chunks(source, length, chunk_size):
+    while length > 0:
+        chunk = source.read(min(chunk_size, length))
+        if not chunk:
+            return
+        length -= len(chunk)
+        yield chunk
+
+
+def iter_publish(topic, source, length=None, qos=Packet.QOS_AT_MOST_ONCE,
+                 message_id=None, dup=False, retain=False,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+    # the frame as header and payload chunks, never held whole in memory
+    length, chunks = payload_chunks(source, length, chunk_size)
+    yield publish_header(topic, length, qos, message_id, dup, retain)
+    sent = 0
+    for chunk in chunks:
+        sent += len(chunk)
+        if sent > length:
+            break
+        yield chunk
+    if sent != length:
+        raise ValueError('payload does not match its length %d' % length)
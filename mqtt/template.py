@@ -0,0 +1,55 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from . import constant as _
+from .framing import encode_remain_length
+from .intern import topic_cache
+from .packet import Packet, Publish
+from .util import encode_msb_lsb
+
+
+class PublishTemplate(object):
+    # Encodes topic and payload once; each subscriber frame only patches the
+    # first byte and the message id of a small prebuilt header. Headers are
+    # built per QoS level on first use, as most templates only see one.
+
+    __slots__ = ('topic', 'payload', 'retain', '_headers')
+
+    def __init__(self, topic, message=None, payload=None, retain=False):
+        if payload is None:
+            payload = message.encode(Packet._ENCODING)
+        self.topic = topic
+        self.payload = payload
+        self.retain = retain
+        self._headers = [None, None, None]
+
+    def header(self, qos=Packet.QOS_AT_MOST_ONCE, message_id=None, dup=False):
+        header = self._headers[qos]
+        if header is None:
+            header = self._headers[qos] = self._buildHeader(qos)
+        if qos == Packet.QOS_AT_MOST_ONCE and not dup:
+            return header
+
+        header = bytearray(header)
+        if dup:
+            header[0] |= _.DUP_MASK
+        if qos != Packet.QOS_AT_MOST_ONCE:
+            header[-2:] = encode_msb_lsb(message_id)
+        return bytes(header)
+
+    def _buildHeader(self, qos):
+        topic_data = topic_cache.encode(self.topic)
+        remain_length = len(topic_data) + len(self.payload)
+        if qos != Packet.QOS_AT_MOST_ONCE:
+            remain_length += 2
+
+        header = bytearray()
+        header.append(Publish(qos=qos, retain=self.retain)._encodeFirstByte())
+        header.extend(encode_remain_length(remain_length))
+        header.extend(topic_data)
+        if qos != Packet.QOS_AT_MOST_ONCE:
+            header.extend([0, 0])
+        return bytes(header)
+
+    def encode(self, qos=Packet.QOS_AT_MOST_ONCE, message_id=None, dup=False):
+        return self.header(qos, message_id, dup) + bytes(self.payload)
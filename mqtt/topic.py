@@ -0,0 +1,235 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+SEPARATOR = '/'
+SINGLE_LEVEL = '+'
+MULTI_LEVEL = '#'
+SYSTEM_PREFIX = '$'
+
+
+def validate_filter(topic_filter):
+    if not topic_filter:
+        raise ValueError('empty topic filter')
+    levels = topic_filter.split(SEPARATOR)
+    for i, level in enumerate(levels):
+        if level == MULTI_LEVEL:
+            if i != len(levels) - 1:
+                raise ValueError('"#" must be the last level: %s'
+                                 % topic_filter)
+        elif level != SINGLE_LEVEL and (
+                SINGLE_LEVEL in level or MULTI_LEVEL in level):
+            raise ValueError('wildcard must occupy a whole level: %s'
+                             % topic_filter)
+    return levels
+
+
+class _Node(object):
+
+    __slots__ = ('children', 'subscribers')
+
+    def __init__(self):
+        self.children = {}
+        self.subscribers = {}
+
+
+class TopicTrie(object):
+    # Subscription filters stored level by level; matching a topic only
+    # visits the literal, "+" and "#" children along its own levels.
+
+    def __init__(self):
+        self._root = _Node()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def insert(self, topic_filter, client, qos=0):
+        node = self._root
+        for level in validate_filter(topic_filter):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _Node()
+            node = child
+        if client not in node.subscribers:
+            self._count += 1
+        node.subscribers[client] = qos
+
+    def remove(self, topic_filter, client):
+        path = []
+        node = self._root
+        for level in topic_filter.split(SEPARATOR):
+            child = node.children.get(level)
+            if child is None:
+                return False
+            path.append((node, level))
+            node = child
+        if node.subscribers.pop(client, None) is None:
+            return False
+        self._count -= 1
+
+        for parent, level in reversed(path):
+            if node.subscribers or node.children:
+                break
+            del parent.children[level]
+            node = parent
+        return True
+
+    def match(self, topic):
+        result = {}
+        levels = topic.split(SEPARATOR)
+        # wildcards at the first level do not match "$SYS"-like topics
+        wildcards = not topic.startswith(SYSTEM_PREFIX)
+        nodes = [self._root]
+        for level in levels:
+            matched = []
+            for node in nodes:
+                children = node.children
+                if wildcards:
+                    child = children.get(MULTI_LEVEL)
+                    if child is not None:
+                        self._collect(child, result)
+                    child = children.get(SINGLE_LEVEL)
+                    if child is not None:
+                        matched.append(child)
+                child = children.get(level)
+                if child is not None:
+                    matched.append(child)
+            if not matched:
+                return result
+            nodes = matched
+            wildcards = True
+
+        for node in nodes:
+            self._collect(node, result)
+            child = node.children.get(MULTI_LEVEL)
+            if child is not None:
+                self._collect(child, result)
+        return result
+
+    def _collect(self, node, result):
+        for client, qos in node.subscribers.items():
+            if result.get(client, -1) < qos:
+                result[client] = qos
+
+
+class _CacheNode(object):
+
+    __slots__ = ('children', 'topic')
+
+    def __init__(self):
+        self.children = {}
+        self.topic = None
+
+
+class CachedTopicTrie(TopicTrie):
+    # match() results for recently published topics are kept in a bounded
+    # LRU. The cached topics are indexed level by level as well, so that a
+    # changed filter only invalidates the cached topics it matches.
+
+    def __init__(self, maxsize=10000):
+        super(CachedTopicTrie, self).__init__()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._cache = OrderedDict()
+        self._cachedTopics = _CacheNode()
+
+    def stats(self):
+        return {
+            'size': len(self._cache),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    def insert(self, topic_filter, client, qos=0):
+        super(CachedTopicTrie, self).insert(topic_filter, client, qos)
+        self._invalidate(topic_filter)
+
+    def remove(self, topic_filter, client):
+        removed = super(CachedTopicTrie, self).remove(topic_filter, client)
+        if removed:
+            self._invalidate(topic_filter)
+        return removed
+
+    def match(self, topic):
+        cache = self._cache
+        result = cache.get(topic)
+        if result is not None:
+            cache.move_to_end(topic)
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        result = cache[topic] = super(CachedTopicTrie, self).match(topic)
+        node = self._cachedTopics
+        for level in topic.split(SEPARATOR):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _CacheNode()
+            node = child
+        node.topic = topic
+
+        if len(cache) > self.maxsize:
+            evicted = cache.popitem(last=False)[0]
+            self._discard(evicted)
+            self.evictions += 1
+        return result
+
+    def _invalidate(self, topic_filter):
+        levels = topic_filter.split(SEPARATOR)
+        topics = []
+        stack = [(self._cachedTopics, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth == len(levels):
+                if node.topic is not None:
+                    topics.append(node.topic)
+                continue
+            level = levels[depth]
+            if level == MULTI_LEVEL or level == SINGLE_LEVEL:
+                for name, child in node.children.items():
+                    if depth == 0 and name.startswith(SYSTEM_PREFIX):
+                        continue
+                    if level == SINGLE_LEVEL:
+                        stack.append((child, depth + 1))
+                    else:
+                        self._collectTopics(child, topics)
+                if level == MULTI_LEVEL and node.topic is not None:
+                    topics.append(node.topic)
+            else:
+                child = node.children.get(level)
+                if child is not None:
+                    stack.append((child, depth + 1))
+
+        for topic in topics:
+            del self._cache[topic]
+            self._discard(topic)
+        self.invalidations += len(topics)
+
+    def _collectTopics(self, node, topics):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.topic is not None:
+                topics.append(node.topic)
+            stack.extend(node.children.values())
+
+    def _discard(self, topic):
+        path = []
+        node = self._cachedTopics
+        for level in topic.split(SEPARATOR):
+            path.append((node, level))
+            node = node.children[level]
+        node.topic = None
+        for parent, level in reversed(path):
+            if node.topic is not None or node.children:
+                break
+            del parent.children[level]
+            node = parent
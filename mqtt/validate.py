@@ -0,0 +1,212 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+
+from . import constant as _
+from .framing import parse_header
+
+_UINT16 = struct.Struct('!H')
+_CONNECT_RESERVED_MASK = 0x01
+_SUBSCRIBE_FAILURE = 0x80
+
+
+class MalformedPacketError(ValueError):
+    pass
+
+
+class PacketTypeError(MalformedPacketError):
+    # reserved packet types 0 and 15
+    pass
+
+
+class FlagsError(MalformedPacketError):
+    # reserved fixed header or connect flag bits set, or QoS 3
+    pass
+
+
+class RemainingLengthError(MalformedPacketError):
+    # a malformed remaining length, or one that does not match the frame
+    pass
+
+
+class StringError(MalformedPacketError):
+    # a string running past its field, or not valid UTF-8
+    pass
+
+
+def validate_frame(data):
+    # Checks everything Packet.fromData() takes on trust in one complete
+    # frame, raising a MalformedPacketError subclass for the first problem.
+    try:
+        header = parse_header(data)
+    except ValueError as e:
+        raise RemainingLengthError(str(e))
+    if header is None:
+        raise RemainingLengthError('incomplete fixed header')
+    first_byte, remain_length, header_size = header
+    if header_size + remain_length != len(data):
+        raise RemainingLengthError(
+            'remaining length %d, but %d bytes follow the fixed header' % (
+                remain_length, len(data) - header_size))
+    validate_first_byte(first_byte)
+    with memoryview(data) as view:
+        _VALIDATORS[first_byte >> _.MSG_T_SHIFT](
+            first_byte, view[header_size:])
+
+
+def validate_first_byte(first_byte):
+    mcode = first_byte >> _.MSG_T_SHIFT
+    if mcode not in _.MSG_T:
+        raise PacketTypeError('reserved packet type %d' % mcode)
+    if (first_byte & _.QOS_MASK) >> _.QOS_SHIFT > 2:
+        raise FlagsError('QoS 3')
+    flags = first_byte & 0x0F
+    if mcode == _PUBLISH:
+        return
+    if mcode in _QOS_1_TYPES:
+        # MQTT 3.1 sets DUP when these are sent again
+        if flags & ~_.DUP_MASK != 1 << _.QOS_SHIFT:
+            raise FlagsError('%s flags 0x%x' % (_.MSG_T[mcode], flags))
+    elif flags:
+        raise FlagsError('%s flags 0x%x' % (_.MSG_T[mcode], flags))
+
+
+def validate_publish_header(first_byte, data):
+    # the variable header of a PUBLISH, whose payload may not have arrived
+    offset = _topic_name(data, 0)
+    if first_byte & _.QOS_MASK:
+        offset = _message_id(data, offset)
+    return offset
+
+
+def _string(data, offset):
+    if offset + _UINT16.size > len(data):
+        raise StringError('string length past the end of the packet')
+    length, = _UINT16.unpack_from(data, offset)
+    offset += _UINT16.size
+    end = offset + length
+    if end > len(data):
+        raise StringError('string of %d bytes runs past the end' % length)
+    try:
+        value = str(data[offset:end], 'utf-8')
+    except UnicodeDecodeError as e:
+        raise StringError('invalid UTF-8: %s' % e)
+    if '\x00' in value:
+        raise StringError('string contains U+0000')
+    return value, end
+
+
+def _topic_name(data, offset):
+    topic, offset = _string(data, offset)
+    if not topic:
+        raise MalformedPacketError('empty topic name')
+    if '+' in topic or '#' in topic:
+        raise MalformedPacketError('wildcard in topic name %r' % topic)
+    return offset
+
+
+def _message_id(data, offset):
+    if offset + _UINT16.size > len(data):
+        raise MalformedPacketError('message id past the end of the packet')
+    if _UINT16.unpack_from(data, offset)[0] == 0:
+        raise MalformedPacketError('message id 0')
+    return offset + _UINT16.size
+
+
+def _end(mtype, data, offset):
+    if offset != len(data):
+        raise MalformedPacketError('%d bytes after the %s fields' % (
+            len(data) - offset, mtype))
+
+
+def _validate_connect(first_byte, data):
+    offset = _string(data, 0)[1]
+    if offset + 4 > len(data):
+        raise MalformedPacketError('truncated connect header')
+    flags = data[offset + 1]
+    offset += 4
+    if flags & _CONNECT_RESERVED_MASK:
+        raise FlagsError('reserved connect flag')
+    will_qos = (flags & _.WILL_QOS_MASK) >> _.WILL_QOS_SHIFT
+    if will_qos > 2:
+        raise FlagsError('will QoS 3')
+    offset = _string(data, offset)[1]
+    if flags & _.WILL_FLAG_MASK:
+        offset = _topic_name(data, offset)
+        offset = _string(data, offset)[1]
+    elif flags & (_.WILL_QOS_MASK | _.WILL_RETAIN_MASK):
+        raise FlagsError('will QoS or retain without a will')
+    if flags & _.USERNAME_FLAG_MASK:
+        offset = _string(data, offset)[1]
+    elif flags & _.PASSWORD_FLAG_MASK:
+        raise FlagsError('password without a username')
+    if flags & _.PASSWORD_FLAG_MASK:
+        offset = _string(data, offset)[1]
+    _end('connect', data, offset)
+
+
+def _validate_connack(first_byte, data):
+    if len(data) != 2:
+        raise MalformedPacketError('connack of %d bytes' % len(data))
+
+
+def _validate_publish(first_byte, data):
+    validate_publish_header(first_byte, data)
+
+
+def _validate_ack(first_byte, data):
+    _end(_.MSG_T[first_byte >> _.MSG_T_SHIFT], data, _message_id(data, 0))
+
+
+def _validate_subscribe(first_byte, data):
+    offset = _message_id(data, 0)
+    if offset == len(data):
+        raise MalformedPacketError('subscribe without topics')
+    while offset < len(data):
+        offset = _string(data, offset)[1]
+        if offset >= len(data):
+            raise MalformedPacketError('topic filter without QoS')
+        if data[offset] > 2:
+            raise FlagsError('requested QoS byte 0x%x' % data[offset])
+        offset += 1
+
+
+def _validate_suback(first_byte, data):
+    offset = _message_id(data, 0)
+    for qos in data[offset:]:
+        if qos > 2 and qos != _SUBSCRIBE_FAILURE:
+            raise FlagsError('granted QoS byte 0x%x' % qos)
+
+
+def _validate_unsubscribe(first_byte, data):
+    offset = _message_id(data, 0)
+    if offset == len(data):
+        raise MalformedPacketError('unsubscribe without topics')
+    while offset < len(data):
+        offset = _string(data, offset)[1]
+
+
+def _validate_empty(first_byte, data):
+    _end(_.MSG_T[first_byte >> _.MSG_T_SHIFT], data, 0)
+
+
+_PUBLISH = _.MSG_CODES['publish']
+_QOS_1_TYPES = frozenset(
+    _.MSG_CODES[mtype] for mtype in ('pubrel', 'subscribe', 'unsubscribe'))
+_VALIDATORS = {
+    _.MSG_CODES['connect']: _validate_connect,
+    _.MSG_CODES['connack']: _validate_connack,
+    _.MSG_CODES['publish']: _validate_publish,
+    _.MSG_CODES['puback']: _validate_ack,
+    _.MSG_CODES['pubrec']: _validate_ack,
+    _.MSG_CODES['pubrel']: _validate_ack,
+    _.MSG_CODES['pubcomp']: _validate_ack,
+    _.MSG_CODES['subscribe']: _validate_subscribe,
+    _.MSG_CODES['suback']: _validate_suback,
+    _.MSG_CODES['unsubscribe']: _validate_unsubscribe,
+    _.MSG_CODES['unsuback']: _validate_ack,
+    _.MSG_CODES['pingreq']: _validate_empty,
+    _.MSG_CODES['pingresp']: _validate_empty,
+    _.MSG_CODES['disconnect']: _validate_empty,
+}
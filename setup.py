@@ -0,0 +1,14 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from setuptools import Extension, setup
+
+setup(
+    name='mqtt',
+    packages=['mqtt'],
+    python_requires='>=3.7',
+    # pure Python fallbacks in mqtt.framing are used when this fails to build
+    ext_modules=[
+        Extension('mqtt._speedups', ['mqtt/_speedups.c'], optional=True),
+    ],
+)
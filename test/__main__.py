@@ -9,6 +9,21 @@ sys.path.insert(0, path)
 
 import unittest
 from test.packet import TestPacket
+from test.stream import TestStreamDecoder
+from test.framing import TestFraming
+from test.capture import TestCapture
+from test.store import TestMessageStore
+from test.inflight import TestIdAllocator, TestInflightWindow
+from test.template import TestPublishTemplate
+from test.topic import TestTopicTrie, TestCachedTopicTrie
+from test.retain import TestRetainedStore
+from test.intern import TestTopicCache
+from test.metrics import TestMetrics
+from test.pool import TestPacketPool
+from test.validate import TestValidation
+from test.client import TestClient
+from test.broker import TestBroker
+from test.cluster import TestCluster
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,373 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import io
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt import constant
+from mqtt.broker import Broker
+from mqtt.client import ConnectError
+from mqtt.packet import Packet
+from mqtt.stream import PublishStream, StreamDecoder
+from test.util import connected, run
+
+
+class TestBroker(unittest.TestCase):
+
+    def test_connect_return_codes(self):
+        def authenticate(packet):
+            if getattr(packet, 'username', None) != 'admin':
+                return constant.CONNECT_BAD_USERNAME_OR_PASSWORD
+            return constant.CONNECT_ACCEPTED
+
+        async def refused(port, **kwargs):
+            with self.assertRaises(ConnectError) as cm:
+                await connected(port, **kwargs)
+            return cm.exception.returnCode
+
+        async def main():
+            broker = Broker(port=0, authenticate=authenticate,
+                            max_connections=1)
+            port = await broker.start()
+
+            self.assertEqual(
+                await refused(port, username='guest', password='x'),
+                constant.CONNECT_BAD_USERNAME_OR_PASSWORD)
+            self.assertEqual(
+                await refused(port, pversion=5, username='admin'),
+                constant.CONNECT_UNACCEPTABLE_PROTOCOL_VERSION)
+            self.assertEqual(
+                await refused(port, client_id='x' * 24, username='admin'),
+                constant.CONNECT_IDENTIFIER_REJECTED)
+
+            client = await connected(port, username='admin', password='x')
+            self.assertEqual(list(broker.sessions), [client.clientId])
+            self.assertEqual(
+                await refused(port, username='admin', password='x'),
+                constant.CONNECT_SERVER_UNAVAILABLE)
+
+            await client.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_routing(self):
+        async def main():
+            broker = Broker(port=0)
+            port = await broker.start()
+            subscribers = [await connected(port) for i in range(3)]
+            publisher = await connected(port)
+
+            self.assertEqual(
+                await subscribers[0].subscribe([('a/b', 0)]), [0])
+            self.assertEqual(
+                await subscribers[1].subscribe([('a/b', 1)]), [1])
+            self.assertEqual(
+                await subscribers[2].subscribe([('a/b', 2), ('c/d', 2)]),
+                [2, 2])
+
+            for qos in (0, 1, 2):
+                await publisher.publish('a/b', '消息%d' % qos, qos=qos)
+            for i, subscriber in enumerate(subscribers):
+                for qos in (0, 1, 2):
+                    packet = await subscriber.messages.get()
+                    self.assertEqual(packet.topic, 'a/b')
+                    self.assertEqual(packet.message, '消息%d' % qos)
+                    self.assertEqual(packet.qos, min(qos, i))
+            await asyncio.sleep(0.1)
+            for session in broker.sessions.values():
+                self.assertEqual(len(session.inflight), 0)
+                self.assertEqual(len(session.inflight.ids), 0)
+
+            await subscribers[2].unsubscribe(['a/b'])
+            await publisher.publish('a/b', 'dropped', qos=1)
+            await publisher.publish('c/d', 'delivered', qos=1)
+            packet = await subscribers[2].messages.get()
+            self.assertEqual(packet.message, 'delivered')
+
+            for client in subscribers + [publisher]:
+                await client.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_wildcard_routing(self):
+        async def main():
+            broker = Broker(port=0)
+            port = await broker.start()
+            subscriber = await connected(port)
+            publisher = await connected(port)
+
+            granted = await subscriber.subscribe(
+                [('s/+/temp', 1), ('s/1/#', 0), ('s/#/x', 1)])
+            self.assertEqual(granted, [1, 0, Broker.SUBSCRIBE_FAILURE])
+            await publisher.publish('s/1/temp', 'both', qos=1)
+            await publisher.publish('s/2/temp', 'single', qos=1)
+            await publisher.publish('s/1/humidity', 'multi', qos=1)
+            await publisher.publish('s/2/humidity', 'none', qos=1)
+            await publisher.publish('s', 'none', qos=1)
+
+            received = []
+            for i in range(3):
+                packet = await subscriber.messages.get()
+                received.append((packet.topic, packet.message, packet.qos))
+            self.assertEqual(received, [
+                ('s/1/temp', 'both', 1), ('s/2/temp', 'single', 1),
+                ('s/1/humidity', 'multi', 0)])
+
+            await subscriber.unsubscribe(['s/+/temp', 's/1/#'])
+            self.assertEqual(len(broker._subscriptions), 0)
+
+            await subscriber.disconnect()
+            await publisher.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_keep_alive_timeout_and_will(self):
+        async def main():
+            broker = Broker(port=0)
+            port = await broker.start()
+            watcher = await connected(port)
+            await watcher.subscribe([('status', 0)])
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(Packet(
+                'connect', client_id='silent', keep_alive_time=1,
+                will_topic='status', will_message='gone').encode())
+            decoder = StreamDecoder()
+            packets = list(decoder.feed(await reader.read(4)))
+            self.assertEqual(packets[0].mtype, 'connack')
+            self.assertTrue('silent' in broker.sessions)
+
+            self.assertEqual(await reader.read(), b'')
+            self.assertFalse('silent' in broker.sessions)
+            packet = await watcher.messages.get()
+            self.assertEqual(packet.message, 'gone')
+            writer.close()
+
+            await watcher.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_connect_timeout(self):
+        async def main():
+            broker = Broker(port=0, connect_timeout=0.2)
+            port = await broker.start()
+            # a connection that never completes its CONNECT
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(Packet('connect', client_id='slow').encode()[:5])
+            self.assertEqual(await reader.read(), b'')
+            self.assertEqual(len(broker._tasks), 0)
+            writer.close()
+
+            # the timeout ends with the CONNECT
+            client = await connected(port)
+            await asyncio.sleep(0.3)
+            await client.publish('x', 'still connected', qos=1)
+            await client.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_client_id_takeover(self):
+        async def main():
+            broker = Broker(port=0)
+            port = await broker.start()
+            first = await connected(port, client_id='device')
+            second = await connected(port, client_id='device')
+            await first.waitClosed()
+            self.assertTrue(broker.sessions['device'] is not None)
+            await second.publish('x', 'still connected', qos=1)
+            await second.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_retained_messages(self):
+        async def main():
+            broker = Broker(port=0)
+            port = await broker.start()
+            publisher = await connected(port)
+            await publisher.publish('s/1/temp', '20', qos=1, retain=True)
+            await publisher.publish('s/2/temp', '21', qos=0, retain=True)
+            await publisher.publish('s/3/temp', '22', qos=1, retain=True)
+            await publisher.publish('s/3/temp', payload=b'', qos=1,
+                                    retain=True)
+            await asyncio.sleep(0.1)
+            self.assertEqual(len(broker.retained), 2)
+
+            subscriber = await connected(port)
+            await subscriber.subscribe([('s/+/temp', 1)])
+            received = {}
+            for i in range(2):
+                packet = await subscriber.messages.get()
+                received[packet.topic] = (packet.message, packet.qos,
+                                          packet.retain)
+            self.assertEqual(received, {
+                's/1/temp': ('20', 1, True), 's/2/temp': ('21', 0, True)})
+
+            # live deliveries of retained publishes are not flagged
+            await publisher.publish('s/1/temp', '23', qos=1, retain=True)
+            packet = await subscriber.messages.get()
+            self.assertEqual((packet.message, packet.retain), ('23', False))
+            self.assertEqual(
+                bytes(broker.retained.get('s/1/temp')[0].payload), b'23')
+
+            await subscriber.disconnect()
+            await publisher.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_retransmission(self):
+        async def main():
+            broker = Broker(port=0, retry_interval=1)
+            port = await broker.start()
+            publisher = await connected(port)
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(Packet('connect', client_id='slow').encode())
+            writer.write(Packet('subscribe', qos=1, message_id=1,
+                                topics=[('a', 1)]).encode())
+            decoder = StreamDecoder()
+            received = []
+            while len(received) < 2:
+                received.extend(decoder.feed(await reader.read(1024)))
+            await publisher.publish('a', 'unacknowledged', qos=1)
+
+            # not acknowledged: sent again with dup once the retry expires
+            packets = []
+            while len(packets) < 2:
+                packets.extend(decoder.feed(await reader.read(1024)))
+            self.assertEqual([(p.message, p.dup) for p in packets], [
+                ('unacknowledged', False), ('unacknowledged', True)])
+            self.assertEqual(packets[0].messageId, packets[1].messageId)
+
+            writer.write(Packet(
+                'puback', message_id=packets[0].messageId).encode())
+            await asyncio.sleep(0.1)
+            self.assertEqual(len(broker.sessions['slow'].inflight), 0)
+            writer.close()
+
+            await publisher.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_inflight_window_full(self):
+        async def main():
+            broker = Broker(port=0)
+            port = await broker.start()
+            subscriber = await connected(port, keep_alive_time=0)
+            await subscriber.subscribe([('a', 1)])
+            publisher = await connected(port)
+            session = broker.sessions[subscriber.clientId]
+
+            # a subscriber holding every message id unacknowledged
+            for i in range(0xFFFF):
+                session.inflight.ids.allocate()
+            await publisher.publish('a', 'dropped', qos=1)
+            await publisher.publish('a', 'dropped', qos=1)
+            self.assertEqual(session.dropped, 2)
+            self.assertTrue(publisher.connected)
+
+            session.inflight.ids.release(1)
+            await publisher.publish('a', 'delivered', qos=1)
+            packet = await subscriber.messages.get()
+            self.assertEqual((packet.message, packet.messageId),
+                             ('delivered', 1))
+
+            await subscriber.disconnect()
+            await publisher.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_streamed_publish(self):
+        image = bytes(range(256)) * 4096
+
+        async def main():
+            broker = Broker(port=0)
+            port = await broker.start()
+            subscriber = await connected(port, stream_threshold=1 << 16)
+            await subscriber.subscribe([('fw', 1), ('small', 1)])
+            publisher = await connected(port)
+
+            # small publishes issued meanwhile are not interleaved
+            await asyncio.gather(
+                publisher.publishStream('fw', io.BytesIO(image), qos=1,
+                                        chunk_size=1 << 14),
+                publisher.publish('small', 'message', qos=1))
+
+            items = [await subscriber.messages.get() for i in range(2)]
+            streams = [i for i in items if isinstance(i, PublishStream)]
+            stream, = streams
+            self.assertEqual((stream.packet.topic, stream.length),
+                             ('fw', len(image)))
+            body = bytearray()
+            async for chunk in stream:
+                body.extend(chunk)
+            self.assertEqual(bytes(body), image)
+            await asyncio.sleep(0.1)
+            self.assertEqual(len(broker.sessions[subscriber.clientId]
+                                 .inflight), 0)
+
+            await subscriber.disconnect()
+            await publisher.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_malformed_packet(self):
+        # a wildcard in a PUBLISH topic is only caught by validation
+        malformed = Packet('publish', topic='a/#', message='m').encode()
+
+        async def send(port, data):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(Packet('connect', client_id='raw').encode() + data)
+            connack = await reader.readexactly(4)
+            closed = await reader.read(1) == b''
+            writer.close()
+            return connack, closed
+
+        async def main():
+            broker = Broker(port=0)
+            port = await broker.start()
+            subscriber = await connected(port)
+            await subscriber.subscribe([('#', 0)])
+
+            connack, closed = await send(port, malformed)
+            self.assertEqual(connack,
+                             Packet('connack', return_code=0).encode())
+            self.assertTrue(closed)
+            self.assertTrue(subscriber.messages.empty())
+
+            await subscriber.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_truncated_packet(self):
+        # a CONNECT ending after its protocol name, read before strict
+        # validation would have caught it
+        truncated = b'\x10\x08\x00\x06MQIsdp'
+        errors = []
+
+        async def main():
+            asyncio.get_event_loop().set_exception_handler(
+                lambda loop, context: errors.append(context))
+            broker = Broker(port=0, strict=False)
+            port = await broker.start()
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(truncated)
+            self.assertEqual(await reader.read(1), b'')
+            writer.close()
+            await broker.stop()
+
+        run(main())
+        self.assertEqual(errors, [])
@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt.capture import Record, replay, split_chunks
+from mqtt.packet import Packet
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        packets = []
+        for i in range(300):
+            packets.append(Packet(
+                'publish', qos=1, topic='dev/%d' % i,
+                message='消息%d' % i * (i % 7), message_id=i + 1))
+            packets.append(Packet('puback', message_id=i + 1))
+        # QoS 0 publishes carry no message id
+        for i in range(10):
+            packets.append(Packet('publish', topic='live/%d' % i,
+                                  message='%d' % i))
+        packets.append(Packet('pingreq'))
+        self._data = b''.join(p.encode() for p in packets)
+
+        fd, self._path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            # a frame cut off by the end of the capture is ignored
+            f.write(self._data + Packet(
+                'publish', topic='cut', message='x' * 100).encode()[:50])
+
+    def tearDown(self):
+        os.remove(self._path)
+
+    def test_split_chunks(self):
+        chunks = list(split_chunks(self._data, 256))
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], len(self._data))
+        for (start, end), (next_start, _) in zip(chunks, chunks[1:]):
+            self.assertEqual(end, next_start)
+
+        # a frame larger than the chunk size becomes a chunk of its own
+        big = Packet('publish', topic='a', message='x' * 1000).encode()
+        self.assertEqual(list(split_chunks(big + big[:10], 100)),
+                         [(0, len(big))])
+
+    def test_replay(self):
+        expected = list(replay(self._path, processes=1, chunk_size=512))
+        self.assertEqual(len(expected), 611)
+        self.assertEqual(expected[0], Record('publish', 1, 'dev/0', 1,
+                                             expected[0].offset, 0))
+        self.assertEqual(expected[1], Record('puback', 0, None, 1,
+                                             None, None))
+        self.assertEqual(expected[-1].mtype, 'pingreq')
+        for i, record in enumerate(expected[:600:2]):
+            payload = self._data[record.offset:record.offset + record.length]
+            self.assertEqual(payload.decode(), '消息%d' % i * (i % 7))
+        for i, record in enumerate(expected[600:-1]):
+            self.assertEqual(record[:4], ('publish', 0, 'live/%d' % i, None))
+            payload = self._data[record.offset:record.offset + record.length]
+            self.assertEqual(payload.decode(), '%d' % i)
+
+        self.assertEqual(
+            list(replay(self._path, processes=2, chunk_size=512)), expected)
+
+        # stopping early releases the map
+        for processes in (1, 2):
+            records = replay(self._path, processes=processes, chunk_size=512)
+            self.assertEqual(next(records), expected[0])
+            records.close()
@@ -0,0 +1,230 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt import constant
+from mqtt.client import Client, ConnectError
+from mqtt.packet import Packet
+from mqtt.stream import StreamDecoder
+from test.util import run
+
+
+class StubBroker(object):
+    # In-process stand-in broker: answers every handshake and routes
+    # publishes to exact-topic subscribers.
+
+    def __init__(self, return_code=constant.CONNECT_ACCEPTED):
+        self.returnCode = return_code
+        self.received = []
+        self._subscribers = {}
+        self._server = None
+        self._handlers = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._serve, '127.0.0.1', 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        if self._handlers:
+            await asyncio.wait(self._handlers)
+
+    async def _serve(self, reader, writer):
+        self._handlers.add(asyncio.current_task())
+        decoder = StreamDecoder()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for packet in decoder.feed(data):
+                    self.received.append(packet)
+                    self._handle(packet, writer)
+        except ConnectionError:
+            pass
+        for writers in self._subscribers.values():
+            writers.discard(writer)
+        writer.close()
+
+    def _handle(self, packet, writer):
+        if packet.mtype == 'connect':
+            writer.write(Packet(
+                'connack', return_code=self.returnCode).encode())
+        elif packet.mtype == 'publish':
+            if packet.qos == Packet.QOS_AT_LEAST_ONCE:
+                writer.write(Packet(
+                    'puback', message_id=packet.messageId).encode())
+            elif packet.qos == Packet.QOS_EXACTLY_ONCE:
+                writer.write(Packet(
+                    'pubrec', message_id=packet.messageId).encode())
+            for subscriber in self._subscribers.get(packet.topic, ()):
+                subscriber.write(Packet(
+                    'publish', topic=packet.topic,
+                    message=packet.message).encode())
+        elif packet.mtype == 'pubrel':
+            writer.write(Packet(
+                'pubcomp', message_id=packet.messageId).encode())
+        elif packet.mtype == 'subscribe':
+            for topic, qos in packet.topics:
+                self._subscribers.setdefault(topic, set()).add(writer)
+            writer.write(Packet(
+                'suback', message_id=packet.messageId,
+                granted_qos=[qos for topic, qos in packet.topics]).encode())
+        elif packet.mtype == 'unsubscribe':
+            for topic in packet.topics:
+                self._subscribers.get(topic, set()).discard(writer)
+            writer.write(Packet(
+                'unsuback', message_id=packet.messageId).encode())
+        elif packet.mtype == 'pingreq':
+            writer.write(Packet('pingresp').encode())
+
+
+class TestClient(unittest.TestCase):
+
+    def received(self, broker, mtype):
+        return [p for p in broker.received if p.mtype == mtype]
+
+    def test_connect(self):
+        async def main():
+            broker = StubBroker()
+            port = await broker.start()
+            client = Client(client_id='test_client', keep_alive_time=30)
+            await client.connect('127.0.0.1', port)
+            self.assertTrue(client.connected)
+            await client.disconnect()
+            await client.waitClosed()
+            await broker.stop()
+            return broker
+
+        broker = run(main())
+        connect = self.received(broker, 'connect')[0]
+        self.assertEqual(connect.clientId, 'test_client')
+        self.assertEqual(connect.keepAliveTime, 30)
+        self.assertEqual(len(self.received(broker, 'disconnect')), 1)
+
+    def test_connect_refused(self):
+        async def main():
+            broker = StubBroker(constant.CONNECT_NOT_AUTHORIZED)
+            port = await broker.start()
+            client = Client()
+            with self.assertRaises(ConnectError) as cm:
+                await client.connect('127.0.0.1', port)
+            self.assertEqual(
+                cm.exception.returnCode, constant.CONNECT_NOT_AUTHORIZED)
+            self.assertFalse(client.connected)
+            await broker.stop()
+
+        run(main())
+
+    def test_pipelined_publish(self):
+        async def main():
+            broker = StubBroker()
+            port = await broker.start()
+            client = Client()
+            await client.connect('127.0.0.1', port)
+            ids = await asyncio.gather(*[
+                client.publish('a/b', 'msg%d' % i, qos=i % 3)
+                for i in range(300)])
+            await client.disconnect()
+            await broker.stop()
+            return broker, ids
+
+        broker, ids = run(main())
+        publishes = self.received(broker, 'publish')
+        self.assertEqual(len(publishes), 300)
+        self.assertEqual([p.message for p in publishes],
+                         ['msg%d' % i for i in range(300)])
+        self.assertEqual(ids[0], None)
+        self.assertEqual(len(set(ids[1:]) - set([None])), 200)
+        self.assertEqual(len(self.received(broker, 'pubrel')), 100)
+
+    def test_subscribe(self):
+        async def main():
+            broker = StubBroker()
+            port = await broker.start()
+            subscriber = Client()
+            publisher = Client()
+            await subscriber.connect('127.0.0.1', port)
+            await publisher.connect('127.0.0.1', port)
+
+            granted = await subscriber.subscribe([('a/b', 1), ('c/d', 0)])
+            self.assertEqual(granted, [1, 0])
+            await publisher.publish('a/b', '这是一条测试消息。', qos=1)
+            packet = await subscriber.messages.get()
+            self.assertEqual(packet.topic, 'a/b')
+            self.assertEqual(packet.message, '这是一条测试消息。')
+
+            await subscriber.unsubscribe(['a/b'])
+            await publisher.publish('a/b', 'dropped', qos=1)
+            await publisher.publish('c/d', 'delivered', qos=1)
+            packet = await subscriber.messages.get()
+            self.assertEqual(packet.message, 'delivered')
+
+            await subscriber.disconnect()
+            await publisher.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_created_outside_loop(self):
+        # built before the loop it runs in, as in the README
+        subscriber = Client()
+        publisher = Client()
+
+        async def main():
+            broker = StubBroker()
+            port = await broker.start()
+            await subscriber.connect('127.0.0.1', port)
+            await publisher.connect('127.0.0.1', port)
+            await subscriber.subscribe([('a/b', 1)])
+            # waits on the queue before anything is in it
+            received = asyncio.ensure_future(subscriber.messages.get())
+            await publisher.publish('a/b', 'hello', qos=1)
+            self.assertEqual((await received).message, 'hello')
+            await subscriber.disconnect()
+            await publisher.disconnect()
+            await broker.stop()
+
+        run(main())
+
+    def test_keep_alive(self):
+        async def main():
+            broker = StubBroker()
+            port = await broker.start()
+            client = Client(keep_alive_time=1)
+            await client.connect('127.0.0.1', port)
+            await asyncio.sleep(2.5)
+            self.assertTrue(client.connected)
+            await client.disconnect()
+            await broker.stop()
+            return broker
+
+        broker = run(main())
+        self.assertTrue(len(self.received(broker, 'pingreq')) >= 2)
+
+    def test_publish_stream_cut_short(self):
+        async def main():
+            broker = StubBroker()
+            port = await broker.start()
+            client = Client(keep_alive_time=0)
+            await client.connect('127.0.0.1', port)
+
+            # refused before any of the frame is written
+            with self.assertRaises(ValueError):
+                await client.publishStream('fw', b'abc', length=4)
+            self.assertTrue(client.connected)
+
+            # an iterable found short after its header went out
+            with self.assertRaises(ValueError):
+                await client.publishStream('fw', [b'abc'], length=4)
+            self.assertFalse(client.connected)
+            await client.waitClosed()
+            await broker.stop()
+
+        run(main())
@@ -0,0 +1,154 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import socket
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt.cluster import Cluster, ClusterBroker
+from mqtt.packet import Packet
+from test.util import connected, run
+
+
+async def settle():
+    # let announcements and forwarded frames cross the peer sockets
+    await asyncio.sleep(0.1)
+
+
+class TestCluster(unittest.TestCase):
+
+    def test_routing_between_workers(self):
+        async def main():
+            left, right = socket.socketpair()
+            first = ClusterBroker(port=0, peers=[left], reuse_port=False)
+            second = ClusterBroker(port=0, peers=[right], reuse_port=False)
+            first_port = await first.start()
+            second_port = await second.start()
+
+            subscriber = await connected(first_port)
+            other = await connected(first_port)
+            await subscriber.subscribe([('a/+', 1)])
+            await other.subscribe([('a/+', 0)])
+            await settle()
+            self.assertEqual(len(second._peerFilters), 1)
+
+            publisher = await connected(second_port)
+            await publisher.publish('a/b', 'hello', qos=1)
+            await publisher.publish('c', 'kept', qos=1, retain=True)
+            packet = await subscriber.messages.get()
+            self.assertEqual((packet.topic, packet.message, packet.qos),
+                             ('a/b', 'hello', 1))
+            packet = await other.messages.get()
+            self.assertEqual((packet.message, packet.qos), ('hello', 0))
+
+            # retained messages reach every worker, subscribed or not
+            await settle()
+            self.assertEqual(len(first.retained), 1)
+            await subscriber.subscribe([('c', 0)])
+            packet = await subscriber.messages.get()
+            self.assertEqual((packet.message, packet.retain), ('kept', True))
+
+            # the filter is withdrawn with its last local subscriber
+            await subscriber.unsubscribe(['a/+'])
+            await settle()
+            self.assertEqual(len(second._peerFilters), 2)
+            await other.disconnect()
+            await subscriber.unsubscribe(['c'])
+            await settle()
+            self.assertEqual(len(second._peerFilters), 0)
+
+            # a worker exiting drops out of its peers
+            await subscriber.disconnect()
+            await first.stop()
+            await settle()
+            self.assertEqual(second.peers, [])
+            await publisher.publish('a/b', 'alone')
+
+            await publisher.disconnect()
+            await second.stop()
+
+        run(main())
+
+    def test_client_id_takeover(self):
+        async def main():
+            left, right = socket.socketpair()
+            first = ClusterBroker(port=0, peers=[left], reuse_port=False)
+            second = ClusterBroker(port=0, peers=[right], reuse_port=False)
+            first_port = await first.start()
+            second_port = await second.start()
+
+            old = await connected(first_port, client_id='device')
+            new = await connected(second_port, client_id='device')
+            await old.waitClosed()
+            self.assertEqual(list(first.sessions), [])
+            self.assertEqual(list(second.sessions), ['device'])
+            await new.publish('x', 'still connected', qos=1)
+
+            await new.disconnect()
+            await first.stop()
+            await second.stop()
+
+        run(main())
+
+    def test_stalled_worker(self):
+        async def main():
+            local, stalled = socket.socketpair()
+            broker = ClusterBroker(port=0, peers=[local], reuse_port=False,
+                                   max_write_buffer=1 << 16)
+            port = await broker.start()
+            # a worker that subscribes, then never reads again
+            stalled.sendall(Packet('subscribe', qos=1, message_id=1,
+                                   topics=[('a', 0)]).encode())
+            await settle()
+            peer, = broker.peers
+
+            publisher = await connected(port)
+            payload = b'x' * (1 << 14)
+            for qos in (0, 1):
+                dropped = peer.dropped
+                for i in range(400):
+                    await publisher.publish('a', payload=payload, qos=qos)
+                await settle()
+                self.assertTrue(peer.dropped > dropped)
+                # the write that crosses the limit is the last one let through
+                self.assertTrue(
+                    peer.writer.transport.get_write_buffer_size() <
+                    broker.maxWriteBuffer * broker._PEER_BUFFER_FACTOR +
+                    len(payload) + 16)
+
+            await publisher.disconnect()
+            await broker.stop()
+            stalled.close()
+
+        run(main())
+
+    def test_forked_workers(self):
+        cluster = Cluster(workers=3, port=0)
+        port = cluster.start()
+        try:
+            self.assertEqual(len(cluster.processes), 3)
+
+            async def main():
+                # connections spread over the workers by the kernel
+                subscribers = []
+                for i in range(6):
+                    client = await connected(port, keep_alive_time=0)
+                    await client.subscribe([('t/#', 1)])
+                    subscribers.append(client)
+                await settle()
+                publisher = await connected(port)
+                for i in range(3):
+                    await publisher.publish('t/%d' % i, 'm%d' % i, qos=1)
+                for client in subscribers:
+                    messages = [(await client.messages.get()).message
+                                for i in range(3)]
+                    self.assertEqual(messages, ['m0', 'm1', 'm2'])
+                for client in subscribers + [publisher]:
+                    await client.disconnect()
+
+            run(main())
+        finally:
+            cluster.stop()
+        self.assertEqual(cluster.processes, [])
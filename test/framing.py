@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt import framing
+from mqtt.packet import Packet
+
+
+def _call(f, *args):
+    try:
+        return f(*args)
+    except ValueError as e:
+        return ValueError, str(e)
+
+
+class TestFraming(unittest.TestCase):
+
+    def test_remain_length(self):
+        for x, data in ((0, b'\x00'), (127, b'\x7f'), (128, b'\x80\x01'),
+                        (16383, b'\xff\x7f'), (16384, b'\x80\x80\x01'),
+                        (268435455, b'\xff\xff\xff\x7f')):
+            self.assertEqual(framing.py_encode_remain_length(x), data)
+            self.assertEqual(
+                framing.py_decode_remain_length(b'\x30' + data), x)
+        for x in (-1, 268435456):
+            with self.assertRaises(ValueError):
+                framing.py_encode_remain_length(x)
+
+    def test_parse_header(self):
+        data = b'\x00' + Packet(
+            'publish', topic='a/b', message='x' * 200).encode()
+        self.assertEqual(framing.py_parse_header(data, 1), (0x30, 205, 3))
+        self.assertEqual(framing.py_parse_header(data[:3], 1), None)
+        with self.assertRaises(ValueError):
+            framing.py_parse_header(b'\x30\xff\xff\xff\xff\x01')
+
+    def test_split_frames(self):
+        frames = [Packet('pingreq').encode(),
+                  Packet('publish', topic='a', message='b' * 300).encode(),
+                  Packet('puback', message_id=1).encode()]
+        data = b''.join(frames)
+        self.assertEqual(framing.py_split_frames(data + frames[1][:5]), (
+            [(0, 2), (2, 308), (308, 312)], 312))
+        self.assertEqual(framing.py_split_frames(data, 2),
+                         ([(2, 308), (308, 312)], 312))
+        # a malformed header only raises once it is the first one left
+        malformed = b'\x30\xff\xff\xff\xff\x01'
+        self.assertEqual(framing.py_split_frames(frames[0] + malformed),
+                         ([(0, 2)], 2))
+        with self.assertRaises(ValueError):
+            framing.py_split_frames(frames[0] + malformed, 2)
+
+    @unittest.skipIf(framing._speedups is None, 'extension not built')
+    def test_speedups_match_python(self):
+        c = framing._speedups
+        rng = random.Random(0x58)
+        for x in list(range(0, 20000)) + [rng.randrange(-10, 1 << 29)
+                                          for i in range(20000)]:
+            self.assertEqual(_call(c.encode_remain_length, x),
+                             _call(framing.py_encode_remain_length, x))
+
+        for i in range(20000):
+            # bias towards continuation bits and short, truncated frames
+            data = bytes(rng.choice((0x00, 0x02, 0x7f, 0x80, 0xff,
+                                     rng.randrange(256)))
+                         for j in range(rng.randrange(12)))
+            for buf in (data, bytearray(data), memoryview(data)):
+                self.assertEqual(c.decode_remain_length(buf),
+                                 framing.py_decode_remain_length(buf))
+                offset = rng.randrange(len(data) + 2)
+                self.assertEqual(
+                    _call(c.parse_header, buf, offset),
+                    _call(framing.py_parse_header, buf, offset))
+                self.assertEqual(
+                    _call(c.split_frames, buf, offset),
+                    _call(framing.py_split_frames, buf, offset))
+
+        for i in range(2000):
+            data = b''.join(Packet(
+                'publish', topic='t/%d' % j, message='m' * rng.randrange(300),
+                qos=1, message_id=j + 1).encode()
+                for j in range(rng.randrange(5)))
+            data += bytes(rng.randrange(256) for j in range(rng.randrange(8)))
+            self.assertEqual(_call(c.split_frames, data),
+                             _call(framing.py_split_frames, data))
@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt import inflight
+from mqtt.inflight import IdAllocator, InflightWindow
+from mqtt.packet import Packet
+from mqtt.template import PublishTemplate
+
+
+class TestIdAllocator(unittest.TestCase):
+
+    def test_allocate_and_release(self):
+        ids = IdAllocator()
+        allocated = [ids.allocate() for i in range(0xFFFF)]
+        self.assertEqual(allocated, list(range(1, 0x10000)))
+        self.assertRaises(RuntimeError, ids.allocate)
+
+        self.assertTrue(ids.release(300))
+        self.assertTrue(ids.release(7))
+        self.assertFalse(ids.release(7))
+        self.assertFalse(7 in ids)
+        self.assertEqual(len(ids), 0xFFFF - 2)
+        # released ids are reused in the order they were freed
+        self.assertEqual([ids.allocate(), ids.allocate()], [300, 7])
+        self.assertTrue(7 in ids)
+
+
+class TestInflightWindow(unittest.TestCase):
+
+    def setUp(self):
+        self._template = PublishTemplate('a/b', 'message')
+
+    def _publish(self, window, qos, now):
+        message_id = window.allocate()
+        window.publish(
+            message_id, qos,
+            (self._template.header(qos, message_id), self._template.payload),
+            now)
+        return message_id
+
+    def test_handshakes(self):
+        window = InflightWindow(retry_interval=10)
+        first = self._publish(window, 1, 0)
+        second = self._publish(window, 2, 0)
+        self.assertEqual(window.state(first), inflight.AWAIT_PUBACK)
+        self.assertEqual(window.state(second), inflight.AWAIT_PUBREC)
+
+        self.assertFalse(window.complete(first))
+        self.assertTrue(window.acknowledge(first))
+        self.assertFalse(window.acknowledge(first))
+        self.assertEqual(window.receive(first, 1), None)
+
+        pubrel = window.receive(second, 1)
+        self.assertEqual(pubrel, Packet(
+            'pubrel', qos=1, message_id=second).encode())
+        self.assertEqual(window.state(second), inflight.AWAIT_PUBCOMP)
+        self.assertFalse(window.acknowledge(second))
+        self.assertTrue(window.complete(second))
+        self.assertEqual(len(window), 0)
+        self.assertEqual(len(window.ids), 0)
+
+    def test_retransmission(self):
+        window = InflightWindow(retry_interval=10, max_inflight=3)
+        ids = [self._publish(window, qos, now)
+               for qos, now in ((1, 0), (2, 1), (2, 2))]
+        self.assertTrue(window.full())
+        self.assertRaises(RuntimeError, window.allocate)
+        window.receive(ids[2], 5)
+        self.assertEqual(window.nextDeadline(), 10)
+
+        self.assertEqual(window.expired(9), [])
+        resent = window.expired(11)
+        self.assertEqual([message_id for message_id, chunks in resent],
+                         ids[:2])
+        for message_id, chunks in resent:
+            packet = Packet.fromData(b''.join(chunks))
+            self.assertTrue(packet.dup)
+            self.assertEqual((packet.messageId, packet.message),
+                             (message_id, 'message'))
+        # rescheduled behind the PUBREL, which is resent without dup
+        resent = window.expired(15)
+        self.assertEqual(resent, [(ids[2], (Packet(
+            'pubrel', qos=1, message_id=ids[2]).encode(),))])
+        self.assertEqual([message_id for message_id, chunks
+                          in window.expired(21)], ids[:2])
+
+        window.clear()
+        self.assertEqual((len(window), len(window.ids)), (0, 0))
+        self.assertEqual(window.nextDeadline(), None)
@@ -0,0 +1,48 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt.intern import TopicCache
+from mqtt.packet import Packet
+
+
+class TestTopicCache(unittest.TestCase):
+
+    def test_decode_interns(self):
+        cache = TopicCache()
+        data = memoryview(b'\x00\x03a/b' + '主题'.encode('utf-8'))
+        first = cache.decode(data[2:5])
+        second = cache.decode(bytes(data[2:5]))
+        self.assertEqual(first, 'a/b')
+        self.assertTrue(first is second)
+        self.assertEqual(cache.decode(data[5:]), '主题')
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_encode(self):
+        cache = TopicCache()
+        self.assertEqual(cache.encode('主题'), b'\x00\x06' +
+                         '主题'.encode('utf-8'))
+        self.assertTrue(cache.encode('主题') is cache.encode('主题'))
+
+    def test_bounded(self):
+        cache = TopicCache(maxsize=2)
+        for topic in ('a', 'b', 'c', 'a'):
+            cache.encode(topic)
+        self.assertEqual(cache.stats(), {
+            'decoded': 0, 'encoded': 2, 'maxsize': 2, 'hits': 0,
+            'misses': 4, 'evictions': 2})
+
+        cache = TopicCache(maxsize=0)
+        self.assertEqual(cache.decode(b'a'), 'a')
+        self.assertEqual(len(cache), 0)
+
+    def test_packets_share_topics(self):
+        data = Packet('publish', qos=1, topic='dev/1/temp', message='x',
+                      message_id=1).encode()
+        first, second = Packet.fromData(data), Packet.fromData(data)
+        self.assertTrue(first.topic is second.topic)
+        self.assertEqual(first.encode(), data)
@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt import metrics
+from mqtt.broker import Broker
+from mqtt.metrics import Histogram, Metrics
+from mqtt.packet import Packet
+from mqtt.pool import PacketPool
+from mqtt.stream import StreamDecoder
+from test.util import connected, run
+
+
+class TestMetrics(unittest.TestCase):
+
+    def tearDown(self):
+        metrics.uninstrument()
+
+    def test_histogram(self):
+        histogram = Histogram((10, 100))
+        for value in (1, 10, 11, 100, 1000):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(),
+                         [(10, 2), (100, 4), (float('inf'), 5)])
+        self.assertEqual((histogram.sum, histogram.count), (1122, 5))
+
+    def test_instrument(self):
+        original = Packet.__dict__['encode'], Packet.__dict__['fromData']
+        observer = Metrics()
+        metrics.instrument(observer)
+        self.assertTrue(metrics.current_observer() is observer)
+
+        subscribe = Packet('subscribe', qos=1, message_id=1,
+                           topics=[('a/%d' % i, 1) for i in range(100)])
+        data = subscribe.encode()
+        frames = data + bytes(Packet('pingreq'))
+        packets = list(StreamDecoder().feed(frames))
+        self.assertEqual([p.mtype for p in packets], ['subscribe', 'pingreq'])
+
+        snapshot = observer.snapshot()
+        self.assertEqual(sorted(snapshot['out']), ['pingreq', 'subscribe'])
+        self.assertEqual(snapshot['in']['subscribe']['packets'], 1)
+        self.assertEqual(snapshot['in']['subscribe']['bytes'], len(data))
+        self.assertEqual(snapshot['in']['pingreq']['bytes'], 2)
+        size = snapshot['in']['subscribe']['size']
+        self.assertEqual(size['count'], 1)
+        # 600-odd bytes land in the 1024 bucket
+        self.assertEqual([count for bound, count in size['buckets']
+                          if bound == 256 or bound == 1024], [0, 1])
+        self.assertEqual(snapshot['in']['subscribe']['latency']['count'], 1)
+
+        text = observer.prometheus()
+        self.assertTrue(
+            'mqtt_packets_total{direction="in",type="subscribe"} 1\n'
+            in text)
+        self.assertTrue(
+            'mqtt_packet_size_bytes_bucket{direction="out",type="pingreq",'
+            'le="+Inf"} 1\n' in text)
+        self.assertTrue('# TYPE mqtt_codec_seconds histogram\n' in text)
+
+        metrics.uninstrument()
+        self.assertEqual(
+            (Packet.__dict__['encode'], Packet.__dict__['fromData']),
+            original)
+        Packet('pingreq').encode()
+        self.assertEqual(observer.snapshot()['out']['pingreq']['packets'], 1)
+        observer.reset()
+        self.assertEqual(observer.snapshot(), {'in': {}, 'out': {}})
+
+    def test_preencoded_frames(self):
+        observer = Metrics()
+        metrics.instrument(observer)
+
+        async def main():
+            broker = Broker(port=0)
+            port = await broker.start()
+            subscriber = await connected(port)
+            await subscriber.subscribe([('a', 1)])
+            publisher = await connected(port)
+            await publisher.publish('a', 'hello', qos=1)
+            await subscriber.messages.get()
+            # the broker has read the puback once it answers this
+            await subscriber.subscribe([('b', 0)])
+            await subscriber.disconnect()
+            await publisher.disconnect()
+            await broker.stop()
+
+        run(main())
+        snapshot = observer.snapshot()
+        # the broker's connack, puback and fan-out publish, the
+        # subscriber's puback and the publisher's encoded publish
+        self.assertEqual(snapshot['out']['connack']['packets'], 2)
+        self.assertEqual(snapshot['out']['puback']['packets'], 2)
+        self.assertEqual(snapshot['out']['publish']['packets'], 2)
+        self.assertEqual(snapshot['out']['suback']['packets'], 2)
+        # pooled on both sides
+        self.assertEqual(snapshot['in']['puback']['packets'], 2)
+
+        observer.reset()
+        pool = PacketPool()
+        pool.decode(bytes(Packet('puback', message_id=1)))
+        self.assertEqual(observer.snapshot()['in']['puback']['packets'], 1)
@@ -1,13 +1,15 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from __future__ import unicode_literals
-
 import unittest
+from array import array
 import sys
 sys.path.append("..")
 
-from mqtt.packet import Packet
+from mqtt.packet import (DISCONNECT_FRAME, PINGREQ_FRAME, PINGRESP_FRAME,
+                         Packet, Publish, Puback, ack_frame, connack_frame,
+                         decode_acks, encode_acks, encode_acks_into)
+from mqtt.validate import MalformedPacketError
 
 
 class TestPacket(unittest.TestCase):
@@ -72,21 +74,21 @@ class TestPacket(unittest.TestCase):
         barray.extend('testtest'.encode(self._encoding))
         v, d = p._parseNextValue(bytes(barray))
         self.assertEqual(v, 'test')
-        self.assertEqual(d, 'test')
+        self.assertEqual(bytes(d), b'test')
 
         barray = bytearray()
         barray.extend([5])
         barray.extend('test'.encode(self._encoding))
         v, d = p._parseNextValue(bytes(barray), Packet._ONE_BYTE_VALUE)
         self.assertEqual(v, 5)
-        self.assertEqual(d, 'test')
+        self.assertEqual(bytes(d), b'test')
 
         barray = bytearray()
         barray.extend([1, 0])
         barray.extend('test'.encode(self._encoding))
         v, d = p._parseNextValue(bytes(barray), Packet._ONE_WORD_VALUE)
         self.assertEqual(v, 256)
-        self.assertEqual(d, 'test')
+        self.assertEqual(bytes(d), b'test')
 
     def test_connect_packet(self):
         data = bytearray()
@@ -147,6 +149,14 @@ class TestPacket(unittest.TestCase):
         p = Packet(**d)
         self.assertEqual(bytes(p), data)
 
+    def test_connect_packet_username_only(self):
+        p = Packet('connect', client_id='test_client', username='admin')
+        data = bytes(p)
+        p = Packet.fromData(data)
+        self.assertEqual(p.username, 'admin')
+        self.assertEqual(getattr(p, 'password', None), None)
+        self.assertEqual(bytes(p), data)
+
     def test_connack_packet(self):
         barray = bytearray()
         barray.append(0b00100000)
@@ -309,6 +319,49 @@ class TestPacket(unittest.TestCase):
         p = Packet(**d)
         self.assertEqual(bytes(p), data)
 
+    def test_publish_packet_lazy(self):
+        payload = bytes(bytearray([0x08, 0x96, 0x01, 0xFF, 0xFE]))
+        data = bytearray()
+        data.append(0b00110010)
+
+        barray = bytearray()
+        barray.extend([0, 3])
+        barray.extend('a/b'.encode(self._encoding))
+        barray.extend([0, 10])
+        barray.extend(payload)
+
+        data.append(len(barray))
+        data.extend(barray)
+        data = bytes(data)
+
+        self.assertRaises(UnicodeDecodeError, Packet.fromData, data)
+
+        p = Packet.fromData(data, lazy=True)
+        self.assertEqual(p.topic, 'a/b')
+        self.assertEqual(p.messageId, 10)
+        self.assertEqual(bytes(p.payload), payload)
+        self.assertEqual(bytes(p), data)
+        self.assertRaises(UnicodeDecodeError, getattr, p, 'message')
+
+        msg = '这是一条测试消息。'
+        p = Packet.fromData(
+            Packet('publish', topic='a/b', message=msg).encode(), lazy=True)
+        self.assertEqual(p.message, msg)
+        p.message = 'changed'
+        self.assertEqual(p.payload, None)
+        changed = Packet('publish', topic='a/b', message='changed').encode()
+        self.assertEqual(bytes(p), changed)
+
+        d = {
+            'mtype': 'publish',
+            'qos': 1,
+            'topic': 'a/b',
+            'message_id': 10,
+            'payload': payload,
+        }
+        p = Packet(**d)
+        self.assertEqual(bytes(p), data)
+
     def test_suback_packet(self):
         data = bytearray()
         data.append(0b10010000)
@@ -357,8 +410,8 @@ class TestPacket(unittest.TestCase):
         p = Packet.fromData(data)
         self.assertEqual(p.mtype, 'unsubscribe')
         self.assertEqual(p.messageId, 10)
-        self.assertEqual(p.topics[0], topic1)
-        self.assertEqual(p.topics[1], topic2)
+        self.assertEqual(p.topics[0], topic1.decode(self._encoding))
+        self.assertEqual(p.topics[1], topic2.decode(self._encoding))
 
         d = {
             'mtype': 'unsubscribe',
@@ -465,3 +518,114 @@ class TestPacket(unittest.TestCase):
         }
         p = Packet(**d)
         self.assertEqual(bytes(p), data)
+
+    def test_packet_classes(self):
+        p = Packet('puback', message_id=10)
+        self.assertTrue(isinstance(p, Puback))
+        self.assertFalse(hasattr(p, '__dict__'))
+        self.assertEqual(p.mcode, 0x04)
+
+        p = Packet.fromData(bytes(p))
+        self.assertTrue(isinstance(p, Puback))
+        self.assertEqual(p.messageId, 10)
+
+        self.assertEqual(bytes(Puback(message_id=10)), bytes(p))
+
+        data = Packet('publish', topic='a/b', message='m').encode()
+        p = Packet.fromData(data)
+        self.assertTrue(isinstance(p, Publish))
+        self.assertFalse(hasattr(p, '__dict__'))
+        self.assertEqual(getattr(p, 'messageId', None), None)
+
+        self.assertRaises(KeyError, Packet, 'reserved')
+
+    def test_encodeMany(self):
+        packets = [
+            Packet('publish', qos=1, topic='a/b', message='x' * 200,
+                   message_id=1),
+            Packet('puback', message_id=2),
+            Packet('pingreq'),
+            Packet('subscribe', qos=1, message_id=3, topics=[('a/#', 1)]),
+        ]
+        data = b''.join(p.encode() for p in packets)
+
+        buf = Packet.encodeMany(packets)
+        self.assertTrue(isinstance(buf, bytearray))
+        self.assertEqual(bytes(buf), data)
+
+        buf = bytearray(len(data) + 4)
+        offset = 2
+        for p in packets:
+            offset = p.encodeInto(buf, offset)
+        self.assertEqual(offset, len(data) + 2)
+        self.assertEqual(bytes(buf[2:offset]), data)
+
+        self.assertRaises(ValueError, packets[0].encodeInto, bytearray(10))
+
+    def test_constant_frames(self):
+        self.assertEqual(PINGREQ_FRAME, Packet('pingreq').encode())
+        self.assertEqual(PINGRESP_FRAME, Packet('pingresp').encode())
+        self.assertEqual(DISCONNECT_FRAME, Packet('disconnect').encode())
+        for return_code in range(8):
+            self.assertEqual(
+                connack_frame(return_code),
+                Packet('connack', return_code=return_code).encode())
+        for mtype in ('puback', 'pubrec', 'pubcomp', 'unsuback'):
+            self.assertEqual(ack_frame(mtype, 0x1234),
+                             Packet(mtype, message_id=0x1234).encode())
+        self.assertEqual(ack_frame('pubrel', 7), Packet(
+            'pubrel', qos=Packet.QOS_AT_LEAST_ONCE, message_id=7).encode())
+
+    def test_truncated(self):
+        for data in (b'\x20\x01\x00',
+                     b'\x10\x03\x00\x06M',
+                     b'\x82\x05\x00\x01\x00\x05a',
+                     b'\x90\x01\x00'):
+            self.assertRaises(MalformedPacketError, Packet.fromData, data)
+
+    def test_reset(self):
+        p = Packet('publish', qos=1, topic='a', message='m', message_id=1)
+        self.assertTrue(p.reset(topic='b', message='n') is p)
+        self.assertEqual((p.qos, p.topic, p.message), (0, 'b', 'n'))
+        self.assertEqual(getattr(p, 'messageId', None), None)
+        self.assertEqual(p.encode(),
+                         Packet('publish', topic='b', message='n').encode())
+
+        p = Packet('connect', client_id='c', will_topic='w',
+                   will_message='bye', username='u', password='p')
+        p.reset(client_id='d')
+        for name in ('willTopic', 'willMessage', 'username', 'password'):
+            self.assertEqual(getattr(p, name, None), None)
+        self.assertEqual(p.encode(),
+                         Packet('connect', client_id='d').encode())
+
+        p = Packet('puback', message_id=1)
+        p.reset(dup=True, message_id=2)
+        self.assertEqual(p.encode(), Packet(
+            'puback', dup=True, message_id=2).encode())
+
+    def test_bulk_acks(self):
+        ids = [1, 2, 0x1234, 0xFFFF]
+        for mtype in ('puback', 'pubrec', 'pubrel', 'pubcomp', 'unsuback'):
+            data = b''.join(ack_frame(mtype, i) for i in ids)
+            for message_ids in (ids, array('H', ids), iter(ids),
+                                array('L', ids)):
+                buf = encode_acks(mtype, message_ids)
+                self.assertTrue(isinstance(buf, bytearray))
+                self.assertEqual(bytes(buf), data)
+            self.assertEqual(decode_acks(data, mtype), array('H', ids))
+
+        buf = bytearray(b'\xff' * 20)
+        self.assertEqual(encode_acks_into(buf, 'puback', ids, 2), 18)
+        self.assertEqual(bytes(buf[2:18]), b''.join(
+            ack_frame('puback', i) for i in ids))
+        self.assertEqual(buf[:2] + buf[18:], b'\xff' * 4)
+        self.assertRaises(ValueError, encode_acks_into, bytearray(15),
+                          'puback', ids)
+
+        self.assertEqual(encode_acks('puback', []), bytearray())
+        self.assertEqual(decode_acks(b'', 'puback'), array('H'))
+        self.assertRaises(OverflowError, encode_acks, 'puback', [0x10000])
+        data = ack_frame('puback', 1) + ack_frame('pubrec', 2)
+        self.assertRaises(ValueError, decode_acks, data, 'puback')
+        self.assertRaises(ValueError, decode_acks, data[:-1], 'puback')
@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt.packet import Packet, Puback, Pubrel
+from mqtt.pool import PacketPool
+from mqtt.stream import StreamDecoder
+from mqtt.validate import MalformedPacketError
+
+
+class TestPacketPool(unittest.TestCase):
+
+    def test_decode(self):
+        pool = PacketPool()
+        data = Packet('pubrel', qos=1, message_id=5).encode()
+        packet = pool.decode(data)
+        self.assertTrue(isinstance(packet, Pubrel))
+        self.assertEqual((packet.qos, packet.dup, packet.messageId),
+                         (1, False, 5))
+        self.assertEqual(pool.misses, 1)
+
+        pool.release(packet)
+        self.assertEqual(len(pool), 1)
+        data = Packet('pubrel', qos=1, dup=True, message_id=6).encode()
+        self.assertTrue(pool.decode(data) is packet)
+        self.assertEqual((packet.dup, packet.messageId), (True, 6))
+        self.assertEqual((pool.hits, len(pool)), (1, 0))
+
+        ping = pool.decode(Packet('pingreq').encode())
+        self.assertEqual(ping.mtype, 'pingreq')
+        self.assertEqual(ping.encode(), Packet('pingreq').encode())
+
+    def test_not_pooled(self):
+        pool = PacketPool()
+        data = Packet('publish', qos=1, topic='a', message='m',
+                      message_id=1).encode()
+        packet = pool.decode(data)
+        self.assertEqual(packet.message, 'm')
+        pool.release(packet)
+        self.assertEqual(len(pool), 0)
+
+        # a malformed ack goes to Packet.fromData, which rejects it
+        self.assertRaises(MalformedPacketError, pool.decode, b'\x40\x01\x00')
+
+    def test_acquire(self):
+        pool = PacketPool(maxsize=1)
+        first = pool.acquire('puback', message_id=1)
+        second = pool.acquire('puback', message_id=2)
+        self.assertTrue(isinstance(first, Puback))
+        pool.release(first)
+        pool.release(second)
+        self.assertEqual(len(pool), 1)
+        packet = pool.acquire('puback', message_id=3)
+        self.assertTrue(packet is first)
+        self.assertEqual(packet.encode(),
+                         Packet('puback', message_id=3).encode())
+
+    def test_stream_decoder(self):
+        pool = PacketPool()
+        packets = [
+            Packet('puback', message_id=1),
+            Packet('publish', topic='a', message='m'),
+            Packet('pingresp'),
+            Packet('unsuback', message_id=2),
+        ]
+        data = b''.join(p.encode() for p in packets)
+        decoder = StreamDecoder(pool=pool)
+        decoded = []
+        # byte by byte, so every frame is split across feed() calls
+        for i in range(len(data)):
+            decoded.extend(decoder.feed(data[i:i + 1]))
+        self.assertEqual([p.encode() for p in decoded],
+                         [p.encode() for p in packets])
+        self.assertEqual(pool.misses, 3)
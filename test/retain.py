@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt.packet import Packet
+from mqtt.retain import RetainedStore
+
+
+class TestRetainedStore(unittest.TestCase):
+
+    def _topics(self, store, topic_filter):
+        return sorted(t.topic for t, qos in store.match(topic_filter))
+
+    def test_match(self):
+        store = RetainedStore()
+        for topic in ('a', 'a/b', 'a/b/c', 'a/x/c', 'b/b/c', '$SYS/load',
+                      '/a'):
+            store.retain(topic, topic.encode(), 1)
+        self.assertEqual(len(store), 7)
+
+        self.assertEqual(self._topics(store, 'a/b'), ['a/b'])
+        self.assertEqual(self._topics(store, 'a/+/c'), ['a/b/c', 'a/x/c'])
+        self.assertEqual(self._topics(store, 'a/#'),
+                         ['a', 'a/b', 'a/b/c', 'a/x/c'])
+        self.assertEqual(self._topics(store, '+/b/#'), ['a/b', 'a/b/c',
+                                                        'b/b/c'])
+        self.assertEqual(self._topics(store, '+'), ['a'])
+        self.assertEqual(self._topics(store, '+/a'), ['/a'])
+        self.assertEqual(self._topics(store, '#'), [
+            '/a', 'a', 'a/b', 'a/b/c', 'a/x/c', 'b/b/c'])
+        self.assertEqual(self._topics(store, '$SYS/#'), ['$SYS/load'])
+        self.assertEqual(self._topics(store, 'c/#'), [])
+        self.assertRaises(ValueError, store.match, 'a/#/c')
+
+    def test_replace_and_clear(self):
+        store = RetainedStore()
+        store.retain('a/b', b'first', 1)
+        store.retain('a/b', b'second', 2)
+        template, qos = store.get('a/b')
+        self.assertEqual((bytes(template.payload), qos), (b'second', 2))
+        self.assertEqual(
+            Packet.fromData(template.encode(1, 7)).retain, True)
+
+        store.retain('a/b/c', b'child')
+        store.retain('a/b', b'')
+        self.assertEqual(store.get('a/b'), None)
+        self.assertEqual(len(store), 1)
+        store.retain('a/b/c', b'')
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store._root.children, {})
+        self.assertFalse(store.remove('a/b/c'))
@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt.packet import Packet
+from mqtt.store import MessageStore, SYNC_ALWAYS, SYNC_INTERVAL, SYNC_NEVER
+from mqtt.template import PublishTemplate
+
+
+class TestMessageStore(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _publish(self, i):
+        return Packet('publish', qos=1, topic='dev/%d' % i,
+                      message='消息%d' % i, message_id=i)
+
+    def test_recover(self):
+        store = MessageStore(self._directory, segment_size=4096,
+                             sync=SYNC_ALWAYS)
+        for i in range(1, 201):
+            store.add('a', self._publish(i))
+        store.add('b', self._publish(1))
+        for i in range(1, 101):
+            self.assertTrue(store.acknowledge('a', i))
+        self.assertFalse(store.acknowledge('a', 1))
+        # the PUBREL replaces the PUBLISH it releases
+        store.add('a', Packet('pubrel', qos=1, message_id=150))
+        template = PublishTemplate('t', 'shared')
+        store.addFrame('b', 2, template.header(1, 2), template.payload)
+        self.assertEqual(len(store), 102)
+        expected = {client_id: list(store.pending(client_id))
+                    for client_id in store.clients()}
+        store.close()
+
+        store = MessageStore(self._directory, segment_size=4096)
+        self.assertEqual(len(store), 102)
+        self.assertEqual({client_id: list(store.pending(client_id))
+                          for client_id in store.clients()}, expected)
+        self.assertEqual(Packet.fromData(store.frame('a', 150)).mtype,
+                         'pubrel')
+        self.assertEqual(Packet.fromData(store.frame('a', 200)).message,
+                         '消息200')
+        self.assertEqual(Packet.fromData(store.frame('b', 2)).message,
+                         'shared')
+        store.close()
+
+    def test_interval_sync(self):
+        store = MessageStore(self._directory, sync=SYNC_INTERVAL,
+                             sync_interval=0.05)
+
+        async def main():
+            store.sync()
+            store.add('a', self._publish(1))
+            store.add('a', self._publish(2))
+            segment = store._segments[-1]
+            self.assertTrue(segment.synced < segment.end)
+            # no further write comes to trigger the sync
+            await asyncio.sleep(0.1)
+            self.assertEqual(segment.synced, segment.end)
+            self.assertIsNone(store._syncTimer)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(main())
+        finally:
+            loop.close()
+        store.close()
+
+    def test_torn_tail(self):
+        store = MessageStore(self._directory, sync=SYNC_NEVER)
+        store.add('a', self._publish(1))
+        store.add('a', self._publish(2))
+        segment = store._segments[-1]
+        end = segment.end
+        # a crash in the middle of the second record
+        segment.mm[end - 5:end] = bytes(5)
+        segment.mm[end + 10] = 0xFF
+        store.close()
+
+        store = MessageStore(self._directory, sync=SYNC_NEVER)
+        self.assertEqual([i for i, frame in store.pending('a')], [1])
+        store.add('a', self._publish(3))
+        store.close()
+        store = MessageStore(self._directory)
+        self.assertEqual([i for i, frame in store.pending('a')], [1, 3])
+        store.close()
+
+    def test_torn_record(self):
+        store = MessageStore(self._directory, sync=SYNC_NEVER)
+        store.add('a', self._publish(1))
+        segment = store._segments[-1]
+        end = segment.end
+        record = segment.mm[:end]
+        store.add('a', self._publish(2))
+        store.add('a', self._publish(3))
+        # killed after the first byte of a record, or before its key
+        segment.mm[end:] = bytes(len(segment.mm) - end)
+        segment.mm[end] = record[0]
+        store.close()
+
+        store = MessageStore(self._directory, sync=SYNC_NEVER)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.clients(), ['a'])
+        segment = store._segments[-1]
+        segment.mm[end:end + len(record) - 10] = record[:-10]
+        store.close()
+
+        store = MessageStore(self._directory)
+        self.assertEqual([i for i, frame in store.pending('a')], [1])
+        store.close()
+
+    def test_compact(self):
+        store = MessageStore(self._directory, segment_size=1024)
+        for i in range(1, 301):
+            store.add('a', self._publish(i))
+        for i in range(1, 301):
+            if i % 10:
+                store.acknowledge('a', i)
+        segments = len(store._segments)
+        self.assertTrue(store.compact() > 0)
+        self.assertTrue(len(store._segments) < segments)
+        self.assertEqual(len(os.listdir(self._directory)),
+                         len(store._segments))
+        store.close()
+
+        store = MessageStore(self._directory, segment_size=1024)
+        self.assertEqual([i for i, frame in store.pending('a')],
+                         list(range(10, 301, 10)))
+        for i in range(10, 301, 10):
+            store.acknowledge('a', i)
+        # fully acknowledged segments are dropped without compaction
+        self.assertEqual(len(store._segments), 1)
+        store.close()
@@ -0,0 +1,131 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt.packet import Packet
+from mqtt.stream import PublishStream, StreamDecoder, iter_publish
+
+
+class TestStreamDecoder(unittest.TestCase):
+
+    def setUp(self):
+        self._encoding = 'utf-8'
+
+    def test_coalesced_packets(self):
+        data = b''.join([
+            Packet('publish', qos=1, topic='a/b', message='msg%d' % i,
+                   message_id=i + 1).encode()
+            for i in range(20)])
+
+        decoder = StreamDecoder()
+        packets = list(decoder.feed(data))
+        self.assertEqual(len(packets), 20)
+        for i, p in enumerate(packets):
+            self.assertEqual(p.mtype, 'publish')
+            self.assertEqual(p.messageId, i + 1)
+            self.assertEqual(p.message, 'msg%d' % i)
+        self.assertEqual(len(decoder), 0)
+
+    def test_feed_before_exhausted(self):
+        frames = [Packet('puback', message_id=i).encode() for i in range(6)]
+        decoder = StreamDecoder()
+        first = decoder.feed(b''.join(frames[:3]))
+        ids = [next(first).messageId]
+        # drops the consumed prefix under the first generator
+        second = decoder.feed(b''.join(frames[3:]))
+        ids.extend(p.messageId for p in first)
+        ids.extend(p.messageId for p in second)
+        self.assertEqual(ids, list(range(6)))
+
+    def test_partial_reads(self):
+        msg = '这是一条测试消息。' * 100
+        data = Packet('publish', topic='a/b', message=msg).encode()
+        data += Packet('pingreq').encode()
+
+        decoder = StreamDecoder()
+        packets = []
+        for i in range(0, len(data), 7):
+            packets.extend(decoder.feed(data[i:i + 7]))
+        self.assertEqual([p.mtype for p in packets], ['publish', 'pingreq'])
+        self.assertEqual(packets[0].message, msg)
+        self.assertEqual(len(decoder), 0)
+
+    def test_incomplete_remain_length(self):
+        data = Packet('publish', topic='a/b', message='x' * 200).encode()
+
+        decoder = StreamDecoder()
+        self.assertEqual(list(decoder.feed(data[:2])), [])
+        self.assertEqual(len(decoder), 2)
+        packets = list(decoder.feed(data[2:]))
+        self.assertEqual(len(packets), 1)
+        self.assertEqual(packets[0].message, 'x' * 200)
+
+    def test_malformed_remain_length(self):
+        decoder = StreamDecoder()
+        with self.assertRaises(ValueError):
+            list(decoder.feed(bytearray([0b00110000, 0xFF, 0xFF, 0xFF, 0xFF,
+                                         0x01])))
+
+    def test_stream_large_publish(self):
+        body = bytes(range(256)) * 400
+        data = Packet('pingreq').encode()
+        data += b''.join(iter_publish('fw/image', io.BytesIO(body), qos=1,
+                                      message_id=5, chunk_size=1000))
+        data += Packet('publish', topic='small', message='x').encode()
+
+        decoder = StreamDecoder(stream_threshold=1024)
+        items = []
+        received = []
+        for i in range(0, len(data), 4096):
+            for item in decoder.feed(data[i:i + 4096]):
+                items.append(item)
+            for item in items:
+                if isinstance(item, PublishStream):
+                    received.extend(item)
+        self.assertEqual(len(items), 3)
+        self.assertEqual(items[0].mtype, 'pingreq')
+        stream = items[1]
+        self.assertEqual((stream.packet.topic, stream.packet.qos,
+                          stream.packet.messageId), ('fw/image', 1, 5))
+        self.assertEqual((stream.length, stream.received), (len(body),
+                                                            len(body)))
+        self.assertTrue(stream.done())
+        self.assertEqual(b''.join(received), body)
+        # the body never went through the frame buffer
+        self.assertTrue(max(len(chunk) for chunk in received) <= 4096)
+        self.assertEqual(items[2].message, 'x')
+        self.assertEqual(len(decoder), 0)
+
+    def test_stream_complete_frame(self):
+        data = Packet('publish', topic='a', message='y' * 2000).encode()
+        decoder = StreamDecoder(stream_threshold=1024)
+        stream, ping = decoder.feed(data + Packet('pingreq').encode())
+        self.assertTrue(stream.done())
+        self.assertEqual(b''.join(stream), b'y' * 2000)
+        self.assertEqual(ping.mtype, 'pingreq')
+        self.assertEqual(len(decoder), 0)
+
+    def test_iter_publish(self):
+        payload = '固件'.encode('utf-8') * 1000
+        expected = Packet('publish', qos=2, retain=True, topic='fw',
+                          payload=payload, message_id=9).encode()
+        for source, length in ((payload, None),
+                               (io.BytesIO(payload), None),
+                               ([payload[:100], payload[100:]],
+                                len(payload))):
+            self.assertEqual(b''.join(iter_publish(
+                'fw', source, length, qos=2, message_id=9, retain=True,
+                chunk_size=100)), expected)
+        with self.assertRaises(ValueError):
+            list(iter_publish('fw', [b'abc'], 2))
+        with self.assertRaises(ValueError):
+            list(iter_publish('fw', [b'abc'], 4))
+
+        # lengths known up front fail before the header is yielded
+        for source, length in ((b'abc', 4), (io.BytesIO(b'abc'), 4)):
+            chunks = iter_publish('fw', source, length)
+            self.assertRaises(ValueError, next, chunks)
@@ -0,0 +1,40 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt.packet import Packet
+from mqtt.template import PublishTemplate
+
+
+class TestPublishTemplate(unittest.TestCase):
+
+    def test_encode(self):
+        msg = '这是一条测试消息。' * 20
+        t = PublishTemplate('a/b', msg)
+
+        self.assertEqual(
+            t.encode(), Packet('publish', topic='a/b', message=msg).encode())
+        for qos in (1, 2):
+            for dup in (False, True):
+                p = Packet('publish', qos=qos, dup=dup, topic='a/b',
+                           message=msg, message_id=300)
+                self.assertEqual(t.encode(qos, 300, dup), p.encode())
+                self.assertEqual(
+                    t.header(qos, 300, dup) + t.payload, p.encode())
+
+    def test_retain_binary_payload(self):
+        payload = bytes(bytearray([0x08, 0x96, 0x01, 0xFF, 0xFE]))
+        t = PublishTemplate('a/b', payload=payload, retain=True)
+        p = Packet('publish', qos=1, retain=True, topic='a/b',
+                   payload=payload, message_id=7)
+        self.assertEqual(t.encode(1, 7), p.encode())
+        self.assertTrue(t.payload is payload)
+
+        p = Packet.fromData(t.encode(2, 65535), lazy=True)
+        self.assertEqual(p.qos, 2)
+        self.assertEqual(p.retain, True)
+        self.assertEqual(p.messageId, 65535)
+        self.assertEqual(bytes(p.payload), payload)
@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt.topic import CachedTopicTrie, TopicTrie, validate_filter
+
+
+class TestTopicTrie(unittest.TestCase):
+
+    def test_validate_filter(self):
+        for f in ('a/b', '+', '#', 'a/+/c', 'a/#', '/a', 'a//b', '+/+'):
+            validate_filter(f)
+        for f in ('', 'a/#/c', 'a+', 'a/b#', '#/a'):
+            self.assertRaises(ValueError, validate_filter, f)
+
+    def test_match(self):
+        trie = TopicTrie()
+        trie.insert('a/b/c', 'exact', 1)
+        trie.insert('a/+/c', 'single', 0)
+        trie.insert('a/#', 'multi', 2)
+        trie.insert('#', 'all', 0)
+        trie.insert('+/+/+', 'levels', 1)
+        trie.insert('a/b', 'other', 1)
+        self.assertEqual(len(trie), 6)
+
+        self.assertEqual(trie.match('a/b/c'), {
+            'exact': 1, 'single': 0, 'multi': 2, 'all': 0, 'levels': 1})
+        self.assertEqual(trie.match('a/x/c'), {
+            'single': 0, 'multi': 2, 'all': 0, 'levels': 1})
+        self.assertEqual(trie.match('a'), {'multi': 2, 'all': 0})
+        self.assertEqual(trie.match('a/b'), {
+            'multi': 2, 'all': 0, 'other': 1})
+        self.assertEqual(trie.match('b/b/c/d'), {'all': 0})
+        self.assertEqual(trie.match('a/b/c/d'), {'multi': 2, 'all': 0})
+
+    def test_max_qos_per_client(self):
+        trie = TopicTrie()
+        trie.insert('a/b', 'client', 0)
+        trie.insert('a/+', 'client', 2)
+        trie.insert('#', 'client', 1)
+        self.assertEqual(trie.match('a/b'), {'client': 2})
+
+        trie.insert('a/+', 'client', 0)
+        self.assertEqual(len(trie), 3)
+        self.assertEqual(trie.match('a/b'), {'client': 1})
+
+    def test_system_topics(self):
+        trie = TopicTrie()
+        trie.insert('#', 'all', 0)
+        trie.insert('+/broker', 'plus', 0)
+        trie.insert('$SYS/#', 'sys', 0)
+        self.assertEqual(trie.match('$SYS/broker'), {'sys': 0})
+        self.assertEqual(trie.match('a/broker'), {'all': 0, 'plus': 0})
+
+    def test_remove(self):
+        trie = TopicTrie()
+        trie.insert('a/+/c', 'x', 1)
+        trie.insert('a/+/c', 'y', 1)
+        trie.insert('a/b', 'x', 0)
+
+        self.assertFalse(trie.remove('a/+/d', 'x'))
+        self.assertFalse(trie.remove('a/+/c', 'z'))
+        self.assertTrue(trie.remove('a/+/c', 'x'))
+        self.assertEqual(trie.match('a/b/c'), {'y': 1})
+        self.assertTrue(trie.remove('a/+/c', 'y'))
+        self.assertEqual(trie.match('a/b/c'), {})
+        self.assertEqual(list(trie._root.children['a'].children), ['b'])
+        self.assertTrue(trie.remove('a/b', 'x'))
+        self.assertEqual(trie._root.children, {})
+        self.assertEqual(len(trie), 0)
+
+
+class TestCachedTopicTrie(unittest.TestCase):
+
+    def test_hits_and_evictions(self):
+        trie = CachedTopicTrie(maxsize=2)
+        trie.insert('a/+', 'x', 1)
+
+        self.assertEqual(trie.match('a/b'), {'x': 1})
+        self.assertEqual(trie.match('a/b'), {'x': 1})
+        self.assertEqual(trie.match('c'), {})
+        self.assertEqual(trie.match('c'), {})
+        self.assertEqual(trie.stats()['hits'], 2)
+        self.assertEqual(trie.stats()['misses'], 2)
+
+        trie.match('a/b')
+        trie.match('a/c')
+        stats = trie.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(list(trie._cache), ['a/b', 'a/c'])
+        self.assertEqual(list(trie._cachedTopics.children), ['a'])
+
+    def test_precise_invalidation(self):
+        trie = CachedTopicTrie()
+        trie.insert('a/+', 'x', 1)
+        for topic in ('a/b', 'a/c', 'a', 'a/b/c', 'd/b', '$SYS/b'):
+            trie.match(topic)
+
+        trie.insert('a/b', 'y', 0)
+        self.assertEqual(trie.invalidations, 1)
+        self.assertEqual(trie.match('a/b'), {'x': 1, 'y': 0})
+
+        trie.insert('+/b', 'z', 2)
+        self.assertEqual(trie.invalidations, 3)
+        self.assertEqual(trie.match('d/b'), {'z': 2})
+        self.assertEqual(trie.match('$SYS/b'), {})
+
+        trie.insert('a/#', 'w', 0)
+        self.assertEqual(trie.invalidations, 6)
+        self.assertEqual(trie.match('a'), {'w': 0})
+        self.assertEqual(trie.match('a/b/c'), {'w': 0})
+
+        hits = trie.hits
+        trie.match('d/b')
+        self.assertEqual(trie.hits, hits + 1)
+
+        self.assertTrue(trie.remove('a/+', 'x'))
+        self.assertEqual(trie.match('a/c'), {'w': 0})
+        self.assertFalse(trie.remove('a/+', 'x'))
+        self.assertEqual(trie.match('a/b'), {'y': 0, 'z': 2, 'w': 0})
+
+        trie.insert('#', 'all', 0)
+        self.assertEqual(trie.match('$SYS/b'), {})
+        self.assertEqual(trie.match('d/b'), {'z': 2, 'all': 0})
@@ -0,0 +1,22 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import sys
+sys.path.append("..")
+
+from mqtt.client import Client
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(asyncio.wait_for(coro, 10))
+    finally:
+        loop.close()
+
+
+async def connected(port, *args, **kwargs):
+    client = Client(*args, **kwargs)
+    await client.connect('127.0.0.1', port)
+    return client
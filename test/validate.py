@@ -0,0 +1,127 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+sys.path.append("..")
+
+from mqtt.packet import Packet
+from mqtt.stream import StreamDecoder
+from mqtt.validate import (FlagsError, MalformedPacketError, PacketTypeError,
+                           RemainingLengthError, StringError, validate_frame)
+
+
+def samples():
+    return [
+        Packet('connect', client_id='c', will_topic='w', will_message='bye',
+               will_qos=1, username='u', password='p'),
+        Packet('connack', return_code=2),
+        Packet('publish', topic='a/b', message='m'),
+        Packet('publish', qos=2, dup=True, retain=True, topic='a/b',
+               payload=b'\xff\x00', message_id=9),
+        Packet('puback', message_id=1),
+        Packet('pubrec', message_id=1),
+        Packet('pubrel', qos=1, message_id=1),
+        Packet('pubrel', qos=1, dup=True, message_id=1),
+        Packet('pubcomp', message_id=1),
+        Packet('subscribe', qos=1, message_id=2, topics=[('a/#', 1),
+                                                          ('b/+', 2)]),
+        Packet('suback', message_id=2, granted_qos=[0, 2, 0x80]),
+        Packet('unsubscribe', qos=1, message_id=3, topics=['a/#', 'b']),
+        Packet('unsuback', message_id=3),
+        Packet('pingreq'),
+        Packet('pingresp'),
+        Packet('disconnect'),
+    ]
+
+
+def publish_frame(topic_data, first_byte=0x30, tail=b'm'):
+    body = len(topic_data).to_bytes(2, 'big') + topic_data + tail
+    return bytes([first_byte, len(body)]) + body
+
+
+class TestValidation(unittest.TestCase):
+
+    def test_valid(self):
+        for packet in samples():
+            data = packet.encode()
+            validate_frame(data)
+            strict = Packet.fromDataStrict(data, lazy=True)
+            trusted = Packet.fromDataTrusted(data)
+            self.assertEqual(strict.encode(), data)
+            self.assertEqual(trusted.encode(), data)
+            self.assertEqual(type(trusted), type(packet))
+
+    def test_trusted_payload(self):
+        data = Packet('publish', qos=1, topic='a', message='é',
+                      message_id=4).encode()
+        packet = Packet.fromDataTrusted(data)
+        self.assertEqual(bytes(packet.payload), 'é'.encode('utf-8'))
+        self.assertEqual(packet.message, 'é')
+
+    def test_remaining_length(self):
+        data = Packet('puback', message_id=1).encode()
+        for frame in (data + b'\x00', data[:-1], data[:1],
+                      b'\x30\xff\xff\xff\xff\x01'):
+            self.assertRaises(RemainingLengthError, validate_frame, frame)
+
+    def test_flags(self):
+        self.assertRaises(PacketTypeError, validate_frame, b'\x00\x00')
+        self.assertRaises(PacketTypeError, validate_frame, b'\xf0\x00')
+        self.assertRaises(PacketTypeError, Packet.parseFirstByte, 0xF0)
+        # reserved types were a bare KeyError before
+        self.assertRaises(ValueError, Packet.fromData, b'\x00\x00')
+
+        self.assertRaises(FlagsError, validate_frame,
+                          publish_frame(b'a', 0x36))
+        self.assertRaises(FlagsError, validate_frame, b'\xc1\x00')
+        self.assertRaises(FlagsError, validate_frame, b'\x42\x02\x00\x01')
+        self.assertRaises(FlagsError, validate_frame, b'\x60\x02\x00\x01')
+        self.assertRaises(FlagsError, validate_frame, Packet(
+            'subscribe', qos=1, message_id=2, topics=[('a', 3)]).encode())
+
+        connect = bytearray(Packet('connect', client_id='c').encode())
+        flags = connect.index(b'\x00\x01c') - 3
+        for byte in (0x01, 0x18, 0x20, 0x40):
+            connect[flags] = byte
+            self.assertRaises(FlagsError, validate_frame, connect)
+
+    def test_strings(self):
+        self.assertRaises(StringError, validate_frame,
+                          publish_frame(b'a\xffb'))
+        self.assertRaises(StringError, validate_frame,
+                          publish_frame(b'a\x00b'))
+        data = bytearray(publish_frame(b'ab', tail=b''))
+        data[3] = 3
+        self.assertRaises(StringError, validate_frame, data)
+        self.assertRaises(StringError, validate_frame, b'\x30\x01\x00')
+
+        self.assertRaises(MalformedPacketError, validate_frame,
+                          publish_frame(b'a/+'))
+        self.assertRaises(MalformedPacketError, validate_frame,
+                          publish_frame(b''))
+        self.assertTrue(issubclass(StringError, MalformedPacketError))
+        self.assertTrue(issubclass(MalformedPacketError, ValueError))
+
+    def test_fields(self):
+        for frame in (b'\x40\x02\x00\x00',
+                      b'\x82\x02\x00\x01',
+                      b'\xa2\x02\x00\x01',
+                      b'\x20\x01\x00',
+                      b'\xc0\x01\x00',
+                      publish_frame(b'a', 0x32, b'\x00\x00')):
+            self.assertRaises(MalformedPacketError, validate_frame, frame)
+
+    def test_stream_decoder(self):
+        valid = Packet('puback', message_id=1).encode()
+        decoder = StreamDecoder(strict=True)
+        self.assertEqual(len(list(decoder.feed(valid))), 1)
+        with self.assertRaises(FlagsError):
+            list(decoder.feed(publish_frame(b'a', 0x36)))
+
+        decoder = StreamDecoder(strict=True, stream_threshold=16)
+        with self.assertRaises(StringError):
+            list(decoder.feed(publish_frame(b'\xff', tail=b'x' * 20)))
+        decoder = StreamDecoder(strict=True, stream_threshold=16)
+        stream, = decoder.feed(publish_frame(b'a/b', tail=b'x' * 20))
+        self.assertEqual(stream.packet.topic, 'a/b')